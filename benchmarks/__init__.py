@@ -0,0 +1,5 @@
+"""
+Microbenchmarks of the ccli hot paths, run against stubbed AWS responses.
+
+Run them with ``python -m benchmarks``, see ``python -m benchmarks --help``.
+"""
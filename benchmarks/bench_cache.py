@@ -0,0 +1,41 @@
+import os
+import tempfile
+
+from tinydb import TinyDB
+
+from ccli.aws.cache import ResourceCache
+from ccli.aws.permissions import PermissionCache
+
+from .runner import benchmark
+
+LOOKUPS = 1000
+
+
+def db():
+    return TinyDB(os.path.join(tempfile.mkdtemp(), 'db.json'))
+
+
+@benchmark('cache.resource_hit.1k', repeat=5)
+def resource_hit():
+    cache = ResourceCache(db())
+    subnets = [{'SubnetId': 'subnet-%d' % n, 'CidrBlock': '10.0.%d.0/24' % n}
+               for n in range(200)]
+    for kind in ('subnets', 'security_groups', 'key_pairs', 'availability_zones'):
+        cache.get(kind, lambda: subnets, region='ap-northeast-2')
+
+    def lookups():
+        for _ in range(LOOKUPS):
+            cache.get('subnets', list, region='ap-northeast-2')
+    return lookups
+
+
+@benchmark('cache.permission_hit.1k', repeat=5)
+def permission_hit():
+    verdicts = PermissionCache()
+    verdicts.bind(db())
+    verdicts.set('stop_instances:ap-northeast-2:bench', True)
+
+    def lookups():
+        for _ in range(LOOKUPS):
+            verdicts.get('stop_instances:ap-northeast-2:bench')
+    return lookups
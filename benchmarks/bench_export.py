@@ -0,0 +1,52 @@
+import json
+import os
+import tempfile
+
+from ccli.aws.ec2 import datetime_to_str
+from ccli.aws.export import export_ndjson
+from ccli.aws.fields import compile_fields
+
+from .runner import benchmark
+from .stubs import instance
+
+RECORDS = 10000
+
+
+def records():
+    return [instance(n) for n in range(RECORDS)]
+
+
+@benchmark('export.json_dump.10k', repeat=5)
+def json_dump():
+    data = {'Reservations': [{'Instances': records()}]}
+    path = os.path.join(tempfile.mkdtemp(), 'instances.json')
+
+    def dump():
+        with open(path, 'w') as fp:
+            json.dump(data, fp, default=datetime_to_str, indent=4)
+    return dump
+
+
+@benchmark('export.ndjson.10k', repeat=5)
+def ndjson():
+    data = records()
+    path = os.path.join(tempfile.mkdtemp(), 'instances.ndjson')
+
+    return lambda: export_ndjson(data, path)
+
+
+@benchmark('export.ndjson_gzip.10k', repeat=5)
+def ndjson_gzip():
+    data = records()
+    path = os.path.join(tempfile.mkdtemp(), 'instances.ndjson.gz')
+
+    return lambda: export_ndjson(data, path)
+
+
+@benchmark('export.ndjson_fields.10k', repeat=5)
+def ndjson_fields():
+    data = records()
+    fields = compile_fields('id,state,private_ip')
+    path = os.path.join(tempfile.mkdtemp(), 'instances.ndjson')
+
+    return lambda: export_ndjson(fields.select(data), path)
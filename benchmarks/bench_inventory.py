@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+from ccli.aws.ec2 import iter_instances
+from ccli.aws.inventory import InventoryStore
+
+from .runner import benchmark
+from .stubs import describe_instances_pages, instance, stubbed_client
+
+
+def parse(count, repeat):
+    @benchmark('inventory.parse.%dk' % (count // 1000), repeat=repeat)
+    def factory():
+        client = stubbed_client(describe_instances_pages(count))
+
+        def consume():
+            n = sum(1 for _ in iter_instances(client))
+            assert n == count, n
+        return consume
+
+
+parse(1000, 5)
+parse(10000, 3)
+parse(100000, 1)
+
+
+@benchmark('inventory.sync.10k', repeat=3)
+def sync():
+    instances = [instance(n) for n in range(10000)]
+
+    def run():
+        store = InventoryStore(os.path.join(tempfile.mkdtemp(), 'inventory.db'))
+        store.sync('ap-northeast-2', instances)
+        store.close()
+    return run
+
+
+@benchmark('inventory.sync_unchanged.10k', repeat=3)
+def sync_unchanged():
+    instances = [instance(n) for n in range(10000)]
+    store = InventoryStore(os.path.join(tempfile.mkdtemp(), 'inventory.db'))
+    store.sync('ap-northeast-2', instances)
+
+    return lambda: store.sync('ap-northeast-2', instances)
+
+
+@benchmark('inventory.query.10k', repeat=10)
+def query():
+    store = InventoryStore(os.path.join(tempfile.mkdtemp(), 'inventory.db'))
+    store.sync('ap-northeast-2', [instance(n) for n in range(10000)])
+
+    return lambda: store.query(state='running', tags={'env': 'prod'})
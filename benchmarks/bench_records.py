@@ -0,0 +1,23 @@
+from ccli.aws.records import Index, Instance
+
+from .runner import benchmark
+from .stubs import instance
+
+
+@benchmark('records.from_api.10k', repeat=5)
+def from_api():
+    instances = [instance(n) for n in range(10000)]
+
+    return lambda: Index(Instance.from_api(data) for data in instances)
+
+
+@benchmark('records.index.lookup.10k', repeat=5)
+def lookup():
+    index = Index(Instance.from_api(instance(n)) for n in range(10000))
+    ids = [instance(n)['InstanceId'] for n in range(0, 10000, 7)]
+
+    def run():
+        for _ in range(10):
+            for instance_id in ids:
+                index[instance_id]
+    return run
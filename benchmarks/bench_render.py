@@ -0,0 +1,19 @@
+import os
+
+from jinja2 import Environment, FileSystemLoader
+
+from .runner import benchmark
+
+TEMPLATES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         'ccli', 'templates')
+
+
+@benchmark('render.list_template.1k', repeat=10)
+def list_template():
+    env = Environment(loader=FileSystemLoader(TEMPLATES))
+    template = env.get_template('aws/list_template.jinja2')
+    data = {'LaunchTemplates': [{'LaunchTemplateName': 'template-%d' % n,
+                                 'LaunchTemplateId': 'lt-%017x' % n}
+                                for n in range(1000)]}
+
+    return lambda: template.render(**data)
@@ -0,0 +1,45 @@
+from ccli.aws.launch import Subnet, plan
+from ccli.aws.ratelimit import TokenBucket
+from ccli.aws.where import compile_where
+
+from .runner import benchmark
+from .stubs import instance
+
+
+@benchmark('select.where.10k', repeat=5)
+def where():
+    instances = [instance(n) for n in range(10000)]
+    selection = compile_where("tag:env=prod and state=running and type in (t2.micro, t2.large)"
+                              " and not tag:Name='bench-1*'")
+
+    return lambda: sum(1 for _ in selection.select(instances, pushed=False))
+
+
+@benchmark('select.compile_where.1k', repeat=5)
+def compile():
+    expression = "(tag:env=prod or tag:env=stage) and state!=terminated and az in (a, b, c)"
+
+    def run():
+        for _ in range(1000):
+            compile_where(expression)
+    return run
+
+
+@benchmark('launch.plan.200x64', repeat=5)
+def launch_plan():
+    subnets = [Subnet('subnet-%d' % n, 'az-%d' % (n % 4), 'vpc-1', 50 + n * 7, False)
+               for n in range(64)]
+
+    def run():
+        for _ in range(1000):
+            plan(200, subnets)
+    return run
+
+
+@benchmark('ratelimit.acquire.10k', repeat=5)
+def acquire():
+    def run():
+        bucket = TokenBucket(rate=1e9, burst=10000)
+        for _ in range(10000):
+            bucket.acquire()
+    return run
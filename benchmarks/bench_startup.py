@@ -0,0 +1,53 @@
+import copy
+import os
+import subprocess
+import sys
+import tempfile
+
+from .runner import benchmark
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def python(code, *args):
+    # run elsewhere, so the db.json of the app does not land in the tree
+    cwd = tempfile.mkdtemp()
+    env = dict(os.environ, PYTHONPATH=ROOT)
+
+    def call():
+        done = subprocess.run([sys.executable, '-c', code] + list(args), cwd=cwd, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if done.returncode != 0:
+            lines = done.stderr.decode().strip().splitlines() or ['exit %d' % done.returncode]
+            raise RuntimeError(lines[-1])
+    return call
+
+
+@benchmark('startup.interpreter', repeat=10)
+def interpreter():
+    return python('pass')
+
+
+@benchmark('startup.import_main', repeat=10)
+def import_main():
+    return python('import ccli.main')
+
+
+@benchmark('startup.help', repeat=10)
+def help():
+    return python('import sys; from ccli.main import main; sys.argv[1:] = ["--help"]; main()')
+
+
+@benchmark('startup.app_setup', repeat=10)
+def app_setup():
+    from ccli.main import CONFIG, CcliTest
+
+    config = copy.deepcopy(CONFIG)
+    config['ccli']['db_file'] = os.path.join(tempfile.mkdtemp(), 'db.json')
+
+    def setup():
+        # extend_tinydb and the other post_setup hooks included
+        app = CcliTest(argv=[], config_defaults=config)
+        app.setup()
+        app.close()
+    return setup
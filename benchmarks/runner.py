@@ -0,0 +1,165 @@
+import argparse
+import glob
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from collections import namedtuple
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# modules registering benchmarks, imported by the runner
+MODULES = (
+    'benchmarks.bench_startup',
+    'benchmarks.bench_inventory',
+    'benchmarks.bench_export',
+    'benchmarks.bench_render',
+    'benchmarks.bench_cache',
+    'benchmarks.bench_select',
+    'benchmarks.bench_records',
+)
+
+# a median this much slower than the baseline is reported as a regression
+THRESHOLD = 0.10
+
+Benchmark = namedtuple('Benchmark', ['name', 'factory', 'repeat'])
+
+BENCHMARKS = []
+
+
+def benchmark(name, repeat=5):
+    """
+    Registers a benchmark.
+
+    The decorated function does the setup and returns the callable to time,
+    which is run ``repeat`` times.
+    """
+    def register(factory):
+        BENCHMARKS.append(Benchmark(name, factory, repeat))
+        return factory
+    return register
+
+
+def run(bench, repeat=None):
+    """
+    Times ``bench``.
+
+    :return: dict with ``min``, ``median`` and ``runs`` in seconds, or
+             ``error`` when the setup or a run failed
+    """
+    try:
+        timed = bench.factory()
+        runs = []
+        for _ in range(repeat or bench.repeat):
+            started = time.perf_counter()
+            timed()
+            runs.append(time.perf_counter() - started)
+    except Exception as e:
+        return {'error': '%s: %s' % (type(e).__name__, e)}
+
+    return {'min': min(runs), 'median': statistics.median(runs), 'runs': runs}
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(results, directory=RESULTS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(path, 'w') as fp:
+        json.dump({'created': time.time(),
+                   'commit': _commit(),
+                   'python': platform.python_version(),
+                   'results': results}, fp, indent=2)
+    return path
+
+
+def latest(directory=RESULTS_DIR):
+    paths = sorted(glob.glob(os.path.join(directory, '*.json')))
+    return paths[-1] if paths else None
+
+
+def _format(seconds):
+    if seconds is None:
+        return '-'
+    if seconds < 1e-3:
+        return '%.1f us' % (seconds * 1e6)
+    if seconds < 1:
+        return '%.2f ms' % (seconds * 1e3)
+    return '%.2f s' % seconds
+
+
+def report(results, baseline=None, threshold=THRESHOLD):
+    """
+    Prints a table of ``results`` next to ``baseline``.
+
+    :return: names of the benchmarks that regressed
+    """
+    baseline = baseline or {}
+    regressions = []
+    width = max([len(name) for name in results] + [9])
+
+    print('%-*s  %12s  %12s  %8s' % (width, 'benchmark', 'median', 'baseline', 'change'))
+    for name, result in results.items():
+        if 'error' in result:
+            print('%-*s  %s' % (width, name, result['error']))
+            continue
+
+        before = baseline.get(name, {}).get('median')
+        change = ''
+        if before:
+            ratio = result['median'] / before - 1
+            change = '%+.1f%%' % (ratio * 100)
+            if ratio > threshold:
+                change += ' !'
+                regressions.append(name)
+
+        print('%-*s  %12s  %12s  %8s' % (width, name, _format(result['median']),
+                                         _format(before), change))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Runs the ccli microbenchmarks.')
+    parser.add_argument('-k', '--filter', help='only run benchmarks whose name contains this')
+    parser.add_argument('-r', '--repeat', type=int, help='runs per benchmark')
+    parser.add_argument('--compare', help='results file to compare with, default: the latest')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='slowdown reported as a regression, default: %(default)s')
+    parser.add_argument('--no-save', action='store_true', help='do not store the results')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='exit with 1 when a benchmark regressed')
+    args = parser.parse_args(argv)
+
+    for module in MODULES:
+        importlib.import_module(module)
+
+    baseline_path = args.compare or latest()
+    baseline = {}
+    if baseline_path:
+        with open(baseline_path) as fp:
+            baseline = json.load(fp)['results']
+
+    results = {}
+    for bench in BENCHMARKS:
+        if args.filter and args.filter not in bench.name:
+            continue
+        results[bench.name] = run(bench, args.repeat)
+
+    regressions = report(results, baseline, args.threshold)
+    if baseline_path:
+        print('\ncompared with %s' % baseline_path)
+    if not args.no_save:
+        print('saved to %s' % save(results))
+
+    return 1 if regressions and args.fail_on_regression else 0
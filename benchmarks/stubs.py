@@ -0,0 +1,110 @@
+"""
+Canned EC2 responses served at the HTTP layer, so botocore still signs,
+sends, parses and paginates as it would against the real API.
+"""
+from urllib.parse import parse_qs
+from xml.sax.saxutils import escape
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+REGION = 'ap-northeast-2'
+
+NAMESPACE = 'http://ec2.amazonaws.com/doc/2016-11-15/'
+
+INSTANCE_XML = """<item>
+<instanceId>{id}</instanceId><imageId>ami-018a9a930060d38aa</imageId>
+<instanceState><code>16</code><name>{state}</name></instanceState>
+<privateDnsName>ip-10-0-{a}-{b}.ec2.internal</privateDnsName><dnsName></dnsName>
+<keyName>bench</keyName><amiLaunchIndex>0</amiLaunchIndex>
+<instanceType>{type}</instanceType><launchTime>2020-01-01T00:00:00.000Z</launchTime>
+<placement><availabilityZone>{az}</availabilityZone><tenancy>default</tenancy></placement>
+<monitoring><state>disabled</state></monitoring>
+<subnetId>subnet-{subnet}</subnetId><vpcId>vpc-bench</vpcId>
+<privateIpAddress>10.0.{a}.{b}</privateIpAddress>
+<architecture>x86_64</architecture><rootDeviceType>ebs</rootDeviceType>
+<tagSet><item><key>env</key><value>{env}</value></item>
+<item><key>Name</key><value>{name}</value></item></tagSet>
+</item>"""
+
+STATES = ('running', 'stopped', 'pending')
+TYPES = ('t2.micro', 't2.small', 't2.large')
+AZS = ('ap-northeast-2a', 'ap-northeast-2b', 'ap-northeast-2c')
+
+
+def instance_fields(n):
+    return {'id': 'i-%017x' % n,
+            'state': STATES[n % len(STATES)],
+            'type': TYPES[n % len(TYPES)],
+            'az': AZS[n % len(AZS)],
+            'subnet': n % 8,
+            'a': (n >> 8) & 255,
+            'b': n & 255,
+            'env': 'prod' if n % 4 else 'dev',
+            'name': escape('bench-%d' % n)}
+
+
+def instance(n):
+    """
+    Returns instance ``n`` as ``describe_instances`` parses it, in short.
+    """
+    f = instance_fields(n)
+    return {'InstanceId': f['id'],
+            'ImageId': 'ami-018a9a930060d38aa',
+            'State': {'Code': 16, 'Name': f['state']},
+            'InstanceType': f['type'],
+            'Placement': {'AvailabilityZone': f['az'], 'Tenancy': 'default'},
+            'SubnetId': 'subnet-%s' % f['subnet'],
+            'VpcId': 'vpc-bench',
+            'PrivateIpAddress': '10.0.%d.%d' % (f['a'], f['b']),
+            'KeyName': 'bench',
+            'Tags': [{'Key': 'env', 'Value': f['env']}, {'Key': 'Name', 'Value': f['name']}]}
+
+
+def describe_instances_pages(count, page_size=1000):
+    """
+    Renders ``count`` instances as ``DescribeInstances`` XML pages.
+
+    :return: dict of NextToken (``None`` for the first page) to body bytes
+    """
+    pages = {}
+    for start in range(0, max(count, 1), page_size):
+        token = None if start == 0 else 'page-%d' % start
+        following = start + page_size
+        items = ''.join(INSTANCE_XML.format(**instance_fields(n))
+                        for n in range(start, min(following, count)))
+        next_token = '<nextToken>page-%d</nextToken>' % following if following < count else ''
+        pages[token] = ('<DescribeInstancesResponse xmlns="%s">'
+                        '<requestId>bench</requestId><reservationSet><item>'
+                        '<reservationId>r-bench</reservationId><ownerId>0</ownerId>'
+                        '<instancesSet>%s</instancesSet></item></reservationSet>%s'
+                        '</DescribeInstancesResponse>'
+                        % (NAMESPACE, items, next_token)).encode()
+
+    return pages
+
+
+class RawBody:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+def stubbed_client(pages):
+    """
+    Returns an EC2 client answering ``DescribeInstances`` from ``pages``.
+    """
+    client = boto3.client('ec2', region_name=REGION,
+                          aws_access_key_id='bench', aws_secret_access_key='bench')
+
+    def send(request, **kwargs):
+        params = parse_qs(request.body.decode() if isinstance(request.body, bytes)
+                          else request.body or '')
+        token = params.get('NextToken', [None])[0]
+        return AWSResponse(request.url, 200, {}, RawBody(pages[token]))
+
+    client.meta.events.register('before-send.ec2.DescribeInstances', send)
+
+    return client
@@ -0,0 +1,148 @@
+"""
+Provider neutral compute listings on libcloud drivers.
+
+Every (provider, region) pair is listed by its own worker and the records
+are merged as they arrive, so listing several clouds takes as long as the
+slowest of them rather than the sum.
+"""
+import threading
+from collections import namedtuple
+
+from ..core.exc import ccliError
+from ..core.fanout import MAX_WORKERS, merge
+
+KINDS = ('nodes', 'sizes', 'images')
+
+# arguments of the list calls per (provider, kind); EC2 would otherwise
+# list every public AMI of the region
+LIST_KWARGS = {
+    ('ec2', 'images'): {'ex_owner': 'self'},
+}
+
+# configuration keys that are not driver arguments
+TARGET_KEYS = ('name', 'provider', 'key', 'secret', 'region', 'regions')
+
+Target = namedtuple('Target', ['name', 'provider', 'region', 'args', 'kwargs'])
+
+Node = namedtuple('Node', ['provider', 'region', 'id', 'name', 'state', 'size', 'image',
+                           'public_ips', 'private_ips'])
+Size = namedtuple('Size', ['provider', 'region', 'id', 'name', 'ram', 'disk', 'price'])
+Image = namedtuple('Image', ['provider', 'region', 'id', 'name'])
+TargetResult = namedtuple('TargetResult', ['target', 'value', 'error'])
+
+_lock = threading.Lock()
+_drivers = {}
+
+
+def targets(providers):
+    """
+    Expands the configured providers into one target per region.
+
+    :param providers: list of dicts with ``provider``, ``key``, ``secret``,
+                      ``regions`` (or ``region``), an optional ``name`` and
+                      any other driver argument; without a region the
+                      driver picks its default one
+    :return: list of ``Target``
+    """
+    result = []
+    for entry in providers:
+        if not entry.get('provider'):
+            raise ccliError('compute provider without a "provider" name: %s' % entry)
+
+        provider = entry['provider'].lower()
+        args = tuple(entry[k] for k in ('key', 'secret') if entry.get(k) is not None)
+        kwargs = {k: v for k, v in entry.items() if k not in TARGET_KEYS}
+        regions = entry.get('regions') or [entry.get('region')]
+
+        for region in regions:
+            result.append(Target(entry.get('name') or provider, provider, region,
+                                 args, tuple(sorted(kwargs.items()))))
+
+    return result
+
+
+def get_driver(target):
+    """
+    Returns the libcloud driver of ``target``, creating it on first use.
+    """
+    driver = _drivers.get(target)
+    if driver is None:
+        with _lock:
+            driver = _drivers.get(target)
+            if driver is None:
+                from libcloud.compute.providers import get_driver as driver_class
+
+                try:
+                    cls = driver_class(target.provider)
+                except AttributeError:
+                    raise ccliError('unknown compute provider: %s' % target.provider)
+
+                kwargs = dict(target.kwargs)
+                if target.region is not None:
+                    kwargs['region'] = target.region
+                driver = _drivers[target] = cls(*target.args, **kwargs)
+
+    return driver
+
+
+def reset():
+    """
+    Drops every driver created so far.
+    """
+    with _lock:
+        _drivers.clear()
+
+
+def _state(state):
+    return getattr(state, 'value', state)
+
+
+def node_record(target, node):
+    extra = node.extra or {}
+    size = node.size.id if node.size is not None else extra.get('instance_type')
+    image = node.image.id if node.image is not None else extra.get('image_id')
+
+    return Node(target.name, target.region, node.id or node.name, node.name,
+                _state(node.state), size, image,
+                list(node.public_ips or []), list(node.private_ips or []))
+
+
+def size_record(target, size):
+    return Size(target.name, target.region, size.id, size.name, size.ram, size.disk, size.price)
+
+
+def image_record(target, image):
+    return Image(target.name, target.region, image.id, image.name)
+
+
+NORMALIZE = {
+    'nodes': node_record,
+    'sizes': size_record,
+    'images': image_record,
+}
+
+
+def list_resources(kind, targets, max_workers=MAX_WORKERS):
+    """
+    Lists ``kind`` on every target at once.
+
+    A failing target does not stop the others, it yields a single result
+    carrying the exception instead.
+
+    :param kind: one of ``KINDS``
+    :param targets: list of ``Target``
+    :param max_workers: upper bound of targets listed at the same time
+    :return: generator of ``TargetResult`` whose ``value`` is a ``Node``,
+             ``Size`` or ``Image``
+    """
+    if kind not in KINDS:
+        raise ccliError('unknown compute resource: %s' % kind)
+    normalize = NORMALIZE[kind]
+
+    def run(target):
+        driver = get_driver(target)
+        items = getattr(driver, 'list_' + kind)(**LIST_KWARGS.get((target.provider, kind), {}))
+
+        return (normalize(target, item) for item in items)
+
+    return merge(run, targets, max_workers, result=TargetResult)
@@ -0,0 +1,72 @@
+import time
+
+from tinydb import Query
+
+from ..core.db import db_lock
+from . import client
+
+# seconds a cached resource list stays valid, per resource type
+DEFAULT_TTLS = {
+    'security_groups': 3600,
+    'subnets': 3600,
+    'availability_zones': 86400,
+    'key_pairs': 600,
+    'key_pair_digests': 600,
+    'launch_templates': 300,
+    'topology': 300,
+}
+
+
+class ResourceCache:
+    """
+    Caches resource lists, e.g. the choices of the interactive prompts, in a
+    TinyDB table with a time to live per resource type.
+
+    Values have to be JSON serializable, so loaders should return only the
+    fields that are used. Loaders run outside of the lock, so several kinds
+    can be loaded at once from different threads. The table is only touched
+    under the lock of its database, see ``ccli.core.db``.
+    """
+
+    def __init__(self, db, ttls=None, table='resource_cache'):
+        self.table = db.table(table)
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._lock = db_lock(db)
+
+    @staticmethod
+    def _key(kind, region=None):
+        return '%s:%s' % (kind, region or client.default_region())
+
+    def get(self, kind, loader, region=None, refresh=False):
+        """
+        Returns the cached value of ``kind``, calling ``loader`` when there is
+        none, it is older than its TTL or ``refresh`` is set.
+
+        :param kind: resource type, e.g. ``subnets``
+        :param loader: callable returning the fresh value
+        :param region: region of the resource, defaults to the configured one
+        :param refresh: ignore the cached value
+        :return: cached or freshly loaded value
+        """
+        key = self._key(kind, region)
+        now = time.time()
+
+        if not refresh:
+            with self._lock:
+                entry = self.table.get(Query().key == key)
+            if entry is not None and now - entry['cached_at'] < self.ttls.get(kind, 0):
+                return entry['value']
+
+        value = loader()
+        with self._lock:
+            self.table.upsert({'key': key, 'cached_at': now, 'value': value},
+                              Query().key == key)
+
+        return value
+
+    def invalidate(self, kind, region=None):
+        """
+        Drops the cached value of ``kind``, e.g. after it has been changed.
+        """
+        with self._lock:
+            self.table.remove(Query().key == self._key(kind, region))
@@ -0,0 +1,178 @@
+import threading
+
+from ..core import profiler
+
+DEFAULT_REGION = 'ap-northeast-2'
+
+# every client keeps this many keep-alive connections to its endpoint, it
+# follows the worker count so parallel calls never wait for or drop one
+MAX_POOL_CONNECTIONS = 16
+
+_lock = threading.RLock()
+_sessions = {}
+_clients = {}
+_defaults = {'region': DEFAULT_REGION, 'profile': None}
+_transport = {'max_pool_connections': MAX_POOL_CONNECTIONS, 'tcp_keepalive': True}
+_client_hooks = {}
+
+
+def configure(region=None, profile=None, max_pool_connections=None, tcp_keepalive=None):
+    """
+    Sets the region and profile used when a caller does not ask for one,
+    and the transport every client is created with.
+
+    Nothing is created here, so it is safe to call during app setup.
+
+    :param max_pool_connections: keep-alive connections per client, set it
+                                 to the number of workers calling in parallel
+    :param tcp_keepalive: send TCP keep-alive probes on idle connections
+    """
+    if region:
+        _defaults['region'] = region
+    if profile:
+        _defaults['profile'] = profile
+
+    transport = dict(_transport)
+    if max_pool_connections:
+        transport['max_pool_connections'] = max(1, int(max_pool_connections))
+    if tcp_keepalive is not None:
+        transport['tcp_keepalive'] = bool(tcp_keepalive)
+    if transport != _transport:
+        with _lock:
+            _transport.update(transport)
+            # clients created with the previous transport are recreated
+            _clients.clear()
+
+
+def register_client_hook(hook, name=None):
+    """
+    Calls ``hook(client)`` for every client the registry has created and
+    will create. Registering a name again replaces the previous hook.
+    """
+    with _lock:
+        _client_hooks[name or hook] = hook
+        clients = list(_clients.values())
+
+    for client in clients:
+        hook(client)
+
+
+def default_region():
+    return _defaults['region']
+
+
+def get_session(profile=None):
+    """
+    Returns the boto3 session of ``profile``, creating it on first use.
+
+    All clients of a profile share one session, so credentials and endpoint
+    data are resolved and loaded once per process.
+    """
+    profile = profile or _defaults['profile']
+    session = _sessions.get(profile)
+    if session is None:
+        with _lock:
+            session = _sessions.get(profile)
+            if session is None:
+                import boto3.session
+
+                session = boto3.session.Session(profile_name=profile)
+                _sessions[profile] = session
+
+    return session
+
+
+def _config():
+    from botocore.config import Config
+
+    return Config(**_transport)
+
+
+def get_client(service='ec2', region=None, profile=None):
+    """
+    Returns the client for (service, region, profile), creating it on first use.
+
+    :param service: AWS service name
+    :param region: region name, defaults to the configured region
+    :param profile: profile name, defaults to the configured profile
+    :return: botocore client
+    """
+    key = (service, region or _defaults['region'], profile or _defaults['profile'])
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                # credentials and endpoint data are resolved here
+                with profiler.phase('client %s %s' % key[:2]):
+                    client = get_session(key[2]).client(service, region_name=key[1],
+                                                        config=_config())
+                for hook in _client_hooks.values():
+                    hook(client)
+                _clients[key] = client
+
+    return client
+
+
+def _pools(client):
+    session = client._endpoint.http_session
+    managers = [getattr(session, '_manager', None)]
+    managers.extend(getattr(session, '_proxy_managers', {}).values())
+    for manager in managers:
+        if manager is not None:
+            for key in manager.pools.keys():
+                pool = manager.pools.get(key)
+                if pool is not None:
+                    yield pool
+
+
+def transport_stats():
+    """
+    Counts the HTTP requests of every client and the connections they opened.
+
+    A request either reuses a keep-alive connection or opens a new one,
+    which costs a TLS handshake on https endpoints.
+
+    :return: dict of ``requests``, ``connections``, ``reused`` and ``handshakes``
+    """
+    with _lock:
+        clients = list(_clients.values())
+
+    stats = {'requests': 0, 'connections': 0, 'reused': 0, 'handshakes': 0}
+    for client in clients:
+        for pool in _pools(client):
+            stats['requests'] += pool.num_requests
+            stats['connections'] += pool.num_connections
+            if pool.scheme == 'https':
+                stats['handshakes'] += pool.num_connections
+    stats['reused'] = max(0, stats['requests'] - stats['connections'])
+
+    return stats
+
+
+def reset():
+    """
+    Drops every session and client of the registry.
+    """
+    with _lock:
+        _clients.clear()
+        _sessions.clear()
+
+
+class LazyClient:
+    """
+    Stands in for a client that is only looked up in the registry when one of
+    its methods is used.
+    """
+
+    def __init__(self, service='ec2', region=None, profile=None):
+        self.service = service
+        self.region = region
+        self.profile = profile
+
+    @property
+    def client(self):
+        return get_client(self.service, self.region, self.profile)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
@@ -1,10 +1,17 @@
 import datetime
 import json
 
-import boto3
 from botocore.exceptions import ClientError
 
-ec2 = boto3.client('ec2', region_name='ap-northeast-2')
+from ..core.exc import PermissionDenied
+from .client import LazyClient, default_region
+from .export import export_ndjson, json_default
+from .launch import launch, pipeline
+from .permissions import checked_call
+from .records import Instance
+from .waiter import MAX_IDS_PER_CALL, get_engine
+
+ec2 = LazyClient('ec2')
 
 INSTANCE_TYPES = ['t2.nano',
                   't2.micro',
@@ -38,26 +45,66 @@ REGIONS = [
     'cn-north-1',
 ]
 
+# MaxResults for paginated describe calls
+PAGE_SIZE = 1000
+
+# progress and target state of every lifecycle action
+TRANSITIONS = {
+    'start_instances': ('starting', 'running'),
+    'stop_instances': ('stopping', 'stopped'),
+    'reboot_instances': ('rebooting', 'status_ok'),
+    'terminate_instances': ('terminating', 'terminated'),
+}
+
 
 def datetime_to_str(data):
     if isinstance(data, datetime.datetime):
         return data.__str__()
 
 
-def get_all_instance():
-    all_instances = ec2.describe_instances()
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def print_state(instance_id, state):
+    print("Instance ", instance_id, ": ", state)
+
 
-    instanceId_list = []
-    for reservation in all_instances["Reservations"]:
-        instance_id = reservation.get('Instances')[0].get('InstanceId')
-        instanceId_list.append(instance_id)
+def iter_instances(client=None, page_size=PAGE_SIZE, **kwargs):
+    """
+    Iterates every instance of every reservation, one page at a time.
 
-    return instanceId_list
+    Pages are requested with ``MaxResults`` and followed through ``NextToken``,
+    so instances are yielded as soon as their page arrives and only a single
+    page is held in memory.
+
+    :param client: EC2 client to use, defaults to the module client
+    :param page_size: ``MaxResults`` per ``describe_instances`` call (5-1000)
+    :param kwargs: extra ``describe_instances`` parameters, e.g. ``Filters``
+    :return: generator of instance dicts
+    """
+    client = client or ec2
+    paginator = client.get_paginator('describe_instances')
+    pages = paginator.paginate(PaginationConfig={'PageSize': page_size}, **kwargs)
+
+    for page in pages:
+        for reservation in page.get('Reservations', []):
+            for instance in reservation.get('Instances', []):
+                yield instance
+
+
+def get_all_instance(client=None, page_size=PAGE_SIZE):
+    return [instance['InstanceId'] for instance in iter_instances(client, page_size)]
 
 
 class EC2Operation:
-    def __init__(self):
+    def __init__(self, page_size=PAGE_SIZE, region=None, engine=None):
         self._instance_ids = ''
+        self.page_size = page_size
+        self.region = region
+        self.client = LazyClient('ec2', region)
+        self.engine = engine or get_engine()
 
     @property
     def instance_ids(self):
@@ -67,114 +114,206 @@ class EC2Operation:
     def instance_ids(self, instance_ids):
         self._instance_ids = instance_ids
 
-    def start_instances(self):
+    def _ids(self, instance_ids=None):
+        if instance_ids is None:
+            instance_ids = self._instance_ids
+        if isinstance(instance_ids, str):
+            return [instance_ids]
+
+        return list(instance_ids)
+
+    def _change_state(self, action, instance_ids=None, wait=True):
         """
-        Starts an Amazon EBS-backed instance that you've previously stopped.
+        Calls ``action`` for any number of instances, one call per chunk of
+        ``MAX_IDS_PER_CALL`` IDs, and hands them to the waiter engine.
+
+        Without ``wait`` it returns as soon as the calls are made, the engine
+        keeps reporting the instances in the background.
 
-        :return:
+        :param action: key of ``TRANSITIONS``
+        :param instance_ids: instance IDs, defaults to ``instance_ids``
+        :param wait: wait until every instance reached its target state
+        :return: IDs the action was accepted for
         """
-        try:
-            ec2.start_instances(InstanceIds=[self._instance_ids], DryRun=True)
-        except ClientError as e:
-            if 'DryRunOperation' not in str(e):
+        ids = self._ids(instance_ids)
+        if not ids:
+            return []
+
+        progress, target = TRANSITIONS[action]
+
+        # the first call doubles as the permission check, see checked_call
+        accepted = []
+        for chunk in chunks(ids, MAX_IDS_PER_CALL):
+            try:
+                checked_call(self.client, action, InstanceIds=chunk)
+            except PermissionDenied as e:
+                print(e)
                 raise
+            except ClientError as e:
+                print('Error', e)
+                continue
 
-        # Dry run succeeded, run start_instances without dryrun
-        try:
-            ec2.start_instances(InstanceIds=[self._instance_ids], DryRun=False)
-            print("Instance ", self._instance_ids, ": starting\n")
-            waiter = ec2.get_waiter('instance_running')
-            waiter.wait(InstanceIds=[self._instance_ids])
-            print("Instance ", self._instance_ids, ": running\n")
-        except ClientError as e:
-            print(e)
+            for instance_id in chunk:
+                print_state(instance_id, progress)
+            accepted.extend(chunk)
+
+        transitions = self.engine.track(self.client, accepted, target, on_change=print_state)
+        if wait:
+            for transition in self.engine.wait(transitions):
+                print("Instance ", transition.instance_id, ": still not ", target)
+
+        return accepted
 
-    def stop_instances(self):
+    def start_instances(self, instance_ids=None, wait=True):
         """
-        Stops an Amazon EBS-backed instance.
-        :return:
+        Starts Amazon EBS-backed instances that you've previously stopped.
+
+        :param instance_ids: instance IDs, defaults to ``instance_ids``
+        :param wait: wait until the instances are running
+        :return: IDs of the starting instances
         """
-        # Do a dryrun first to verify permissions
-        try:
-            ec2.stop_instances(InstanceIds=[self._instance_ids], DryRun=True)
-        except ClientError as e:
-            if 'DryRunOperation' not in str(e):
-                raise
+        return self._change_state('start_instances', instance_ids, wait)
 
-        # Dry run succeeded, call stop_instances without dryrun
-        try:
-            ec2.stop_instances(InstanceIds=self._instance_ids, DryRun=False)
-            print("Instance ", self.instance_ids, ": stopping")
-            waiter = ec2.get_waiter('instance_stopped')
-            waiter.wait(InstanceIds=self.instance_ids)
-            print("Instance ", self.instance_ids, ": stopped\n")
-        except ClientError as e:
-            print(e)
+    def stop_instances(self, instance_ids=None, wait=True):
+        """
+        Stops Amazon EBS-backed instances.
 
-    def reboot_instances(self):
-        try:
-            ec2.reboot_instances(InstanceIds=[self.instance_ids], DryRun=True)
-        except ClientError as e:
-            if 'DryRunOperation' not in str(e):
-                print("You don't have permission to reboot instances.")
-                raise
+        :param instance_ids: instance IDs, defaults to ``instance_ids``
+        :param wait: wait until the instances are stopped
+        :return: IDs of the stopping instances
+        """
+        return self._change_state('stop_instances', instance_ids, wait)
 
-        try:
-            ec2.reboot_instances(InstanceIds=[self.instance_ids], DryRun=False)
-            print("Instance ", self.instance_ids, ": rebooting")
-            waiter = ec2.get_waiter('instance_status_ok')
-            waiter.wait(InstanceIds=[self.instance_ids])
-            print("Instance ", self.instance_ids, ": running\n")
-        except ClientError as e:
-            print('Error', e)
+    def reboot_instances(self, instance_ids=None, wait=True):
+        """
+        Requests a reboot of instances.
 
-    def terminate_instances(self):
+        :param instance_ids: instance IDs, defaults to ``instance_ids``
+        :param wait: wait until the status checks of the instances pass
+        :return: IDs of the rebooting instances
         """
-        Shuts down one or more instances.
+        return self._change_state('reboot_instances', instance_ids, wait)
 
-        :return:
+    def terminate_instances(self, instance_ids=None, wait=True):
         """
-        try:
-            ec2.terminate_instances(InstanceIds=[self.instance_ids], DryRun=True)
-        except ClientError as e:
-            if 'DryRunOperation' not in str(e):
-                print("You don't have permission to terminate instances.")
-                raise
+        Shuts down instances.
 
-        try:
-            ec2.terminate_instances(InstanceIds=[self.instance_ids], DryRun=False)
-            print("Instance ", self.instance_ids, ": terminating")
-            waiter = ec2.get_waiter('instance_terminated')
-            waiter.wait(InstanceIds=[self.instance_ids])
-            print("Instance ", self.instance_ids, ": terminated\n")
-        except ClientError as e:
-            print('Error', e)
+        :param instance_ids: instance IDs, defaults to ``instance_ids``
+        :param wait: wait until the instances are terminated
+        :return: IDs of the terminating instances
+        """
+        return self._change_state('terminate_instances', instance_ids, wait)
+
+    def select_instances(self, selection=None, instance_ids=None, fields=None):
+        """
+        Streams the instances matching ``instance_ids`` and ``selection``.
+
+        :param selection: compiled ``--where`` expression, see ``ccli.aws.where``
+        :param instance_ids: restrict to these instance IDs, an empty list
+                             matches nothing
+        :param fields: compiled ``--fields`` projection, see ``ccli.aws.fields``
+        :return: generator of ``Instance`` records, of the projected fields
+                 with ``fields``
+        """
+        instances = self._select(selection, instance_ids)
+        if fields is not None:
+            return fields.select(instances)
+
+        # --where and --fields read the API shape, everything else a record
+        region = self.region or default_region()
+        return (Instance.from_api(instance, region) for instance in instances)
+
+    def _select(self, selection=None, instance_ids=None):
+        if instance_ids is not None:
+            for chunk in chunks(list(instance_ids), MAX_IDS_PER_CALL):
+                filters = [{'Name': 'instance-id', 'Values': chunk}]
+                instances = iter_instances(self.client, self.page_size, Filters=filters)
+                if selection is not None:
+                    instances = selection.select(instances, pushed=False)
+                yield from instances
+        elif selection is not None:
+            instances = iter_instances(self.client, self.page_size, **selection.describe_kwargs())
+            yield from selection.select(instances)
+        else:
+            yield from iter_instances(self.client, self.page_size)
+
+    def export_instances(self, path, compression=None, fields=None, **kwargs):
+        """
+        Streams every instance into ``path`` as NDJSON, one instance per line.
+
+        Each page is written as it arrives and every instance is encoded
+        once, so memory stays flat whatever the size of the fleet.
 
-    def desc_instances(self, save_to_file=False, all_instance=False):
+        :param path: file to write, ``.gz`` or ``.zst`` compress it
+        :param compression: ``gzip`` or ``zstd``, guessed from ``path`` if unset
+        :param fields: compiled ``--fields`` projection, the ``Instance``
+                       record fields if unset
+        :param kwargs: extra ``describe_instances`` parameters
+        :return: number of instances written
+        """
+        instances = iter_instances(self.client, page_size=self.page_size, **kwargs)
+        if fields is not None:
+            instances = fields.select(instances)
+        else:
+            region = self.region or default_region()
+            instances = (Instance.from_api(instance, region) for instance in instances)
+
+        return export_ndjson(instances, path, compression)
+
+    def desc_instances(self, save_to_file=False, all_instance=False, export=None, compression=None,
+                       fields=None):
         """
         Describes one or more of your instances.
 
+        With ``all_instance`` the instances are streamed page by page, so
+        output starts with the first page and memory does not grow with the
+        size of the fleet. ``export`` switches to ``export_instances``.
+
         :param save_to_file:
         :param all_instance:
-        :return:
+        :param export: NDJSON file to stream all instances into
+        :param compression: compression of ``export``
+        :param fields: compiled ``--fields`` projection, only these fields are
+                       printed and saved
+        :return: number of instances when ``all_instance`` or ``export`` is set
         """
-        if all_instance:
-            res = ec2.describe_instances()
-            print(json.dumps(res, default=datetime_to_str, indent=4))
-            if save_to_file:
-                json.dump(res, open("all_instances.json", 'w'), default=datetime_to_str, indent=4)
-            return res
+        if export:
+            count = self.export_instances(export, compression, fields)
+            print(f'{count} instances written to {export}')
+            return count
+        elif all_instance:
+            f = open("all_instances.json", 'w') if save_to_file else None
+            count = 0
+            try:
+                if f:
+                    f.write('[\n')
+                for instance in self.select_instances(fields=fields):
+                    data = json.dumps(instance, default=json_default, indent=4)
+                    print(data)
+                    if f:
+                        f.write(',\n' if count else '')
+                        f.write(data)
+                    count += 1
+                if f:
+                    f.write('\n]\n')
+            finally:
+                if f:
+                    f.close()
+            return count
         else:
-            res = ec2.describe_instances(InstanceIds=[self.instance_ids])
-            print(json.dumps(res, default=datetime_to_str, indent=4))
+            res = self.client.describe_instances(InstanceIds=[self.instance_ids])
+            project = fields.project if fields is not None else Instance.from_api
+            res = [project(instance) for reservation in res['Reservations']
+                   for instance in reservation['Instances']]
+            print(json.dumps(res, default=json_default, indent=4))
             if save_to_file:
-                json.dump(res, open(self.instance_ids + ".json", 'w'), default=datetime_to_str, indent=4)
+                json.dump(res, open(self.instance_ids + ".json", 'w'), default=json_default, indent=4)
 
     def instance_status(self):
         try:
-            response = ec2.describe_instances(InstanceIds=[self.instance_ids])
-            status = response.get('Reservations')[0].get('Instances')[0].get('State').get('Name')
-            print("Instance ", self.instance_ids, ": ", status)
+            response = self.client.describe_instances(InstanceIds=[self.instance_ids])
+            instance = Instance.from_api(response['Reservations'][0]['Instances'][0])
+            print("Instance ", instance.instance_id, ": ", instance.state)
             print("")
         except ClientError as e:
             print(e)
@@ -182,97 +321,56 @@ class EC2Operation:
 
 class LaunchEC2:
     @staticmethod
-    def run_instance(max_cnt=1, min_cnt=1, template_name=None, **kwargs):
-        ec2.run_instances(
-            BlockDeviceMappings=[
-                {
-                    'Ebs': {
-                        'DeleteOnTermination': kwargs['delete_on_termination'],
-                        'VolumeSize': volume_size,
-                        'VolumeType': 'gp2',
-                    },
-                },
-            ],
-            ImageId=image_id,
-            InstanceType=instance_type,
-            KeyName=key_name,
-            MaxCount=max_cnt,
-            MinCount=min_cnt,
-            Placement={
-                'AvailabilityZone': availability_zones_,
-                'Tenancy': 'default',
-            },
-            DisableApiTermination=diasble_api_termination,
-            InstanceInitiatedShutdownBehavior=shutdown_behavior,
-            NetworkInsterfaces=[
-                {
-                    'AssociatePublicIpAddress': public_address,
-                    'DeleteOnTermination': delete_on_termination,
-                    'Groups': [
-                        security_group,
-                    ],
-                    'SubnetId': subnet_id,
-                },
-            ],
-        )
-
-        try:
-            ec2.run_instances(
-                MaxCount=max_cnt,
-                MinCount=min_cnt,
-                DryRun=True,
-                LaunchTemplate={
-                    'LaunchTemplateName': template_name
-                }
-            )
-        except ClientError as e:
-            if 'DryRunOperation' not in str(e):
-                print("You don't have permission to launch instances.")
-                raise
-
-        try:
-            response = ec2.run_instances(
-                MaxCount=max_cnt,
-                MinCount=min_cnt,
-                DryRun=True,
-                LaunchTemplate={
-                    'LaunchTemplateName': template_name
-                }
-            )
+    def run_instance(max_cnt=1, min_cnt=1, template_name=None, subnet_ids=None,
+                     pipelined=False, topology=None, **kwargs):
+        """
+        Launches ``max_cnt`` instances from ``template_name``, or from the
+        ``run_instances`` parameters in ``kwargs``, spread over the subnets
+        with free addresses, see ``launch.launch``.
 
-            ins_id = response.get('Instances')[0].get('InstanceId')
-            public_dns_name = response.get('Instances')[0].get('PublicDnsName')
-            public_ip_address = response.get('Instances')[0].get('PublicIpAddress')
-            key_name = response.get('Instances')[0].get('KeyName')
+        With ``pipelined`` every instance is reported once its status checks
+        passed and its addresses are known, see ``launch.pipeline``.
 
-            json.dump(response, open(ins_id + ".json", 'w'), default=datetime_to_str, indent=4)
+        :return: list of launched ``Instance`` records
+        """
+        instances = []
+        launched = launch(max_cnt, template=template_name, spec=kwargs,
+                          subnet_ids=subnet_ids, min_count=min_cnt, topology=topology)
+        if pipelined:
+            launched = pipeline(launched, on_stage=print_state)
 
-            print(f'Instance ID: {ins_id}\n'
-                  f'Public DNS Name: {public_dns_name}\n'
-                  f'Public IP Address: {public_ip_address}\n'
-                  f'Key Name: {key_name}\n')
+        try:
+            for data in launched:
+                instance = Instance.from_api(data, region=ec2.client.meta.region_name)
+                instances.append(instance)
+
+                if not pipelined:
+                    with open(instance.instance_id + ".json", 'w') as fp:
+                        json.dump(data, fp, default=datetime_to_str, indent=4)
+
+                print(f'Instance ID: {instance.instance_id}\n'
+                      f'Availability Zone: {instance.az}\n'
+                      f'Subnet ID: {instance.subnet_id}\n'
+                      f'Private IP Address: {instance.private_ip}\n'
+                      f'Public DNS Name: {instance.public_dns}\n'
+                      f'Public IP Address: {instance.public_ip}\n'
+                      f'Key Name: {instance.key_name}\n')
+        except PermissionDenied as e:
+            print(e)
+            raise
         except ClientError as e:
             print(e)
 
+        return instances
+
 
 class EC2Templates:
     @staticmethod
     def create_launch_template(template_name='', version_description='', template_data={}):
         try:
-            ec2.create_launch_template(
-                DryRun=True,
-                LaunchTemplateName=template_name,
-                VersionDescription=version_description,
-                LaunchTemplateData=template_data
-            )
-        except ClientError as e:
-            if 'DryRunOperation' not in str(e):
-                print("You don't have permission to create template.")
-                raise
-
-        try:
-            response = ec2.create_launch_template(
-                DryRun=False,
+            response = checked_call(
+                ec2,
+                'create_launch_template',
                 LaunchTemplateName=template_name,
                 VersionDescription=version_description,
                 LaunchTemplateData=template_data
@@ -281,6 +379,9 @@ class EC2Templates:
             template_id = response.get('LaunchTemplate').get('LaunchTemplateId')
 
             print(f'Template ID: {template_id}\nTemplate Name: {template_name}\n')
+        except PermissionDenied as e:
+            print(e)
+            raise
         except ClientError as e:
             print(e)
 
@@ -288,22 +389,16 @@ class EC2Templates:
     @staticmethod
     def delete_launch_template(template_name=''):
         try:
-            ec2.delete_launch_template(
-                DryRun=True,
-                LaunchTemplateName=template_name
-            )
-        except ClientError as e:
-            if 'DryRunOperation' not in str(e):
-                print("You don't have permission to delete template.")
-                raise
-
-        try:
-            ec2.delete_launch_template(
-                DryRun=False,
+            checked_call(
+                ec2,
+                'delete_launch_template',
                 LaunchTemplateName=template_name
             )
 
             print(template_name, " - deleted")
+        except PermissionDenied as e:
+            print(e)
+            raise
         except ClientError as e:
             print(e)
 
@@ -1,8 +1,133 @@
-import boto3
+import hashlib
 import json
 
+from ..core.exc import ccliError
+from ..core.fanout import MAX_WORKERS
+from .client import LazyClient
+from .permissions import checked_call
+from .regions import fan_out
 
-ec2 = boto3.client('ec2', region_name='ap-northeast-2')
+ec2 = LazyClient('ec2')
+
+# tag of imported key pairs holding the SHA-256 of their public key
+HASH_TAG = 'ccli:sha256'
+
+# what a region needs to match the wanted state
+IMPORT = 'import'
+REPLACE = 'replace'
+DELETE = 'delete'
+# same key material, only the ``HASH_TAG`` is missing or stale
+TAG = 'tag'
+
+
+def public_key_hash(public_key):
+    """
+    Returns the SHA-256 of an OpenSSH public key, ignoring its comment.
+    """
+    fields = public_key.split()
+    if len(fields) < 2:
+        raise ccliError('not an OpenSSH public key')
+
+    return hashlib.sha256(' '.join(fields[:2]).encode()).hexdigest()
+
+
+def describe_key_hashes(client):
+    """
+    Lists the key pairs of a region with the hash of their public key.
+
+    The hash is taken from the public key itself, the ``HASH_TAG`` is only
+    trusted when the region does not return the key.
+
+    :return: dict of key name to a dict of the key pair ``id``, its public
+             key ``hash``, ``None`` if unknown, and its ``tag``
+    """
+    response = client.describe_key_pairs(IncludePublicKey=True)
+    hashes = {}
+    for key_pair in response.get('KeyPairs', []):
+        tags = {tag['Key']: tag['Value'] for tag in key_pair.get('Tags', [])}
+        digest = tags.get(HASH_TAG)
+        if key_pair.get('PublicKey'):
+            try:
+                digest = public_key_hash(key_pair['PublicKey'])
+            except ccliError:
+                pass
+        hashes[key_pair['KeyName']] = {'id': key_pair.get('KeyPairId'), 'hash': digest,
+                                       'tag': tags.get(HASH_TAG)}
+
+    return hashes
+
+
+def key_diff(key_name, digest, hashes):
+    """
+    Tells what a region with key pairs ``hashes`` needs.
+
+    :param digest: hash of the wanted public key, ``None`` to remove the key
+    :param hashes: see ``describe_key_hashes``
+    :return: ``IMPORT``, ``REPLACE``, ``DELETE``, ``TAG`` or ``None`` when up
+             to date
+    """
+    if key_name not in hashes:
+        return IMPORT if digest is not None else None
+    if digest is None:
+        return DELETE
+    if hashes[key_name]['hash'] != digest:
+        return REPLACE
+    if hashes[key_name]['tag'] != digest:
+        return TAG
+
+    return None
+
+
+def sync_key_pair(key_name, public_key, regions, cache=None, refresh=False, dry_run=False,
+                  max_workers=MAX_WORKERS):
+    """
+    Imports ``public_key`` as ``key_name`` into every region, or removes the
+    key pair everywhere when ``public_key`` is ``None``.
+
+    All regions work at the same time: each one diffs the wanted key against
+    its cached ``describe_key_pairs`` and only a region that differs is
+    changed, a replaced key is deleted and imported again. A key pair that
+    already holds the wanted key is only tagged.
+
+    :param cache: ``ResourceCache`` keeping the key pairs of every region
+    :param refresh: describe the key pairs again instead of using the cache
+    :param dry_run: only report what would change
+    :return: generator of ``RegionResult`` whose value is the change made in
+             that region, ``None`` for none
+    """
+    digest = public_key_hash(public_key) if public_key is not None else None
+    material = public_key.strip().encode() if public_key is not None else None
+
+    def sync(region):
+        client = LazyClient('ec2', region)
+
+        if cache is None:
+            hashes = describe_key_hashes(client)
+        else:
+            hashes = cache.get('key_pair_digests', lambda: describe_key_hashes(client),
+                               region=region, refresh=refresh)
+
+        change = key_diff(key_name, digest, hashes)
+        if change is None or dry_run:
+            return change
+
+        if change == TAG:
+            checked_call(client, 'create_tags', Resources=[hashes[key_name]['id']],
+                         Tags=[{'Key': HASH_TAG, 'Value': digest}])
+        if change in (REPLACE, DELETE):
+            checked_call(client, 'delete_key_pair', KeyName=key_name)
+        if change in (IMPORT, REPLACE):
+            checked_call(client, 'import_key_pair', KeyName=key_name, PublicKeyMaterial=material,
+                         TagSpecifications=[{'ResourceType': 'key-pair',
+                                             'Tags': [{'Key': HASH_TAG, 'Value': digest}]}])
+
+        if cache is not None:
+            cache.invalidate('key_pair_digests', region)
+            cache.invalidate('key_pairs', region)
+
+        return change
+
+    return fan_out(sync, regions, max_workers)
 
 
 class KeyPairOperation:
@@ -18,15 +143,15 @@ class KeyPairOperation:
         self._key_name = key_name
 
     def create_key(self):
-        response = ec2.create_key_pair(self._key_name)
+        response = ec2.create_key_pair(KeyName=self._key_name)
         key = response["KeyMaterial"]
-        keyName = key_name + ".pem"
+        keyName = self._key_name + ".pem"
 
         with open(keyName, 'w') as f:
             f.write(key)
 
     def del_key(self):
-        response = ec2.delete_key_pair(self._key_name)
+        response = ec2.delete_key_pair(KeyName=self._key_name)
         print(json.dumps(response, indent=4))
 
     def desc_keys(self):
@@ -0,0 +1,87 @@
+import gzip
+import io
+import json
+
+from ..core.exc import ccliError
+
+COMPRESSIONS = ('gzip', 'zstd')
+
+SUFFIXES = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+}
+
+
+def compression_for(path):
+    """
+    Guesses the compression of ``path`` from its suffix.
+    """
+    for suffix, compression in SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+
+    return None
+
+
+def open_export(path, compression=None):
+    """
+    Opens ``path`` for writing text, compressing it on the fly.
+
+    :param path: file to write
+    :param compression: ``gzip``, ``zstd`` or ``None`` to guess from the suffix
+    :return: text file object
+    """
+    compression = compression or compression_for(path)
+
+    if compression == 'gzip':
+        return gzip.open(path, 'wt', encoding='utf-8')
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ccliError('zstd compression needs the zstandard package')
+
+        writer = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+        return io.TextIOWrapper(writer, encoding='utf-8')
+    elif compression is None:
+        return open(path, 'w', encoding='utf-8')
+
+    raise ccliError('unknown compression: %s' % compression)
+
+
+def json_default(value):
+    """
+    ``default`` of the JSON encoders: ``Instance`` records as their
+    ``as_json`` dict, anything else, e.g. botocore's datetimes, as text.
+    """
+    as_json = getattr(value, 'as_json', None)
+
+    return as_json() if as_json is not None else str(value)
+
+
+def write_ndjson(records, fp):
+    """
+    Writes one compact JSON document per line, encoding every record once.
+
+    :param records: iterable of dicts or ``Instance`` records, consumed as
+                    it goes
+    :param fp: text file object
+    :return: number of records written
+    """
+    encode = json.JSONEncoder(default=json_default, separators=(',', ':')).encode
+
+    count = 0
+    for record in records:
+        fp.write(encode(record))
+        fp.write('\n')
+        count += 1
+
+    return count
+
+
+def export_ndjson(records, path, compression=None):
+    """
+    Streams ``records`` into ``path`` as NDJSON, see ``write_ndjson``.
+    """
+    with open_export(path, compression) as fp:
+        return write_ndjson(records, fp)
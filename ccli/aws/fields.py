@@ -0,0 +1,105 @@
+"""
+Field projections of instances for ``--fields``, either a comma separated
+list of dotted paths and ``--where`` field names::
+
+    InstanceId,State.Name,NetworkInterfaces.PrivateIpAddress,tag:Name
+    id,state,private_ip
+
+or a JMESPath expression, recognized by its syntax::
+
+    {id: InstanceId, state: State.Name, ip: PrivateIpAddress}
+
+Dotted paths keep the shape of the API and map over lists. Every instance
+is projected as soon as its page arrives, so the unrequested fields are
+dropped before anything stores or renders them.
+"""
+from ..core.exc import ccliError
+from .where import FIELDS
+
+# characters only a JMESPath expression has
+JMESPATH_CHARS = set('[]{}|()@`*&!<>')
+
+
+def parse(expression):
+    """
+    Parses a list of dotted paths into a tree of keys.
+
+    :return: (tree, set of tag keys), the leaves of the tree are ``None``
+    """
+    tree = {}
+    tags = set()
+    for field in expression.split(','):
+        field = field.strip()
+        if not field:
+            continue
+        if field.startswith('tag:'):
+            tags.add(field[4:])
+            continue
+
+        path = FIELDS[field][1] if field in FIELDS else field
+        node = tree
+        keys = path.split('.')
+        for key in keys[:-1]:
+            node = node.setdefault(key, {})
+            if node is None:
+                break
+        else:
+            # a whole value wins over any of its parts
+            node[keys[-1]] = None
+
+    if not tree and not tags:
+        raise ccliError('no field given')
+
+    return tree, tags
+
+
+def _pick(value, tree):
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [_pick(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _pick(value[key], sub) for key, sub in tree.items() if key in value}
+    return value
+
+
+class Projection:
+    """
+    A compiled ``--fields`` value.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression.strip()
+
+        if JMESPATH_CHARS.intersection(self.expression):
+            import jmespath
+            from jmespath.exceptions import JMESPathError
+
+            try:
+                self.project = jmespath.compile(self.expression).search
+            except JMESPathError as e:
+                raise ccliError('invalid --fields expression: %s' % e)
+            return
+
+        self._tree, self._tags = parse(self.expression)
+
+    def project(self, instance):
+        """
+        Returns the requested fields of ``instance``.
+        """
+        result = _pick(instance, self._tree)
+        if self._tags and 'Tags' not in self._tree:
+            result['Tags'] = [tag for tag in instance.get('Tags', []) if tag['Key'] in self._tags]
+
+        return result
+
+    def select(self, instances):
+        """
+        Projects ``instances`` lazily.
+        """
+        project = self.project
+        return (project(instance) for instance in instances)
+
+
+def compile_fields(expression):
+    return Projection(expression)
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from ..core.exc import ccliError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS instances (
+    instance_id TEXT PRIMARY KEY,
+    region TEXT NOT NULL,
+    state TEXT,
+    instance_type TEXT,
+    az TEXT,
+    vpc_id TEXT,
+    digest TEXT NOT NULL,
+    data TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS instances_region ON instances (region);
+CREATE INDEX IF NOT EXISTS instances_state ON instances (state);
+CREATE INDEX IF NOT EXISTS instances_type ON instances (instance_type);
+CREATE INDEX IF NOT EXISTS instances_az ON instances (az);
+CREATE INDEX IF NOT EXISTS instances_vpc ON instances (vpc_id);
+
+CREATE TABLE IF NOT EXISTS tags (
+    instance_id TEXT NOT NULL REFERENCES instances (instance_id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (instance_id, key)
+);
+CREATE INDEX IF NOT EXISTS tags_key_value ON tags (key, value);
+
+CREATE TABLE IF NOT EXISTS syncs (
+    region TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL
+);
+"""
+
+# indexed columns a query can filter on
+COLUMNS = {
+    'id': 'instance_id',
+    'region': 'region',
+    'state': 'state',
+    'type': 'instance_type',
+    'az': 'az',
+    'vpc': 'vpc_id',
+}
+
+
+# EC2 filter names answered by an indexed column
+FILTER_COLUMNS = {
+    'instance-id': 'id',
+    'instance-state-name': 'state',
+    'instance-type': 'type',
+    'availability-zone': 'az',
+    'vpc-id': 'vpc',
+}
+
+
+def _encode(instance):
+    return json.dumps(instance, default=str, sort_keys=True, separators=(',', ':'))
+
+
+class InventoryStore:
+    """
+    Local instance inventory kept in SQLite, with secondary indexes on
+    instance ID, state, type, AZ, VPC and tags.
+
+    Unlike a JSON document store, single records are upserted or deleted in
+    place, so a sync only writes what changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def sync(self, region, instances, batch_size=500):
+        """
+        Brings the records of ``region`` in line with ``instances``.
+
+        New and changed instances are upserted in batches as they stream in,
+        unchanged ones are left alone. Instances that are gone are deleted
+        once the stream is complete, so a failed listing deletes nothing.
+
+        :param region: region the instances were listed from
+        :param instances: iterable of instance dicts, e.g. ``iter_instances()``
+        :param batch_size: changed records written per transaction
+        :return: dict with ``added``, ``updated``, ``unchanged`` and ``deleted`` counts
+        """
+        started = time.time()
+        stats = {'added': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+
+        with self._lock:
+            known = dict(self._conn.execute(
+                'SELECT instance_id, digest FROM instances WHERE region = ?', (region,)))
+
+        seen = set()
+        batch = []
+        for instance in instances:
+            instance_id = instance['InstanceId']
+            seen.add(instance_id)
+            data = _encode(instance)
+            digest = hashlib.sha1(data.encode()).hexdigest()
+
+            if known.get(instance_id) == digest:
+                stats['unchanged'] += 1
+                continue
+
+            stats['updated' if instance_id in known else 'added'] += 1
+            batch.append((instance, data, digest))
+            if len(batch) >= batch_size:
+                self._write(region, batch, started)
+                batch = []
+
+        self._write(region, batch, started)
+
+        gone = [(i,) for i in known if i not in seen]
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM instances WHERE instance_id = ?', gone)
+            self._conn.execute('INSERT OR REPLACE INTO syncs (region, synced_at) VALUES (?, ?)',
+                               (region, started))
+        stats['deleted'] = len(gone)
+
+        return stats
+
+    def _write(self, region, batch, synced_at):
+        if not batch:
+            return
+
+        with self._lock, self._conn:
+            for instance, data, digest in batch:
+                self._upsert(region, instance, data, digest, synced_at)
+
+    def _upsert(self, region, instance, data, digest, synced_at):
+        instance_id = instance['InstanceId']
+        self._conn.execute(
+            'INSERT OR REPLACE INTO instances VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (instance_id,
+             region,
+             instance.get('State', {}).get('Name'),
+             instance.get('InstanceType'),
+             instance.get('Placement', {}).get('AvailabilityZone'),
+             instance.get('VpcId'),
+             digest,
+             data,
+             synced_at))
+        self._conn.execute('DELETE FROM tags WHERE instance_id = ?', (instance_id,))
+        self._conn.executemany(
+            'INSERT INTO tags (instance_id, key, value) VALUES (?, ?, ?)',
+            [(instance_id, tag['Key'], tag.get('Value')) for tag in instance.get('Tags', [])])
+
+    def age(self, regions):
+        """
+        Returns the seconds since the oldest sync of ``regions``, ``None`` if
+        one of them was never synced.
+        """
+        with self._lock:
+            rows = dict(self._conn.execute('SELECT region, synced_at FROM syncs'))
+
+        if any(region not in rows for region in regions):
+            return None
+
+        return time.time() - min(rows[region] for region in regions)
+
+    def query(self, regions=None, tags=None, max_age=None, **columns):
+        """
+        Returns the stored instances matching every given condition.
+
+        :param regions: list of regions, all synced regions if unset
+        :param tags: dict of tag key to a value or a list of values
+        :param max_age: fail when a region was synced longer ago than this
+        :param columns: ``id``, ``state``, ``type``, ``az`` or ``vpc`` values,
+                        a single value or a list of values
+        :return: list of instance dicts
+        """
+        if max_age is not None:
+            if regions is None:
+                with self._lock:
+                    regions = [row[0] for row in self._conn.execute('SELECT region FROM syncs')]
+            age = self.age(regions or ['-'])
+            if age is None or age > max_age:
+                raise ccliError('local inventory is stale, run "ccli aws sync" first')
+
+        where = []
+        params = []
+        if regions is not None:
+            columns['region'] = list(regions)
+        for name, values in columns.items():
+            if values is None:
+                continue
+            values = [values] if isinstance(values, str) else list(values)
+            where.append('%s IN (%s)' % (COLUMNS[name], ', '.join('?' * len(values))))
+            params.extend(values)
+        for key, values in (tags or {}).items():
+            values = [values] if isinstance(values, str) else list(values)
+            where.append('instance_id IN (SELECT instance_id FROM tags WHERE key = ? AND value IN (%s))'
+                         % ', '.join('?' * len(values)))
+            params.append(key)
+            params.extend(values)
+
+        sql = 'SELECT data FROM instances'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        return [json.loads(row[0]) for row in rows]
+
+    def select(self, selection=None, regions=None, max_age=None):
+        """
+        Answers a compiled ``--where`` expression from the store.
+
+        The filters ``selection`` would push to EC2 are turned into index
+        lookups where possible, the whole expression is then checked on the
+        resulting records.
+
+        :return: list of instance dicts
+        """
+        columns = {}
+        tags = {}
+        for f in selection.filters if selection is not None else []:
+            if any('*' in v or '?' in v for v in f['Values']):
+                continue
+            if f['Name'] in FILTER_COLUMNS:
+                columns[FILTER_COLUMNS[f['Name']]] = f['Values']
+            elif f['Name'].startswith('tag:'):
+                tags[f['Name'][4:]] = f['Values']
+
+        instances = self.query(regions=regions, tags=tags, max_age=max_age, **columns)
+        if selection is None:
+            return instances
+
+        return list(selection.select(instances, pushed=False))
@@ -0,0 +1,330 @@
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from botocore.exceptions import ClientError
+
+from ..core.exc import ccliError
+from .client import LazyClient
+from .permissions import checked_call
+from .records import Subnet
+from .waiter import MAX_IDS_PER_CALL, get_engine
+
+ec2 = LazyClient('ec2')
+
+# upper bound of run_instances calls in flight
+MAX_WORKERS = 16
+
+# placements tried for the instances still missing after a capacity error
+MAX_ROUNDS = 3
+
+# capacity errors and whether they rule out the whole AZ or only the subnet
+CAPACITY_CODES = {
+    'InsufficientInstanceCapacity': 'az',
+    'InsufficientFreeAddressesInSubnet': 'subnet',
+}
+
+# stages an instance passes in a pipelined launch, in order
+STAGES = ('launched', 'running', 'status_ok', 'addressed', 'persisted')
+
+
+def describe_subnets(client=None, subnet_ids=None):
+    """
+    Lists the available subnets with their free address count.
+
+    :param client: EC2 client to use, defaults to the module client
+    :param subnet_ids: only these subnets
+    :return: list of ``Subnet``
+    """
+    client = client or ec2
+    kwargs = {'Filters': [{'Name': 'state', 'Values': ['available']}]}
+    if subnet_ids:
+        kwargs['SubnetIds'] = list(subnet_ids)
+
+    subnets = []
+    for page in client.get_paginator('describe_subnets').paginate(**kwargs):
+        for subnet in page.get('Subnets', []):
+            subnets.append(Subnet.from_api(subnet))
+
+    return subnets
+
+
+def template_data(client, template_name):
+    """
+    Returns the ``LaunchTemplateData`` of the default version of a template.
+    """
+    response = client.describe_launch_template_versions(LaunchTemplateName=template_name,
+                                                        Versions=['$Default'])
+    return response['LaunchTemplateVersions'][0]['LaunchTemplateData']
+
+
+def _subnet_of(data):
+    interfaces = data.get('NetworkInterfaces') or [{}]
+    return data.get('SubnetId') or interfaces[0].get('SubnetId')
+
+
+def candidate_subnets(subnets, data):
+    """
+    Narrows ``subnets`` down to the ones a launch from ``data`` may use.
+
+    Security groups belong to a VPC, so a template or spec naming a subnet
+    keeps to the VPC of that subnet. Without one, EC2 would pick the default
+    VPC, whose default subnets are used.
+    """
+    subnet_id = _subnet_of(data)
+    if subnet_id is None:
+        return [s for s in subnets if s.default]
+
+    vpc_ids = {s.vpc_id for s in subnets if s.subnet_id == subnet_id}
+    return [s for s in subnets if s.vpc_id in vpc_ids]
+
+
+def plan(count, subnets):
+    """
+    Splits ``count`` instances over ``subnets`` in proportion to their free
+    addresses, remainders going to the largest fractions.
+
+    :param count: number of instances
+    :param subnets: list of ``Subnet``
+    :raises ccliError: when the subnets cannot hold ``count`` instances
+    :return: list of (``Subnet``, number of instances), without empty shares
+    """
+    subnets = [s for s in subnets if s.free > 0]
+    total = sum(s.free for s in subnets)
+    if total < count:
+        raise ccliError('no room for %d instances, %d free addresses left in %d subnets'
+                        % (count, total, len(subnets)))
+    if count <= 0:
+        return []
+
+    shares = []
+    for subnet in subnets:
+        whole, rest = divmod(count * subnet.free, total)
+        shares.append([subnet, whole, rest])
+
+    left = count - sum(share[1] for share in shares)
+    for share in sorted(shares, key=lambda s: s[2], reverse=True)[:left]:
+        share[1] += 1
+
+    return [(subnet, n) for subnet, n, _ in shares if n]
+
+
+def placement_request(base, data, subnet, count):
+    """
+    Builds the ``run_instances`` parameters for ``count`` instances in
+    ``subnet``.
+
+    The AZ and the subnet of ``data`` are overridden, a primary network
+    interface keeps its other settings such as security groups.
+
+    :param base: parameters every call shares, e.g. ``LaunchTemplate``
+    :param data: launch template data or spec ``base`` stands for
+    """
+    request = dict(base, MinCount=1, MaxCount=count)
+    request['Placement'] = dict(data.get('Placement') or {}, AvailabilityZone=subnet.az)
+    request['Placement'].pop('AvailabilityZoneId', None)
+
+    interfaces = data.get('NetworkInterfaces')
+    if interfaces:
+        primary = dict(interfaces[0], SubnetId=subnet.subnet_id)
+        primary.setdefault('DeviceIndex', 0)
+        request['NetworkInterfaces'] = [primary]
+        request.pop('SubnetId', None)
+    else:
+        request['SubnetId'] = subnet.subnet_id
+
+    return request
+
+
+def launch(count, template=None, spec=None, subnet_ids=None, min_count=None,
+           client=None, max_workers=MAX_WORKERS, max_rounds=MAX_ROUNDS, topology=None):
+    """
+    Launches ``count`` instances spread over AZs and subnets.
+
+    The instances are planned over the subnets by their free addresses and
+    every placement gets its own ``run_instances`` call, all of them in
+    flight at the same time. Instances a placement could not launch for
+    lack of capacity are planned again over the remaining placements.
+
+    Instances are yielded as soon as their call returns.
+
+    :param count: number of instances wanted
+    :param template: launch template name
+    :param spec: ``run_instances`` parameters, used without a template
+    :param subnet_ids: subnets to use, by default those of the template's VPC
+    :param min_count: fewer launched instances than this is an error,
+                      defaults to ``count``
+    :param client: EC2 client to use, defaults to the module client
+    :param topology: cached ``vpc.Topology`` of the region, its subnets are
+                     used instead of describing them; a subnet that ran out
+                     of addresses since is left out like any other
+    :raises ccliError: when less than ``min_count`` instances could be launched
+    :return: generator of instance dicts
+    """
+    client = client or ec2
+    min_count = count if min_count is None else min_count
+
+    if template is not None:
+        base = {'LaunchTemplate': {'LaunchTemplateName': template, 'Version': '$Default'}}
+        data = template_data(client, template)
+    else:
+        base = dict(spec or {})
+        data = base
+
+    subnets = None
+    if topology is not None:
+        subnets = list(topology.subnets)
+        if subnet_ids:
+            subnets = [topology.subnets[i] for i in set(subnet_ids) if i in topology.subnets]
+            # subnets created after the topology was cached
+            if len(subnets) < len(set(subnet_ids)):
+                subnets = None
+    if subnets is None:
+        subnets = describe_subnets(client, subnet_ids)
+    if not subnet_ids:
+        subnets = candidate_subnets(subnets, data)
+    free = {s.subnet_id: s.free for s in subnets}
+
+    excluded = set()
+    launched = 0
+    for _ in range(max_rounds):
+        remaining = count - launched
+        if remaining <= 0:
+            return
+
+        usable = [s.replace(free=free[s.subnet_id]) for s in subnets
+                  if s.subnet_id not in excluded and s.az not in excluded]
+        try:
+            placements = plan(remaining, usable)
+        except ccliError:
+            if launched >= min_count:
+                return
+            raise
+
+        failure = None
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(placements)))) as pool:
+            futures = {pool.submit(checked_call, client, 'run_instances',
+                                   **placement_request(base, data, subnet, n)): (subnet, n)
+                       for subnet, n in placements}
+
+            for future in as_completed(futures):
+                subnet, n = futures[future]
+                try:
+                    instances = future.result().get('Instances', [])
+                except ClientError as e:
+                    scope = CAPACITY_CODES.get(e.response['Error']['Code'])
+                    if scope is None:
+                        failure = failure or e
+                    else:
+                        excluded.add(subnet.az if scope == 'az' else subnet.subnet_id)
+                    continue
+                except Exception as e:
+                    failure = failure or e
+                    continue
+
+                # a partly fulfilled call means the AZ ran out of capacity
+                if len(instances) < n:
+                    excluded.add(subnet.az)
+                free[subnet.subnet_id] -= len(instances)
+                launched += len(instances)
+                for instance in instances:
+                    yield instance
+
+        if failure is not None:
+            raise failure
+
+    if launched < min_count:
+        raise ccliError('launched %d of %d instances, no placement has capacity left'
+                        % (launched, count))
+
+
+def pipeline(instances, client=None, engine=None, directory='.', on_stage=None):
+    """
+    Streams launched instances through the stages in ``STAGES`` and yields
+    each one as soon as it is ready, whatever the others are doing.
+
+    ``instances`` is consumed in the background, every instance is handed to
+    the waiter engine the moment it is launched. Instances whose status
+    checks passed are described again in batches to pick up their public
+    addressing, and their record is written to ``<directory>/<id>.json``.
+
+    :param instances: iterable of launched instance dicts, e.g. ``launch()``
+    :param client: EC2 client the instances belong to
+    :param engine: ``WaiterEngine``, defaults to the shared one
+    :param directory: where the instance records are written
+    :param on_stage: called with (instance_id, stage) as instances progress,
+                     the stage is ``timed_out`` for one given up on
+    :raises: the error that stopped ``instances``, once the rest is out
+    :return: generator of described instance dicts
+    """
+    client = client or ec2
+    engine = engine or get_engine()
+    stage = on_stage or (lambda instance_id, name: None)
+
+    ready = queue.Queue()
+    launched = []
+    feeding = threading.Event()
+    failure = []
+
+    running = set()
+
+    def on_change(instance_id, state):
+        # an instance seen running with passed checks the first time is both
+        if state in ('running', 'status_ok') and instance_id not in running:
+            running.add(instance_id)
+            stage(instance_id, 'running')
+        if state == 'status_ok':
+            stage(instance_id, state)
+            ready.put(instance_id)
+
+    def feed():
+        try:
+            for instance in instances:
+                stage(instance['InstanceId'], 'launched')
+                launched.extend(engine.track(client, [instance['InstanceId']], 'status_ok',
+                                             on_change=on_change))
+        except Exception as e:
+            failure.append(e)
+        finally:
+            feeding.set()
+            ready.put(None)
+
+    threading.Thread(target=feed, name='ccli-launch', daemon=True).start()
+
+    finished = set()
+    while True:
+        batch = []
+        try:
+            batch.append(ready.get(timeout=1))
+            while len(batch) < MAX_IDS_PER_CALL:
+                batch.append(ready.get_nowait())
+        except queue.Empty:
+            pass
+        batch = [instance_id for instance_id in batch if instance_id is not None]
+
+        if batch:
+            response = client.describe_instances(InstanceIds=batch)
+            for reservation in response.get('Reservations', []):
+                for instance in reservation.get('Instances', []):
+                    instance_id = instance['InstanceId']
+                    stage(instance_id, 'addressed')
+
+                    with open(os.path.join(directory, instance_id + '.json'), 'w') as fp:
+                        json.dump(instance, fp, default=str, indent=4)
+                    stage(instance_id, 'persisted')
+
+                    finished.add(instance_id)
+                    yield instance
+
+        for transition in list(launched):
+            if transition.timed_out and transition.instance_id not in finished:
+                finished.add(transition.instance_id)
+                stage(transition.instance_id, 'timed_out')
+
+        if feeding.is_set() and ready.empty() and len(finished) >= len(launched):
+            break
+
+    if failure:
+        raise failure[0]
@@ -0,0 +1,129 @@
+import hashlib
+import threading
+import time
+
+from tinydb import Query
+
+from ..core.db import db_lock
+from ..core.exc import PermissionDenied
+
+# seconds a permission verdict is trusted; a denial is rechecked sooner,
+# as it usually lasts only until the policy is fixed
+TTL = 3600
+DENIED_TTL = 300
+
+DENIED_CODES = ('UnauthorizedOperation', 'AccessDenied', 'AccessDeniedException')
+
+
+def caller_identity(client):
+    """
+    Identifies the caller of ``client`` by a digest of its access key.
+
+    Only the local credentials are read, no API call is made.
+    """
+    try:
+        credentials = client._request_signer._credentials
+        access_key = credentials.get_frozen_credentials().access_key
+    except AttributeError:
+        return 'anonymous'
+
+    return hashlib.sha1(access_key.encode()).hexdigest()[:16]
+
+
+class PermissionCache:
+    """
+    Remembers whether a caller may run an action in a region.
+
+    Verdicts are kept in memory and, once ``bind`` is called, in a TinyDB
+    table so they outlive a single run. With ``recheck`` set, cached denials
+    are ignored and the API decides again.
+    """
+
+    def __init__(self, ttl=TTL, denied_ttl=DENIED_TTL):
+        self.ttl = ttl
+        self.denied_ttl = denied_ttl
+        self.recheck = False
+        self.table = None
+        self._verdicts = {}
+        self._lock = threading.Lock()
+
+    def bind(self, db, ttl=None, denied_ttl=None):
+        # the table shares its file with the other stores of ``db``
+        self._lock = db_lock(db)
+        self.table = db.table('permissions')
+        if ttl is not None:
+            self.ttl = ttl
+        if denied_ttl is not None:
+            self.denied_ttl = denied_ttl
+
+    def get(self, key):
+        """
+        Returns ``True`` or ``False`` for a fresh verdict, ``None`` otherwise.
+        """
+        with self._lock:
+            entry = self._verdicts.get(key)
+            if entry is None and self.table is not None:
+                entry = self.table.get(Query().key == key)
+                if entry is not None:
+                    self._verdicts[key] = entry
+
+        if entry is None or (self.recheck and not entry['allowed']):
+            return None
+        ttl = self.ttl if entry['allowed'] else min(self.ttl, self.denied_ttl)
+        if time.time() - entry['checked_at'] >= ttl:
+            return None
+
+        return entry['allowed']
+
+    def set(self, key, allowed):
+        entry = {'key': key, 'allowed': allowed, 'checked_at': time.time()}
+        with self._lock:
+            self._verdicts[key] = entry
+            if self.table is not None:
+                self.table.upsert(entry, Query().key == key)
+
+    def clear(self):
+        with self._lock:
+            self._verdicts.clear()
+            if self.table is not None:
+                self.table.truncate()
+
+
+verdicts = PermissionCache()
+
+
+def checked_call(client, action, **kwargs):
+    """
+    Calls ``client.<action>(**kwargs)`` in place of a DryRun preflight
+    followed by the real call.
+
+    A fresh "denied" verdict fails without calling the API, unless
+    ``verdicts.recheck`` is set. Otherwise the real call is made right away
+    and its outcome renews the verdict, so the permission check costs no
+    extra request.
+
+    :param client: EC2 client
+    :param action: client method, e.g. ``stop_instances``
+    :raises PermissionDenied: when the caller may not run ``action``
+    :return: the API response
+    """
+    from botocore.exceptions import ClientError
+
+    key = '%s:%s:%s' % (action, client.meta.region_name, caller_identity(client))
+    verdict = verdicts.get(key)
+    if verdict is False:
+        raise PermissionDenied("You don't have permission to %s (cached verdict, "
+                               "--recheck-permissions asks AWS again)." % action.replace('_', ' '))
+
+    try:
+        response = getattr(client, action)(**kwargs)
+    except ClientError as e:
+        if e.response['Error']['Code'] in DENIED_CODES:
+            verdicts.set(key, False)
+            raise PermissionDenied("You don't have permission to %s." % action.replace('_', ' ')) from e
+        raise
+
+    if verdict is None:
+        verdicts.set(key, True)
+
+    return response
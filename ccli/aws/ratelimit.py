@@ -0,0 +1,185 @@
+import threading
+import time
+
+from . import client as registry
+
+THROTTLE_CODES = (
+    'RequestLimitExceeded',
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequestsException',
+)
+
+# requests per second and bucket size a (region, action) starts with
+RATE = 20.0
+BURST = 20
+
+# the rate never drops below MIN_RATE nor grows above MAX_RATE
+MIN_RATE = 0.5
+MAX_RATE = 100.0
+
+# a throttled response multiplies the rate by DECREASE, every successful
+# one adds RECOVERY requests per second back
+DECREASE = 0.5
+RECOVERY = 0.05
+
+
+class TokenBucket:
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.calls = 0
+        self.throttles = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Takes a token, sleeping until one is available.
+
+        :return: seconds waited
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.calls += 1
+                    self.waited += waited
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+
+class AdaptiveLimiter:
+    """
+    One token bucket per (region, API action), shared by every thread.
+
+    Rates follow additive increase, multiplicative decrease: each throttled
+    response halves the rate of its bucket and drains it, successful ones
+    let it recover slowly.
+    """
+
+    def __init__(self, rate=RATE, burst=BURST, min_rate=MIN_RATE, max_rate=MAX_RATE,
+                 decrease=DECREASE, recovery=RECOVERY):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.decrease = decrease
+        self.recovery = recovery
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def update(self, **kwargs):
+        """
+        Changes the settings in place, keeping the rates learned so far.
+
+        New buckets start at the new ``rate``, the existing ones are only
+        held within the new bounds.
+        """
+        with self._lock:
+            for name, value in kwargs.items():
+                if name not in ('rate', 'burst', 'min_rate', 'max_rate', 'decrease', 'recovery'):
+                    raise TypeError('unknown limiter setting: %s' % name)
+                setattr(self, name, value)
+            buckets = list(self._buckets.values())
+
+        for bucket in buckets:
+            with bucket._lock:
+                bucket.capacity = self.burst
+                bucket.tokens = min(bucket.tokens, bucket.capacity)
+                bucket.rate = min(self.max_rate, max(self.min_rate, bucket.rate))
+
+    def bucket(self, region, action):
+        key = (region, action)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(key, TokenBucket(self.rate, self.burst))
+
+        return bucket
+
+    def acquire(self, region, action):
+        return self.bucket(region, action).acquire()
+
+    def on_throttle(self, region, action):
+        bucket = self.bucket(region, action)
+        with bucket._lock:
+            bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+            bucket.tokens = 0.0
+            bucket.throttles += 1
+
+    def on_success(self, region, action):
+        bucket = self.bucket(region, action)
+        with bucket._lock:
+            bucket.rate = min(self.max_rate, bucket.rate + self.recovery)
+
+    def stats(self):
+        """
+        Returns the current rate and counters of every bucket.
+
+        :return: dict of ``region:action`` to ``rate``, ``calls``,
+                 ``throttles`` and ``waited`` seconds
+        """
+        with self._lock:
+            buckets = dict(self._buckets)
+
+        return {'%s:%s' % key: {'rate': round(b.rate, 2),
+                                'calls': b.calls,
+                                'throttles': b.throttles,
+                                'waited': round(b.waited, 3)}
+                for key, b in sorted(buckets.items())}
+
+
+limiter = AdaptiveLimiter()
+
+
+def attach(client, limiter=limiter):
+    """
+    Routes every request of ``client``, retries included, through ``limiter``.
+    """
+    region = client.meta.region_name
+
+    def before_send(event_name=None, **kwargs):
+        limiter.acquire(region, event_name.rsplit('.', 1)[-1])
+
+    def needs_retry(event_name=None, response=None, **kwargs):
+        if response is None:
+            return None
+
+        action = event_name.rsplit('.', 1)[-1]
+        code = response[1].get('Error', {}).get('Code')
+        if code in THROTTLE_CODES:
+            limiter.on_throttle(region, action)
+        elif response[0].status_code < 400:
+            limiter.on_success(region, action)
+
+        return None
+
+    client.meta.events.register('before-send', before_send, unique_id='ccli-ratelimit-send')
+    client.meta.events.register('needs-retry', needs_retry, unique_id='ccli-ratelimit-retry')
+
+    return client
+
+
+def configure(**kwargs):
+    """
+    Applies ``kwargs`` to the shared limiter and attaches it to every client
+    of the registry.
+
+    The limiter itself is never replaced: a daemon configures it for every
+    command it runs, and the clients created before and after have to share
+    the rates it learned.
+    """
+    limiter.update(**kwargs)
+    registry.register_client_hook(attach, 'ratelimit')
@@ -0,0 +1,259 @@
+"""
+Compact records of the EC2 resources ccli works with.
+
+Botocore returns every resource as a nested dict holding far more than ccli
+reads. The records below keep only the used fields in ``__slots__``, intern
+the strings many resources share (states, types, AZs, VPC and subnet IDs),
+and ``Index`` looks them up by ID or name in constant time. The raw payload
+of an instance is kept only when asked for, or described again on demand.
+"""
+import sys
+
+from .client import LazyClient
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _tags(tags):
+    return tuple((intern(tag['Key']), tag['Value']) for tag in tags or ())
+
+
+class Record:
+    """
+    Base of the records, ``_fields`` lists the slots in constructor order.
+    """
+    __slots__ = ()
+    _fields = ()
+
+    # fields ``Index`` keys the records by
+    _id_field = None
+    _name_field = None
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > len(self._fields):
+            raise TypeError('%s takes at most %d arguments' % (type(self).__name__, len(self._fields)))
+
+        for name, value in zip(self._fields, args + (None,) * (len(self._fields) - len(args))):
+            setattr(self, name, value)
+        for name, value in kwargs.items():
+            if name not in self._fields:
+                raise TypeError('%s has no field %r' % (type(self).__name__, name))
+            setattr(self, name, value)
+
+    def replace(self, **changes):
+        """
+        Returns a copy with ``changes`` applied.
+        """
+        return type(self)(**dict(self.as_dict(), **changes))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self._fields}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self._fields)
+
+    def __hash__(self):
+        return hash((type(self), getattr(self, self._id_field or self._fields[0])))
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__,
+                           ', '.join('%s=%r' % (name, getattr(self, name)) for name in self._fields))
+
+
+class Instance(Record):
+    _fields = ('instance_id', 'state', 'instance_type', 'az', 'subnet_id', 'vpc_id',
+               'private_ip', 'public_ip', 'public_dns', 'key_name', 'image_id',
+               'launch_time', 'tags', 'region')
+    __slots__ = _fields + ('_raw',)
+    _id_field = 'instance_id'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._raw = None
+
+    @classmethod
+    def from_api(cls, data, region=None, keep_raw=False):
+        """
+        Builds the record of a ``describe_instances`` instance.
+
+        :param keep_raw: hold on to ``data`` for ``raw``
+        """
+        record = cls(data['InstanceId'],
+                     intern(data.get('State', {}).get('Name')),
+                     intern(data.get('InstanceType')),
+                     intern(data.get('Placement', {}).get('AvailabilityZone')),
+                     intern(data.get('SubnetId')),
+                     intern(data.get('VpcId')),
+                     data.get('PrivateIpAddress'),
+                     data.get('PublicIpAddress'),
+                     data.get('PublicDnsName') or None,
+                     intern(data.get('KeyName')),
+                     intern(data.get('ImageId')),
+                     data.get('LaunchTime'),
+                     _tags(data.get('Tags')),
+                     intern(region))
+        if keep_raw:
+            record._raw = data
+
+        return record
+
+    @property
+    def name(self):
+        return self.tag('Name')
+
+    def tag(self, key, default=None):
+        for tag_key, value in self.tags or ():
+            if tag_key == key:
+                return value
+        return default
+
+    @property
+    def raw(self):
+        """
+        The ``describe_instances`` payload, described again when it was not kept.
+        """
+        if self._raw is None:
+            client = LazyClient('ec2', self.region)
+            response = client.describe_instances(InstanceIds=[self.instance_id])
+            self._raw = response['Reservations'][0]['Instances'][0]
+
+        return self._raw
+
+    def as_json(self):
+        """
+        Returns the fields as a JSON ready dict, the tags as a mapping.
+        """
+        data = self.as_dict()
+        data['tags'] = dict(self.tags or ())
+
+        return data
+
+
+class Vpc(Record):
+    _fields = ('vpc_id', 'cidrs', 'default')
+    __slots__ = _fields
+    _id_field = 'vpc_id'
+
+    @classmethod
+    def from_api(cls, data):
+        cidrs = [data['CidrBlock']] if data.get('CidrBlock') else []
+        for association in data.get('CidrBlockAssociationSet', []):
+            if association.get('CidrBlockState', {}).get('State', 'associated') == 'associated' \
+                    and association['CidrBlock'] not in cidrs:
+                cidrs.append(association['CidrBlock'])
+
+        return cls(intern(data['VpcId']), tuple(cidrs), data.get('IsDefault', False))
+
+
+class RouteTable(Record):
+    _fields = ('route_table_id', 'vpc_id', 'subnet_ids', 'main')
+    __slots__ = _fields
+    _id_field = 'route_table_id'
+
+    @classmethod
+    def from_api(cls, data):
+        associations = data.get('Associations', [])
+
+        return cls(data['RouteTableId'], intern(data.get('VpcId')),
+                   tuple(intern(a['SubnetId']) for a in associations if a.get('SubnetId')),
+                   any(a.get('Main') for a in associations))
+
+
+class Subnet(Record):
+    _fields = ('subnet_id', 'az', 'vpc_id', 'free', 'default', 'cidr')
+    __slots__ = _fields
+    _id_field = 'subnet_id'
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(data['SubnetId'],
+                   intern(data.get('AvailabilityZone')),
+                   intern(data.get('VpcId')),
+                   data.get('AvailableIpAddressCount', 0),
+                   data.get('DefaultForAz', False),
+                   data.get('CidrBlock'))
+
+
+class SecurityGroup(Record):
+    _fields = ('group_id', 'name', 'vpc_id')
+    __slots__ = _fields
+    _id_field = 'group_id'
+    _name_field = 'name'
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(data['GroupId'], data.get('GroupName'), intern(data.get('VpcId')))
+
+
+class Template(Record):
+    _fields = ('template_id', 'name', 'default_version', 'latest_version', 'versions')
+    __slots__ = _fields
+    _id_field = 'template_id'
+    _name_field = 'name'
+
+    @classmethod
+    def from_api(cls, data, versions=()):
+        """
+        Builds the record of a ``describe_launch_templates`` template.
+
+        :param versions: version dicts, see ``ccli.aws.templates``
+        """
+        return cls(data['LaunchTemplateId'], data['LaunchTemplateName'],
+                   data.get('DefaultVersionNumber'), data.get('LatestVersionNumber'),
+                   list(versions))
+
+
+class KeyPair(Record):
+    _fields = ('key_pair_id', 'name', 'fingerprint')
+    __slots__ = _fields
+    _id_field = 'name'
+    _name_field = 'name'
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(data.get('KeyPairId'), data['KeyName'], data.get('KeyFingerprint'))
+
+
+class Index:
+    """
+    Records of one kind with dict lookups by ID and, if they have one, name.
+    """
+
+    def __init__(self, records=()):
+        self._by_id = {}
+        self._by_name = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        self._by_id[getattr(record, record._id_field)] = record
+        if record._name_field is not None:
+            self._by_name[getattr(record, record._name_field)] = record
+
+    def get(self, record_id, default=None):
+        return self._by_id.get(record_id, default)
+
+    def named(self, name, default=None):
+        return self._by_name.get(name, default)
+
+    def ids(self):
+        return list(self._by_id)
+
+    def names(self):
+        return list(self._by_name)
+
+    def __getitem__(self, record_id):
+        return self._by_id[record_id]
+
+    def __contains__(self, record_id):
+        return record_id in self._by_id
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __len__(self):
+        return len(self._by_id)
@@ -0,0 +1,113 @@
+from collections import namedtuple
+
+from ..core import fanout
+from ..core.exc import ccliError
+from ..core.fanout import MAX_WORKERS
+from .ec2 import REGIONS, EC2Operation
+
+RegionResult = namedtuple('RegionResult', ['region', 'value', 'error'])
+
+LIFECYCLE_ACTIONS = {
+    'start': 'start_instances',
+    'stop': 'stop_instances',
+    'reboot': 'reboot_instances',
+    'terminate': 'terminate_instances',
+}
+
+
+def parse_regions(value):
+    """
+    Parses a ``--regions`` value, either ``all`` or a comma separated list.
+
+    :param value: ``all`` or ``region-a,region-b``
+    :return: list of region names
+    """
+    if value.strip() == 'all':
+        return list(REGIONS)
+
+    regions = [region.strip() for region in value.split(',') if region.strip()]
+    unknown = [region for region in regions if region not in REGIONS]
+    if unknown:
+        raise ccliError('unknown region(s): %s' % ', '.join(unknown))
+    if not regions:
+        raise ccliError('no region given')
+
+    return regions
+
+
+def merge(func, regions, max_workers=MAX_WORKERS, buffer_size=1000):
+    """
+    Merges the items ``func(region)`` returns for every region, see
+    ``ccli.core.fanout.merge``.
+
+    :return: generator of ``RegionResult``
+    """
+    return fanout.merge(func, regions, max_workers, buffer_size, result=RegionResult)
+
+
+def fan_out(func, regions, max_workers=MAX_WORKERS):
+    """
+    Runs ``func(region)`` for every region, yielding one ``RegionResult`` per
+    region as soon as it finishes.
+    """
+    return fanout.fan_out(func, regions, max_workers, result=RegionResult)
+
+
+def operations(regions, page_size=None):
+    """
+    Builds one ``EC2Operation`` per region.
+    """
+    kwargs = {'page_size': page_size} if page_size else {}
+
+    return {region: EC2Operation(region=region, **kwargs) for region in regions}
+
+
+def iter_instances_in_regions(regions, page_size=None, max_workers=MAX_WORKERS, selection=None,
+                              instance_ids=None, fields=None):
+    """
+    Streams the instances of all regions, merged in arrival order.
+
+    :param selection: compiled ``--where`` expression, see ``ccli.aws.where``
+    :param instance_ids: restrict to these instance IDs
+    :param fields: compiled ``--fields`` projection, applied in the workers
+    :return: generator of ``RegionResult`` whose value is an ``Instance``
+             record, or the projected fields with ``fields``
+    """
+    ops = operations(regions, page_size)
+
+    return merge(lambda region: ops[region].select_instances(selection, instance_ids, fields),
+                 regions, max_workers)
+
+
+def run_in_regions(action, instance_ids, regions, page_size=None, max_workers=MAX_WORKERS,
+                   selection=None):
+    """
+    Runs a lifecycle action for ``instance_ids`` wherever they live.
+
+    Every region looks up which of the IDs it owns and acts on those only,
+    all regions at the same time. The transitions are left to the shared
+    waiter engine, wait on ``get_engine()`` for them.
+
+    :param action: one of ``start``, ``stop``, ``reboot``, ``terminate``
+    :param instance_ids: list of instance IDs, or ``None`` to act on every
+                         instance of ``selection``
+    :param selection: compiled ``--where`` expression, see ``ccli.aws.where``
+    :raises ccliError: when neither ``instance_ids`` nor ``selection`` is given
+    :return: generator of ``RegionResult`` whose value is the list of IDs
+             handled in that region
+    """
+    # an empty list must not widen to every instance of the regions
+    if not instance_ids and selection is None:
+        raise ccliError('no instance IDs or --where selection given')
+
+    method = LIFECYCLE_ACTIONS[action]
+    ops = operations(regions, page_size)
+
+    def run(region):
+        op = ops[region]
+        owned = [i.instance_id for i in op.select_instances(selection, instance_ids)]
+        getattr(op, method)(owned, wait=False)
+
+        return owned
+
+    return fan_out(run, regions, max_workers)
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+from tinydb import Query
+
+from ..core.db import db_lock
+from ..core.exc import ccliError
+from . import client as registry
+from .cache import DEFAULT_TTLS
+from .client import LazyClient
+from .permissions import checked_call
+from .records import Index, Template
+
+ec2 = LazyClient('ec2')
+
+# upper bound of templates fetched or applied at the same time
+MAX_WORKERS = 16
+
+# marker ccli puts into the VersionDescription of the versions it creates
+HASH_MARKER = re.compile(r'ccli-sha256:([0-9a-f]{64})')
+
+SPEC_SUFFIXES = ('.yml', '.yaml')
+
+
+def content_hash(data):
+    """
+    Returns the SHA-256 of ``LaunchTemplateData`` in a canonical JSON form.
+    """
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _version(version):
+    data = version.get('LaunchTemplateData', {})
+    description = version.get('VersionDescription') or ''
+    marker = HASH_MARKER.search(description)
+
+    return {'number': version['VersionNumber'],
+            'description': description,
+            'hash': content_hash(data),
+            'spec_hash': marker.group(1) if marker else None,
+            'data': json.loads(json.dumps(data, default=str))}
+
+
+class TemplateSnapshot:
+    """
+    Launch templates and all their versions, kept in a TinyDB table and
+    indexed in memory as ``Template`` records by template name and ID.
+
+    A refresh lists the templates and fetches only the versions created
+    since the last one, for the changed templates, in parallel.
+    """
+
+    def __init__(self, db, ttl=None, table='launch_templates', client=None):
+        self.table = db.table(table)
+        self.ttl = DEFAULT_TTLS['launch_templates'] if ttl is None else ttl
+        self.client = client or ec2
+        self.region = None if client is None else client.meta.region_name
+        self._lock = threading.RLock()
+        # held only around table access, refreshes call the API under _lock
+        self._db_lock = db_lock(db)
+        self._loaded = None
+        self._templates = Index()
+        self._synced_at = 0
+
+    def _key(self):
+        return 'snapshot:%s' % (self.region or registry.default_region())
+
+    def _index(self, templates, synced_at):
+        self._templates = Index(templates)
+        self._synced_at = synced_at
+
+    def _load(self):
+        key = self._key()
+        if self._loaded != key:
+            with self._db_lock:
+                entry = self.table.get(Query().key == key) or {'templates': [], 'synced_at': 0}
+            try:
+                templates = [Template(**t) for t in entry['templates']]
+            except TypeError:
+                # written by an older ccli, the next ensure fetches it again
+                templates, entry['synced_at'] = [], 0
+            self._index(templates, entry['synced_at'])
+            self._loaded = key
+
+    def _save(self):
+        with self._db_lock:
+            self.table.upsert({'key': self._key(),
+                               'synced_at': self._synced_at,
+                               'templates': [t.as_dict() for t in self._templates]},
+                              Query().key == self._key())
+
+    def ensure(self, refresh=False):
+        """
+        Loads the snapshot, refreshing it when it is older than the TTL.
+        """
+        with self._lock:
+            self._load()
+            if refresh or time.time() - self._synced_at >= self.ttl:
+                self.refresh()
+
+    def refresh(self):
+        with self._lock:
+            self._load()
+            started = time.time()
+
+            listed = []
+            for page in self.client.get_paginator('describe_launch_templates').paginate():
+                listed.extend(page.get('LaunchTemplates', []))
+
+            stale = [t for t in listed
+                     if getattr(self._templates.get(t['LaunchTemplateId']), 'latest_version', None)
+                     != t['LatestVersionNumber']]
+            with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(stale)))) as pool:
+                fetched = dict(zip([t['LaunchTemplateId'] for t in stale],
+                                   pool.map(self._fetch_versions, stale)))
+
+            templates = []
+            for t in listed:
+                known = self._templates.get(t['LaunchTemplateId'])
+                versions = {v['number']: v for v in (known.versions if known else ())}
+                versions.update((v['number'], v) for v in fetched.get(t['LaunchTemplateId'], []))
+                templates.append(Template.from_api(t, [versions[n] for n in sorted(versions)]))
+
+            self._index(templates, started)
+            self._save()
+
+    def _fetch_versions(self, template):
+        kwargs = {'LaunchTemplateId': template['LaunchTemplateId']}
+        known = self._templates.get(template['LaunchTemplateId'])
+        if known is not None:
+            kwargs['MinVersion'] = str(known.latest_version + 1)
+
+        versions = []
+        paginator = self.client.get_paginator('describe_launch_template_versions')
+        for page in paginator.paginate(**kwargs):
+            versions.extend(_version(v) for v in page.get('LaunchTemplateVersions', []))
+
+        return versions
+
+    def invalidate(self):
+        """
+        Makes the next ``ensure`` refresh, e.g. after a template changed,
+        in this process and the ones reading the same table.
+        """
+        with self._lock:
+            self._load()
+            self._synced_at = 0
+            self._save()
+
+    def names(self, refresh=False):
+        self.ensure(refresh)
+        with self._lock:
+            return sorted(self._templates.names())
+
+    def get(self, name_or_id, refresh=False):
+        """
+        Returns the ``Template`` record by name or ID, ``None`` if unknown.
+        """
+        self.ensure(refresh)
+        with self._lock:
+            return self._templates.get(name_or_id) or self._templates.named(name_or_id)
+
+    def version(self, name_or_id, number=None, refresh=False):
+        """
+        Returns a version of a template, the latest one by default.
+        """
+        template = self.get(name_or_id, refresh)
+        if template is None:
+            return None
+
+        number = template.latest_version if number is None else number
+        for version in template.versions:
+            if version['number'] == number:
+                return version
+
+        return None
+
+
+def load_specs(directory):
+    """
+    Reads the YAML template specs of ``directory``.
+
+    A spec holds ``LaunchTemplateData`` and optionally ``LaunchTemplateName``,
+    which defaults to the file name, and ``VersionDescription``.
+
+    :return: list of spec dicts with the name filled in
+    """
+    if not os.path.isdir(directory):
+        raise ccliError('not a directory: %s' % directory)
+
+    specs = []
+    for name in sorted(os.listdir(directory)):
+        stem, suffix = os.path.splitext(name)
+        if suffix not in SPEC_SUFFIXES:
+            continue
+
+        with open(os.path.join(directory, name)) as fp:
+            spec = yaml.safe_load(fp) or {}
+        if 'LaunchTemplateData' not in spec:
+            raise ccliError('%s: LaunchTemplateData is missing' % name)
+
+        spec.setdefault('LaunchTemplateName', stem)
+        specs.append(spec)
+
+    return specs
+
+
+def apply_spec(spec, snapshot, client=None):
+    """
+    Makes the latest version of a template match ``spec``.
+
+    Nothing is sent when the content hash of the spec matches the latest
+    version, otherwise the template or a new default version is created.
+
+    :return: ``created``, ``updated`` or ``unchanged``
+    """
+    client = client or snapshot.client
+    name = spec['LaunchTemplateName']
+    data = spec['LaunchTemplateData']
+    digest = content_hash(data)
+
+    latest = snapshot.version(name)
+    if latest is not None and digest in (latest['spec_hash'], latest['hash']):
+        return 'unchanged'
+
+    description = ' '.join(filter(None, [spec.get('VersionDescription'),
+                                         'ccli-sha256:%s' % digest]))
+    if snapshot.get(name) is None:
+        checked_call(client, 'create_launch_template', LaunchTemplateName=name,
+                     VersionDescription=description, LaunchTemplateData=data)
+        return 'created'
+
+    response = checked_call(client, 'create_launch_template_version', LaunchTemplateName=name,
+                            VersionDescription=description, LaunchTemplateData=data)
+    number = response['LaunchTemplateVersion']['VersionNumber']
+    checked_call(client, 'modify_launch_template', LaunchTemplateName=name,
+                 DefaultVersion=str(number))
+    return 'updated'
+
+
+def sync_specs(specs, snapshot, max_workers=MAX_WORKERS):
+    """
+    Applies ``specs`` in parallel against a freshly refreshed snapshot.
+
+    :return: list of (template name, outcome or exception), in spec order
+    """
+    snapshot.ensure(refresh=True)
+
+    def apply(spec):
+        try:
+            return apply_spec(spec, snapshot)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(specs)))) as pool:
+        outcomes = list(pool.map(apply, specs))
+
+    if any(outcome in ('created', 'updated') for outcome in outcomes):
+        snapshot.invalidate()
+
+    return [(spec['LaunchTemplateName'], outcome) for spec, outcome in zip(specs, outcomes)]
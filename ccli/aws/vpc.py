@@ -1,7 +1,13 @@
-import boto3
+import bisect
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor
+
 from botocore.exceptions import ClientError
 
-ec2 = boto3.client('ec2', region_name='ap-northeast-2')
+from .client import LazyClient
+from .records import Index, RouteTable, SecurityGroup, Subnet, Vpc
+
+ec2 = LazyClient('ec2')
 
 
 class VPC:
@@ -20,3 +26,191 @@ class VPC:
             return response
         except ClientError as e:
             print(e)
+
+
+class CidrIndex:
+    """
+    Finds the CIDR blocks holding an address.
+
+    CIDR blocks are either nested or disjoint. The block starting last at
+    or before an address therefore either holds it or is nested in a block
+    that does, so a bisection and a walk up the enclosing blocks, at most
+    one per prefix length, answer a lookup.
+    """
+
+    def __init__(self, blocks=()):
+        """
+        :param blocks: iterable of (CIDR, value), several values may share a CIDR
+        """
+        values = {}
+        for cidr, value in blocks:
+            network = ipaddress.ip_network(cidr, strict=False)
+            key = ((network.version, int(network.network_address)),
+                   (network.version, int(network.broadcast_address)))
+            values.setdefault(key, []).append(value)
+
+        # enclosing blocks sort before the blocks they hold
+        ranges = sorted(values, key=lambda r: (r[0], (r[1][0], -r[1][1])))
+        self._starts = [start for start, _ in ranges]
+        self._ends = [end for _, end in ranges]
+        self._values = [values[r] for r in ranges]
+        self._parents = []
+
+        stack = []
+        for i, (start, end) in enumerate(ranges):
+            while stack and self._ends[stack[-1]] < start:
+                stack.pop()
+            self._parents.append(stack[-1] if stack else -1)
+            stack.append(i)
+
+    def lookup(self, address):
+        """
+        Returns the values of the blocks holding ``address``, innermost first.
+        """
+        ip = ipaddress.ip_address(address)
+        key = (ip.version, int(ip))
+
+        found = []
+        i = bisect.bisect_right(self._starts, key) - 1
+        while i >= 0:
+            if self._ends[i] >= key:
+                found.extend(self._values[i])
+            i = self._parents[i]
+
+        return found
+
+    def __len__(self):
+        return len(self._starts)
+
+
+class Topology:
+    """
+    VPCs of a region with their subnets, route tables and security groups.
+
+    Addresses are looked up in ``CidrIndex``es. The subnets of every AZ are
+    kept sorted by free addresses, so the ones with room for a number of
+    instances are found by bisection.
+    """
+
+    def __init__(self, vpcs=(), subnets=(), route_tables=(), security_groups=()):
+        self.vpcs = Index(vpcs)
+        self.subnets = Index(subnets)
+        self.route_tables = Index(route_tables)
+        self.security_groups = Index(security_groups)
+
+        self._vpc_cidrs = CidrIndex((cidr, vpc) for vpc in self.vpcs for cidr in vpc.cidrs)
+        self._subnet_cidrs = CidrIndex((subnet.cidr, subnet) for subnet in self.subnets
+                                       if subnet.cidr)
+
+        self._by_az = {}
+        for subnet in sorted(self.subnets, key=lambda s: (s.free, s.subnet_id)):
+            self._by_az.setdefault(subnet.az, []).append(subnet)
+        self._free_by_az = {az: [s.free for s in subnets] for az, subnets in self._by_az.items()}
+
+        self._route_table_of = {}
+        self._main_route_table = {}
+        for table in self.route_tables:
+            for subnet_id in table.subnet_ids:
+                self._route_table_of[subnet_id] = table
+            if table.main:
+                self._main_route_table[table.vpc_id] = table
+
+    @classmethod
+    def describe(cls, client=None):
+        """
+        Describes the topology of the region of ``client``, the four resource
+        types at the same time.
+        """
+        client = client or ec2
+
+        def describe(operation, key, record, **kwargs):
+            paginator = client.get_paginator(operation)
+            return [record.from_api(item) for page in paginator.paginate(**kwargs)
+                    for item in page.get(key, [])]
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            vpcs = pool.submit(describe, 'describe_vpcs', 'Vpcs', Vpc)
+            subnets = pool.submit(describe, 'describe_subnets', 'Subnets', Subnet,
+                                  Filters=[{'Name': 'state', 'Values': ['available']}])
+            tables = pool.submit(describe, 'describe_route_tables', 'RouteTables', RouteTable)
+            groups = pool.submit(describe, 'describe_security_groups', 'SecurityGroups',
+                                 SecurityGroup)
+
+            return cls(vpcs.result(), subnets.result(), tables.result(), groups.result())
+
+    def as_dict(self):
+        """
+        Returns the topology as JSON serializable lists, see ``from_dict``.
+        """
+        return {'vpcs': [vpc.as_dict() for vpc in self.vpcs],
+                'subnets': [subnet.as_dict() for subnet in self.subnets],
+                'route_tables': [table.as_dict() for table in self.route_tables],
+                'security_groups': [group.as_dict() for group in self.security_groups]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls([Vpc(**dict(d, cidrs=tuple(d['cidrs']))) for d in data['vpcs']],
+                   [Subnet(**d) for d in data['subnets']],
+                   [RouteTable(**dict(d, subnet_ids=tuple(d['subnet_ids'])))
+                    for d in data['route_tables']],
+                   [SecurityGroup(**d) for d in data['security_groups']])
+
+    def vpc_of(self, address):
+        """
+        Returns the VPCs whose CIDR blocks hold ``address``.
+        """
+        return self._vpc_cidrs.lookup(address)
+
+    def subnet_of(self, address, vpc_id=None):
+        """
+        Returns the subnets holding ``address``, in any VPC or in ``vpc_id``.
+        """
+        subnets = self._subnet_cidrs.lookup(address)
+        if vpc_id is not None:
+            subnets = [subnet for subnet in subnets if subnet.vpc_id == vpc_id]
+        return subnets
+
+    def subnets_with_free(self, az, count=1):
+        """
+        Returns the subnets of ``az`` with at least ``count`` free addresses,
+        most free first.
+        """
+        subnets = self._by_az.get(az, [])
+        start = bisect.bisect_left(self._free_by_az.get(az, []), count)
+        return subnets[start:][::-1]
+
+    def subnets_of(self, vpc_id):
+        return [subnet for subnet in self.subnets if subnet.vpc_id == vpc_id]
+
+    def security_groups_of(self, vpc_id):
+        return [group for group in self.security_groups if group.vpc_id == vpc_id]
+
+    def route_table_of(self, subnet_id):
+        """
+        Returns the route table of a subnet, the main table of its VPC unless
+        it has one of its own.
+        """
+        table = self._route_table_of.get(subnet_id)
+        if table is None and subnet_id in self.subnets:
+            table = self._main_route_table.get(self.subnets[subnet_id].vpc_id)
+        return table
+
+    def azs(self):
+        return sorted(self._by_az)
+
+
+def load_topology(cache=None, client=None, region=None, refresh=False):
+    """
+    Returns the ``Topology`` of a region, from ``cache`` while it is fresh.
+
+    :param cache: ``ResourceCache`` keeping the described topology
+    :param region: region of the topology, defaults to the configured one
+    """
+    if client is None:
+        client = LazyClient('ec2', region) if region else ec2
+    if cache is None:
+        return Topology.describe(client)
+
+    data = cache.get('topology', lambda: Topology.describe(client).as_dict(),
+                     region=region, refresh=refresh)
+    return Topology.from_dict(data)
@@ -0,0 +1,260 @@
+import re
+import threading
+import time
+
+from ..core import profiler
+
+# instance IDs per describe_instance_status call
+MAX_IDS_PER_CALL = 100
+
+# adaptive polling: start fast, back off while nothing changes
+MIN_DELAY = 2
+MAX_DELAY = 15
+BACKOFF = 1.5
+
+# seconds a transition may take before it is given up
+TIMEOUT = 600
+
+STATES = ('running', 'stopped', 'terminated', 'status_ok')
+
+# instance IDs named by an InvalidInstanceID.NotFound message
+INSTANCE_ID = re.compile(r'\bi-[0-9a-f]+\b')
+
+
+def reached(status, state):
+    """
+    Tells whether a ``describe_instance_status`` entry is in ``state``.
+    """
+    if status['InstanceState']['Name'] != ('running' if state == 'status_ok' else state):
+        return False
+    if state == 'status_ok':
+        return (status.get('InstanceStatus', {}).get('Status') == 'ok'
+                and status.get('SystemStatus', {}).get('Status') == 'ok')
+
+    return True
+
+
+class Transition:
+    """
+    An instance on its way to ``target``.
+    """
+
+    def __init__(self, client, instance_id, target, on_change=None):
+        self.client = client
+        self.instance_id = instance_id
+        self.target = target
+        self.on_change = on_change
+        self.state = None
+        self.started = time.time()
+        self.timed_out = False
+        self.done = threading.Event()
+
+    def __repr__(self):
+        return '<Transition %s %s -> %s>' % (self.instance_id, self.state, self.target)
+
+
+class WaiterEngine:
+    """
+    Waits for many instance state transitions at once, in a background thread.
+
+    Pending instances are polled together, one ``describe_instance_status``
+    call per client and chunk of IDs. The delay between rounds starts at
+    ``min_delay`` and grows by ``backoff`` up to ``max_delay`` while nothing
+    changes; any change or newly tracked instance resets it. Every observed
+    state change is passed to the ``on_change`` callback of its transition.
+    """
+
+    def __init__(self, min_delay=MIN_DELAY, max_delay=MAX_DELAY, backoff=BACKOFF,
+                 timeout=TIMEOUT):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.timeout = timeout
+        self._pending = []
+        self._cond = threading.Condition()
+        self._wakeup = False
+        self._thread = None
+
+    def track(self, client, instance_ids, target, on_change=None):
+        """
+        Starts tracking ``instance_ids`` until they reach ``target``.
+
+        Returns at once, use ``wait`` to block on the returned transitions.
+
+        :param client: EC2 client the instances belong to
+        :param instance_ids: instance IDs
+        :param target: one of ``STATES``
+        :param on_change: called with (instance_id, state) on every change
+        :return: list of ``Transition``
+        """
+        if target not in STATES:
+            raise ValueError('unknown target state: %s' % target)
+
+        transitions = [Transition(client, i, target, on_change) for i in instance_ids]
+        with self._cond:
+            self._pending.extend(transitions)
+            self._wakeup = True
+            self._cond.notify()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ccli-waiter', daemon=True)
+                self._thread.start()
+
+        return transitions
+
+    def wait(self, transitions=None):
+        """
+        Blocks until ``transitions``, by default everything tracked, are done.
+
+        :return: transitions that timed out
+        """
+        if transitions is None:
+            with self._cond:
+                transitions = list(self._pending)
+
+        with profiler.phase('wait'):
+            for transition in transitions:
+                transition.done.wait()
+
+        return [t for t in transitions if t.timed_out]
+
+    def pending(self):
+        with self._cond:
+            return list(self._pending)
+
+    def _run(self):
+        delay = self.min_delay
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._thread = None
+                    return
+                pending = list(self._pending)
+
+            try:
+                changed = self._poll(pending)
+            except Exception:
+                # connection and credential errors are retried with a growing
+                # delay until the transitions time out
+                changed = False
+            self._expire(pending)
+
+            with self._cond:
+                self._pending = [t for t in self._pending if not t.done.is_set()]
+                if changed or self._wakeup:
+                    delay = self.min_delay
+                else:
+                    delay = min(delay * self.backoff, self.max_delay)
+                self._wakeup = False
+                if self._pending:
+                    self._cond.wait(delay)
+
+    def _poll(self, pending):
+        changed = False
+        by_client = {}
+        for transition in pending:
+            by_client.setdefault(id(transition.client), []).append(transition)
+
+        for transitions in by_client.values():
+            client = transitions[0].client
+            by_id = {}
+            for transition in transitions:
+                by_id.setdefault(transition.instance_id, []).append(transition)
+
+            ids = sorted(by_id)
+            for i in range(0, len(ids), MAX_IDS_PER_CALL):
+                try:
+                    statuses = self._describe(client, ids[i:i + MAX_IDS_PER_CALL])
+                except Exception:
+                    # the chunk is polled again next round
+                    continue
+
+                for status in statuses:
+                    for transition in by_id.get(status['InstanceId'], []):
+                        changed |= self._update(transition, status)
+
+        return changed
+
+    @staticmethod
+    def _describe(client, ids):
+        """
+        Returns the statuses of ``ids``.
+
+        Instances an ``InvalidInstanceID.NotFound`` error names count as
+        terminated, the others of the call are described again.
+        """
+        from botocore.exceptions import ClientError
+
+        statuses = []
+        while ids:
+            try:
+                response = client.describe_instance_status(InstanceIds=ids, IncludeAllInstances=True)
+            except ClientError as e:
+                error = e.response.get('Error', {})
+                if error.get('Code') != 'InvalidInstanceID.NotFound':
+                    raise
+                missing = set(INSTANCE_ID.findall(error.get('Message', ''))).intersection(ids)
+                if not missing:
+                    raise
+
+                for instance_id in sorted(missing):
+                    statuses.append({'InstanceId': instance_id,
+                                     'InstanceState': {'Name': 'terminated'}})
+                ids = [instance_id for instance_id in ids if instance_id not in missing]
+            else:
+                statuses.extend(response.get('InstanceStatuses', []))
+                break
+
+        return statuses
+
+    def _expire(self, pending):
+        now = time.time()
+        for transition in pending:
+            if not transition.done.is_set() and now - transition.started > self.timeout:
+                transition.timed_out = True
+                transition.done.set()
+
+    @staticmethod
+    def _update(transition, status):
+        state = status['InstanceState']['Name']
+        if reached(status, transition.target):
+            state = transition.target
+
+        if state == transition.state:
+            return False
+
+        transition.state = state
+        if transition.on_change is not None:
+            transition.on_change(transition.instance_id, state)
+        if state == transition.target:
+            transition.done.set()
+
+        return True
+
+
+_engine = None
+_engine_lock = threading.Lock()
+_settings = {}
+
+
+def configure(**kwargs):
+    """
+    Sets the ``WaiterEngine`` arguments of the shared engine.
+    """
+    global _engine
+
+    _settings.update(kwargs)
+    with _engine_lock:
+        _engine = None
+
+
+def get_engine():
+    """
+    Returns the engine shared by every ``EC2Operation`` of the process.
+    """
+    global _engine
+
+    with _engine_lock:
+        if _engine is None:
+            _engine = WaiterEngine(**_settings)
+
+        return _engine
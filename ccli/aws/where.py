@@ -0,0 +1,269 @@
+"""
+Selection expressions for instances, e.g.::
+
+    tag:env=prod and state=running and type in (t2.large, t2.xlarge)
+
+Comparisons are ``=``, ``!=``, ``in (...)`` and ``not in (...)``, values may
+use the ``*`` and ``?`` wildcards and be quoted. They combine with ``and``,
+``or``, ``not`` and parentheses.
+
+Comparisons with ``=`` or ``in`` that are joined by ``and`` at the top level
+become EC2 ``Filters`` and are evaluated by the API, everything else is
+compiled into a predicate that runs on the returned instances.
+"""
+import re
+from fnmatch import fnmatchcase
+
+from ..core.exc import ccliError
+
+
+def _path(*keys):
+    def get(instance):
+        for key in keys:
+            instance = instance.get(key) if isinstance(instance, dict) else None
+        return instance
+    return get
+
+
+# field -> (EC2 filter name, dotted path of the value in an instance)
+FIELDS = {
+    'id': ('instance-id', 'InstanceId'),
+    'state': ('instance-state-name', 'State.Name'),
+    'type': ('instance-type', 'InstanceType'),
+    'az': ('availability-zone', 'Placement.AvailabilityZone'),
+    'vpc': ('vpc-id', 'VpcId'),
+    'subnet': ('subnet-id', 'SubnetId'),
+    'image': ('image-id', 'ImageId'),
+    'key': ('key-name', 'KeyName'),
+    'private_ip': ('private-ip-address', 'PrivateIpAddress'),
+    'public_ip': ('ip-address', 'PublicIpAddress'),
+}
+
+KEYWORDS = ('and', 'or', 'not', 'in')
+
+TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<op>!=|=|\(|\)|,)
+      | '(?P<squote>[^']*)'
+      | "(?P<dquote>[^"]*)"
+      | (?P<word>[^\s()=!,'"]+)
+    )""", re.VERBOSE)
+
+
+def tokenize(expression):
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = TOKEN.match(expression, pos)
+        if match is None:
+            raise ccliError('invalid --where expression near: %s' % expression[pos:])
+        pos = match.end()
+
+        if match.group('op'):
+            tokens.append(('op', match.group('op')))
+        elif match.group('word') is not None:
+            word = match.group('word')
+            if word.lower() in KEYWORDS:
+                tokens.append(('kw', word.lower()))
+            else:
+                tokens.append(('value', word))
+        else:
+            value = match.group('squote')
+            tokens.append(('value', value if value is not None else match.group('dquote')))
+
+    return tokens
+
+
+class Parser:
+    """
+    Recursive descent parser producing nested tuples:
+
+    ``('cmp', field, op, values)``, ``('and', nodes)``, ``('or', nodes)``
+    and ``('not', node)``.
+    """
+
+    def __init__(self, expression):
+        self.tokens = tokenize(expression)
+        self.pos = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise ccliError('empty --where expression')
+        node = self.expr()
+        if self.pos != len(self.tokens):
+            raise ccliError('unexpected %r in --where expression' % self.tokens[self.pos][1])
+        return node
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            raise ccliError('expected %s in --where expression' % (value or kind))
+        self.pos += 1
+        return token[1]
+
+    def expr(self):
+        nodes = [self.term()]
+        while self.peek() == ('kw', 'or'):
+            self.take()
+            nodes.append(self.term())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def term(self):
+        nodes = [self.factor()]
+        while self.peek() == ('kw', 'and'):
+            self.take()
+            nodes.append(self.factor())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def factor(self):
+        if self.peek() == ('kw', 'not'):
+            self.take()
+            return ('not', self.factor())
+        if self.peek() == ('op', '('):
+            self.take()
+            node = self.expr()
+            self.take('op', ')')
+            return node
+        return self.comparison()
+
+    def comparison(self):
+        field = self.take('value')
+        if field not in FIELDS and not field.startswith('tag:'):
+            raise ccliError('unknown field in --where expression: %s' % field)
+
+        kind, value = self.peek()
+        if (kind, value) == ('kw', 'not'):
+            self.take()
+            self.take('kw', 'in')
+            return ('cmp', field, 'not in', self.values())
+        if (kind, value) == ('kw', 'in'):
+            self.take()
+            return ('cmp', field, 'in', self.values())
+        if kind == 'op' and value in ('=', '!='):
+            self.take()
+            return ('cmp', field, value, [self.take('value')])
+
+        raise ccliError('expected =, !=, in or not in after %s' % field)
+
+    def values(self):
+        self.take('op', '(')
+        values = [self.take('value')]
+        while self.peek() == ('op', ','):
+            self.take()
+            values.append(self.take('value'))
+        self.take('op', ')')
+        return values
+
+
+def _getter(field):
+    if field.startswith('tag:'):
+        key = field[4:]
+
+        def get(instance):
+            for tag in instance.get('Tags', []):
+                if tag['Key'] == key:
+                    return tag['Value']
+        return get
+
+    return _path(*FIELDS[field][1].split('.'))
+
+
+def compile_node(node):
+    """
+    Turns a parsed expression into a predicate over instance dicts.
+    """
+    kind = node[0]
+    if kind == 'and':
+        predicates = [compile_node(n) for n in node[1]]
+        return lambda instance: all(p(instance) for p in predicates)
+    if kind == 'or':
+        predicates = [compile_node(n) for n in node[1]]
+        return lambda instance: any(p(instance) for p in predicates)
+    if kind == 'not':
+        predicate = compile_node(node[1])
+        return lambda instance: not predicate(instance)
+
+    _, field, op, values = node
+    get = _getter(field)
+
+    def match(instance):
+        value = get(instance)
+        return value is not None and any(fnmatchcase(str(value), v) for v in values)
+
+    if op in ('!=', 'not in'):
+        return lambda instance: not match(instance)
+    return match
+
+
+def _filter_name(field):
+    return field if field.startswith('tag:') else FIELDS[field][0]
+
+
+def pushdown(node):
+    """
+    Splits a parsed expression into EC2 ``Filters`` and the residual
+    conjuncts that have to be evaluated locally.
+
+    :return: (filters, list of residual nodes)
+    """
+    conjuncts = node[1] if node[0] == 'and' else [node]
+    filters = []
+    residual = []
+    names = set()
+
+    for conjunct in conjuncts:
+        if conjunct[0] == 'cmp' and conjunct[2] in ('=', 'in'):
+            name = _filter_name(conjunct[1])
+            if name not in names:
+                names.add(name)
+                filters.append({'Name': name, 'Values': list(conjunct[3])})
+                continue
+        residual.append(conjunct)
+
+    return filters, residual
+
+
+class Selection:
+    """
+    A compiled ``--where`` expression.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        tree = Parser(expression).parse()
+        self.filters, residual = pushdown(tree)
+        self._match = compile_node(tree)
+        self._residual = compile_node(('and', residual)) if residual else None
+
+    def describe_kwargs(self):
+        """
+        Returns the ``describe_instances`` parameters doing the server side part.
+        """
+        return {'Filters': self.filters} if self.filters else {}
+
+    def matches(self, instance):
+        """
+        Evaluates the whole expression locally.
+        """
+        return self._match(instance)
+
+    def select(self, instances, pushed=True):
+        """
+        Filters ``instances`` lazily.
+
+        :param instances: iterable of instance dicts
+        :param pushed: whether ``describe_kwargs`` were used to fetch them,
+                       in which case only the residual predicate runs
+        """
+        predicate = self._residual if pushed else self._match
+        if predicate is None:
+            return iter(instances)
+        return (instance for instance in instances if predicate(instance))
+
+
+def compile_where(expression):
+    return Selection(expression)
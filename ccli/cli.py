@@ -0,0 +1,24 @@
+"""
+Console entry point.
+
+A command is handed to a running ``ccli daemon`` before anything heavy is
+imported, and runs in-process when there is none.
+"""
+import sys
+
+from .core import daemon
+
+
+def main():
+    argv = sys.argv[1:]
+    if daemon.should_forward(argv):
+        code = daemon.forward(argv)
+        if code is not None:
+            sys.exit(code)
+
+    from .main import main as run_in_process
+    run_in_process()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,167 @@
 # -*- coding: utf-8 -*-
+import json
 import os
 from pprint import pprint
 
 from cement import Controller, ex, shell
-from PyInquirer import prompt, print_json, Separator
-from examples import custom_style_3
+from cement.utils import fs
 
-from libcloud.compute.types import Provider
-from libcloud.compute.providers import get_driver
+# only light modules here, the commands import boto3, PyInquirer and the
+# rest of ccli.aws when they are dispatched, see test_startup.py
+from ..aws.export import COMPRESSIONS, export_ndjson, json_default
+from ..aws.fields import compile_fields
+from ..aws.where import compile_where
+from ..core.exc import ccliError
 
-EC2_ACCESS_ID = os.environ['AWS_ACCESS_KEY_ID']
-EC2_SECRET_KEY = os.environ['AWS_SECRET_ACCESS_KEY']
+# inventory stores by path, open for the life of the process
+_inventories = {}
 
-EC2Driver = get_driver(Provider.EC2)
-EC2_ = EC2Driver(EC2_ACCESS_ID, EC2_SECRET_KEY)
+REGIONS_ARG = (['--regions'],
+               {'help': "regions to work on, 'all' or a comma separated list",
+                'dest': 'regions'})
 
+INSTANCE_IDS_ARG = (['-i', '--instance-ids'],
+                    {'help': 'comma separated instance IDs',
+                     'dest': 'instance_ids'})
 
-def get_template_list():
-    response = tmp.describe_launch_templates()
+WHERE_ARG = (['-w', '--where'],
+             {'help': "select instances, e.g. 'tag:env=prod and state=running'",
+              'dest': 'where'})
 
-    template_list = []
-    for template in response.get('LaunchTemplates'):
-        template_list.append(template['LaunchTemplateName'])
+EXPORT_ARG = (['--export'],
+              {'help': 'stream all instances into this file as NDJSON',
+               'dest': 'export'})
 
-    return template_list
+COMPRESS_ARG = (['--compress'],
+                {'help': 'compress the export, guessed from .gz/.zst if unset',
+                 'choices': COMPRESSIONS,
+                 'dest': 'compress'})
 
+LOCAL_ARG = (['--local'],
+             {'help': 'answer from the local inventory, see "ccli aws sync"',
+              'action': 'store_true',
+              'dest': 'local'})
 
-def get_key_pair_list():
-    key_pairs = key_pair_operation.desc_keys()
-    key_name = [key['KeyName'] for key in key_pairs.get('KeyPairs')]
+MAX_AGE_ARG = (['--max-age'],
+               {'help': 'seconds the local inventory may be old',
+                'type': int,
+                'dest': 'max_age'})
 
-    return key_name
+FIELDS_ARG = (['--fields'],
+              {'help': "fields to keep, e.g. 'id,state,private_ip,tag:Name', dotted "
+                       "paths or a JMESPath expression",
+               'dest': 'fields'})
+
+REFRESH_ARG = (['--refresh'],
+               {'help': 'ignore cached resources and fetch them again',
+                'action': 'store_true',
+                'dest': 'refresh'})
+
+
+def ask(questions):
+    """
+    Asks ``questions`` with PyInquirer, which is imported on first use.
+    """
+    from PyInquirer import prompt
+    from examples import custom_style_3
+
+    return prompt(questions, style=custom_style_3)
+
+
+def open_inventory(app):
+    from ..aws.inventory import InventoryStore
+
+    inventory_file = fs.abspath(app.config.get('aws', 'inventory_file'))
+
+    inventory_dir = os.path.dirname(inventory_file)
+    if not os.path.exists(inventory_dir):
+        os.makedirs(inventory_dir)
+
+    store = _inventories.get(inventory_file)
+    if store is None:
+        store = _inventories[inventory_file] = InventoryStore(inventory_file)
+
+    return store
+
+
+def get_template_list(templates, refresh=False):
+    return templates.names(refresh=refresh)
+
+
+def get_ami_list(id_=False, name=False):
+    from ..aws.ec2 import AMIS
+
+    amis = AMIS
+    if id_:
+        amis_id = [ami['id'] for ami in amis]
+
+        return amis_id
+    elif name:
+        amis_names = [ami['name'] for ami in amis]
+
+        return amis_names
+    else:
+        return amis
+
+
+def get_key_pair_list(cache, refresh=False):
+    """
+    Returns the key pairs of the region as ``KeyPair`` records.
+    """
+    from ..aws.records import KeyPair
+
+    def load():
+        from ..aws.ec2_key import KeyPairOperation
+
+        key_pairs = KeyPairOperation().desc_keys()
+
+        return [KeyPair.from_api(key).as_dict() for key in key_pairs.get('KeyPairs')]
+
+    try:
+        return [KeyPair(**key) for key in cache.get('key_pairs', load, refresh=refresh)]
+    except TypeError:
+        # cached by an older ccli as plain names
+        return [KeyPair(**key) for key in cache.get('key_pairs', load, refresh=True)]
+
+
+def get_topology(cache, refresh=False):
+    from ..aws.vpc import load_topology
+
+    return load_topology(cache, refresh=refresh)
+
+
+def subnet_choices(topology):
+    """
+    Lists the subnets as prompt choices with their AZ, VPC and free addresses.
+    """
+    subnets = sorted(topology.subnets, key=lambda subnet: (subnet.az, -subnet.free))
+
+    return [{'name': '%s  %s  %s  %-18s %d free' % (subnet.subnet_id, subnet.az, subnet.vpc_id,
+                                                     subnet.cidr, subnet.free),
+             'value': subnet.subnet_id}
+            for subnet in subnets]
+
+
+def parse_instance_ids(value):
+    """
+    Splits a comma separated ``-i`` value, which has to name an instance.
+    """
+    instance_ids = [i.strip() for i in value.split(',') if i.strip()]
+    if not instance_ids:
+        raise ccliError('no instance ID given: %r' % value)
+
+    return instance_ids
+
+
+def validate_count(value):
+    """
+    PyInquirer ``validate`` of an instance count, empty keeps the default.
+    """
+    value = value.strip()
+    if not value or (value.isdigit() and int(value) > 0):
+        return True
+
+    return 'Enter a positive whole number'
 
 
 class AWS(Controller):
@@ -43,6 +174,57 @@ class AWS(Controller):
         title = 'AWS commands'
         description = 'Managing AWS Cloud'
 
+    @ex(help='refresh the local instance inventory', arguments=[REGIONS_ARG])
+    def sync(self):
+        from ..aws.ec2 import iter_instances
+        from ..aws.regions import fan_out, operations, parse_regions
+
+        regions = [self.app.config.get('aws', 'region')]
+        if self.app.pargs.regions:
+            regions = parse_regions(self.app.pargs.regions)
+
+        store = open_inventory(self.app)
+        ops = operations(regions, self.app.config.get('aws', 'page_size'))
+        # the inventory keeps the whole describe_instances payload
+        results = fan_out(lambda region: store.sync(region, iter_instances(ops[region].client,
+                                                                           ops[region].page_size)),
+                          regions, self.app.config.get('aws', 'max_workers'))
+
+        for result in results:
+            if result.error is not None:
+                self.app.log.error('%s: %s' % (result.region, result.error))
+                continue
+            print('{0}: {added} added, {updated} updated, {deleted} deleted, '
+                  '{unchanged} unchanged'.format(result.region, **result.value))
+
+    @ex(help='show the VPC, subnet and route table holding an IP address',
+        arguments=[(['address'], {'help': 'IP address'}), REFRESH_ARG])
+    def locate(self):
+        topology = get_topology(self.app.resource_cache, self.app.pargs.refresh)
+
+        try:
+            vpcs = topology.vpc_of(self.app.pargs.address)
+        except ValueError as e:
+            raise ccliError(str(e))
+        if not vpcs:
+            print('%s is in no VPC' % self.app.pargs.address)
+            return
+
+        for vpc in vpcs:
+            print('VPC: %s (%s)' % (vpc.vpc_id, ', '.join(vpc.cidrs)))
+            for subnet in topology.subnet_of(self.app.pargs.address, vpc.vpc_id):
+                table = topology.route_table_of(subnet.subnet_id)
+                print('  Subnet: %s %s in %s, %d free' % (subnet.subnet_id, subnet.cidr,
+                                                          subnet.az, subnet.free))
+                print('  Route table: %s' % (table.route_table_id if table else '-'))
+
+    @ex(help='forget the cached permission verdicts, e.g. after an IAM policy change')
+    def forget_permissions(self):
+        from ..aws.permissions import verdicts
+
+        verdicts.clear()
+        print('permission verdicts cleared')
+
 
 class EC2(Controller):
 
@@ -54,39 +236,214 @@ class EC2(Controller):
         title = 'EC2 operations'
         description = 'Operating EC2 instances'
 
-    @ex(help='List instances')
+    def __init__(self):
+        super().__init__()
+        self._ec2 = None
+
+    def _operation(self):
+        # not a property, cement looks at every attribute while collecting commands
+        if self._ec2 is None:
+            from ..aws.ec2 import EC2Operation
+
+            self._ec2 = EC2Operation(page_size=self.app.config.get('aws', 'page_size'))
+
+        return self._ec2
+
+    def _region_errors(self, results):
+        for result in results:
+            if result.error is not None:
+                self.app.log.error('%s: %s' % (result.region, result.error))
+            else:
+                yield result
+
+    def _selection(self):
+        where = self.app.pargs.where
+
+        return compile_where(where) if where else None
+
+    def _fields(self):
+        fields = getattr(self.app.pargs, 'fields', None)
+
+        return compile_fields(fields) if fields else None
+
+    def _select_instances(self, selection, instance_ids=None, fields=None):
+        from ..aws.regions import iter_instances_in_regions, parse_regions
+
+        if self.app.pargs.local:
+            regions = [self.app.config.get('aws', 'region')]
+            if self.app.pargs.regions:
+                regions = parse_regions(self.app.pargs.regions)
+            max_age = self.app.pargs.max_age
+            if max_age is None:
+                max_age = self.app.config.get('aws', 'inventory_max_age')
+            instances = open_inventory(self.app).select(selection, regions, max_age)
+        elif not self.app.pargs.regions:
+            return self._operation().select_instances(selection, instance_ids, fields)
+        else:
+            results = iter_instances_in_regions(parse_regions(self.app.pargs.regions),
+                                                page_size=self._operation().page_size,
+                                                max_workers=self.app.config.get('aws', 'max_workers'),
+                                                selection=selection, instance_ids=instance_ids,
+                                                fields=fields)
+            # records know their region, a JMESPath projection may leave
+            # something else than a dict
+            return (dict(result.value, Region=result.region)
+                    if isinstance(result.value, dict) else result.value
+                    for result in self._region_errors(results))
+
+        if instance_ids:
+            instance_ids = set(instance_ids)
+            instances = (i for i in instances if i['InstanceId'] in instance_ids)
+        if fields is not None:
+            return fields.select(instances)
+
+        from ..aws.records import Instance
+
+        return (Instance.from_api(instance) for instance in instances)
+
+    def _lifecycle(self, action):
+        from ..aws.ec2 import get_all_instance
+        from ..aws.regions import LIFECYCLE_ACTIONS, parse_regions, run_in_regions
+        from ..aws.waiter import get_engine
+
+        selection = self._selection()
+        instance_ids = None
+        if self.app.pargs.instance_ids is not None:
+            instance_ids = parse_instance_ids(self.app.pargs.instance_ids)
+        elif selection is None:
+            instance_id = shell.Prompt("Select instance ID",
+                                       options=get_all_instance(page_size=self._operation().page_size),
+                                       numbered=True)
+            instance_ids = [instance_id.input]
+
+        if not self.app.pargs.regions:
+            if selection is not None:
+                instance_ids = [i.instance_id for i in self._operation().select_instances(selection, instance_ids)]
+            getattr(self._operation(), LIFECYCLE_ACTIONS[action])(instance_ids)
+            return
+
+        regions = parse_regions(self.app.pargs.regions)
+        results = run_in_regions(action, instance_ids, regions,
+                                 page_size=self._operation().page_size,
+                                 max_workers=self.app.config.get('aws', 'max_workers'),
+                                 selection=selection)
+
+        found = set()
+        for result in self._region_errors(results):
+            found.update(result.value)
+
+        for transition in get_engine().wait():
+            self.app.log.warning('%s did not reach %s' % (transition.instance_id, transition.target))
+
+        missing = [i for i in instance_ids or [] if i not in found]
+        if missing:
+            self.app.log.warning('not found in %s: %s' % (', '.join(regions), ', '.join(missing)))
+
+    @ex(help='List instances',
+        arguments=[REGIONS_ARG, WHERE_ARG, FIELDS_ARG, EXPORT_ARG, COMPRESS_ARG, LOCAL_ARG,
+                   MAX_AGE_ARG])
     def list(self):
         from ..aws.ec2 import get_all_instance
 
+        export = self.app.pargs.export
+        selection = self._selection()
+        fields = self._fields()
+
+        if self.app.pargs.regions or selection is not None or export or self.app.pargs.local:
+            instances = self._select_instances(selection, fields=fields)
+            if export:
+                count = export_ndjson(instances, export, self.app.pargs.compress)
+                print(f'{count} instances written to {export}')
+                return
+            for instance in instances:
+                print(json.dumps(instance, default=json_default, indent=4))
+            return
+
         all_instance = False
         save_to_file = False
 
         allInstances = shell.Prompt("Do you want to list all instances?",
                                     options=['yes', 'no'], numbered=True)
 
-        if allInstances.prompt() == 'yes':
+        if allInstances.input == 'yes':
             all_instance = True
-        elif allInstances.prompt() == 'no':
-            instances = get_all_instance()
+        else:
+            instances = get_all_instance(page_size=self._operation().page_size)
             instance_id = shell.Prompt("Select instance ID",
                                        options=instances, numbered=True)
 
-            self.ec2_.instance_ids = instance_id
+            self._operation().instance_ids = instance_id.input
 
         saveToFile = shell.Prompt("Do you want to save data into JSON?",
                                   options=['yes', 'no'], numbered=True)
 
-        if saveToFile.prompt() == 'yes':
+        if saveToFile.input == 'yes':
             save_to_file = True
 
-        self.ec2_.desc_instances(all_instance=all_instance, save_to_file=save_to_file)
-
-    @ex(help='create new instance')
+        self._operation().desc_instances(all_instance=all_instance, save_to_file=save_to_file,
+                                         fields=fields)
+
+    @ex(help='show the state of instances',
+        arguments=[INSTANCE_IDS_ARG, WHERE_ARG, REGIONS_ARG, LOCAL_ARG, MAX_AGE_ARG])
+    def status(self):
+        instance_ids = None
+        if self.app.pargs.instance_ids is not None:
+            instance_ids = parse_instance_ids(self.app.pargs.instance_ids)
+
+        for instance in self._select_instances(self._selection(), instance_ids):
+            print("Instance ", instance.instance_id, ": ", instance.state)
+
+    @ex(help='create new instances, spread over the subnets with free addresses',
+        arguments=[REFRESH_ARG,
+                   (['-t', '--template'],
+                    {'help': 'launch template to use, skips the questions',
+                     'dest': 'template'}),
+                   (['-n', '--count'],
+                    {'help': 'number of instances',
+                     'type': int,
+                     'dest': 'count'}),
+                   (['--subnets'],
+                    {'help': "comma separated subnet IDs, default: the template's VPC",
+                     'dest': 'subnets'}),
+                   (['--pipeline'],
+                    {'help': 'report every instance as soon as it passed its '
+                             'status checks and got its addresses',
+                     'action': 'store_true',
+                     'dest': 'pipeline'})])
     def create(self):
-        template_list = get_template_list()
+        from ..aws.ec2 import INSTANCE_TYPES, LaunchEC2
+
+        refresh = self.app.pargs.refresh
+        subnet_ids = None
+        if self.app.pargs.subnets:
+            subnet_ids = [s.strip() for s in self.app.pargs.subnets.split(',') if s.strip()]
+
+        if self.app.pargs.template:
+            count = self.app.pargs.count or 1
+            LaunchEC2.run_instance(max_cnt=count, min_cnt=count, subnet_ids=subnet_ids,
+                                   pipelined=self.app.pargs.pipeline,
+                                   template_name=self.app.pargs.template,
+                                   topology=get_topology(self.app.resource_cache, refresh))
+            # the free addresses of the subnets changed
+            self.app.resource_cache.invalidate('topology')
+            return
+
+        from ..core.prefetch import Prefetch
+
+        # loaded while the first questions are answered
+        prefetch = Prefetch({
+            'templates': lambda: get_template_list(self.app.templates, refresh),
+            'key_pairs': lambda: get_key_pair_list(self.app.resource_cache, refresh),
+            'topology': lambda: get_topology(self.app.resource_cache, refresh),
+        })
         ami_names = get_ami_list(name=True)
-        amis_id = get_ami_list(id_=True)
-        key_pairs = get_key_pair_list()
+        ami_ids = dict(zip(ami_names, get_ami_list(id_=True)))
+
+        def use_template(answers):
+            return answers['use template']
+
+        def no_template(answers):
+            return not answers['use template']
 
         questions = [
             {
@@ -99,64 +456,75 @@ class EC2(Controller):
                 'type': 'list',
                 'name': 'template list',
                 'message': 'Select Template',
-                'choices': template_list,
-                'when': lambda answers: answers['use template']
+                'choices': prefetch.choices('templates', when=use_template),
+                'when': use_template
             },
             {
                 'type': 'list',
                 'name': 'ami list',
                 'message': 'Select AMI(Amazon Machine Image)',
                 'choices': ami_names,
+                'when': no_template
             },
             {
                 'type': 'list',
                 'name': 'instance type',
                 'message': 'Select Instance type',
                 'choices': INSTANCE_TYPES,
+                'when': no_template
             },
             {
                 'type': 'list',
                 'name': 'key name',
                 'message': 'Select Key Pair',
-                'choices': key_pairs,
+                'choices': prefetch.choices('key_pairs', 'name', when=no_template),
+                'when': no_template
             },
             {
                 'type': 'input',
                 'name': 'instance count',
                 'message': 'How many instaces?',
+                'default': '1',
+                'validate': validate_count,
             },
-            {
-                'type'
-            }
         ]
 
-        answers = prompt(questions, style=custom_style_3)
-
-        try:
-            if answers['use template']:
-                LaunchEC2.run_instance(template_name=answers['use template'])
-        except KeyError:
-            LaunchEC2.run_instance(answers)
+        answers = ask(questions)
+        count = int(answers['instance count'].strip() or 1)
+
+        if answers['use template']:
+            LaunchEC2.run_instance(max_cnt=count, min_cnt=count, subnet_ids=subnet_ids,
+                                   pipelined=self.app.pargs.pipeline,
+                                   template_name=answers['template list'],
+                                   topology=prefetch.get('topology'))
+        else:
+            LaunchEC2.run_instance(max_cnt=count, min_cnt=count, subnet_ids=subnet_ids,
+                                   pipelined=self.app.pargs.pipeline,
+                                   topology=prefetch.get('topology'),
+                                   ImageId=ami_ids[answers['ami list']],
+                                   InstanceType=answers['instance type'],
+                                   KeyName=answers['key name'])
+        self.app.resource_cache.invalidate('topology')
 
     @ex(help='delete an instance')
     def delete(self):
         pass
 
-    @ex(help='start an instance')
+    @ex(help='start instances', arguments=[INSTANCE_IDS_ARG, WHERE_ARG, REGIONS_ARG])
     def start(self):
-        pass
+        self._lifecycle('start')
 
-    @ex(help='stop an instance')
+    @ex(help='stop instances', arguments=[INSTANCE_IDS_ARG, WHERE_ARG, REGIONS_ARG])
     def stop(self):
-        pass
+        self._lifecycle('stop')
 
-    @ex(help='reboot an instance')
+    @ex(help='reboot instances', arguments=[INSTANCE_IDS_ARG, WHERE_ARG, REGIONS_ARG])
     def reboot(self):
-        pass
+        self._lifecycle('reboot')
 
-    @ex(help='terminate an instance')
+    @ex(help='terminate instances', arguments=[INSTANCE_IDS_ARG, WHERE_ARG, REGIONS_ARG])
     def terminate(self):
-        pass
+        self._lifecycle('terminate')
 
 
 class Templates(Controller):
@@ -169,23 +537,31 @@ class Templates(Controller):
         title = 'Managing EC2 templates'
         description = 'Managing EC2 Templates'
 
-    @ex(help='create templates')
+    @ex(help='create templates', arguments=[REFRESH_ARG])
     def create_templates(self):
-        ami_names = get_ami_list(name=True)
-        amis_id = get_ami_list(id_=True)
+        from ..aws.ec2 import INSTANCE_TYPES
+        from ..aws.ec2 import EC2Templates as tmp
+        from ..core.prefetch import Prefetch
 
-        security_groups = SecurityGroups.describe_security_groups()
-        sg_names = [security_group['GroupName'] for security_group in security_groups.get('SecurityGroups')]
-        sg_ids = [security_group['GroupId'] for security_group in security_groups.get('SecurityGroups')]
+        refresh = self.app.pargs.refresh
+        cache = self.app.resource_cache
 
-        subnets = vpc_.describe_subnets()
-        subnet_id = [subnet['SubnetId'] for subnet in subnets.get('Subnets')]
-        cidr_block = [subnet['CidrBlock'] for subnet in subnets.get('Subnets')]
+        # the lookups run while the first questions are answered, each list
+        # question only waits for its own choices
+        prefetch = Prefetch({
+            'topology': lambda: get_topology(cache, refresh),
+            'key_pairs': lambda: get_key_pair_list(cache, refresh),
+        })
 
-        zones = availability_zones()
-        zone_names = [zone['ZoneName'] for zone in zones.get('AvailabilityZones')]
+        def security_group_choices(answers):
+            topology = prefetch.get('topology')
+            vpc_id = topology.subnets[answers['subnet id']].vpc_id
 
-        key_name = get_key_pair_list()
+            return [{'name': '%s  %s' % (group.name, group.group_id), 'value': group.group_id}
+                    for group in topology.security_groups_of(vpc_id)]
+
+        ami_names = get_ami_list(name=True)
+        ami_ids = dict(zip(ami_names, get_ami_list(id_=True)))
 
         questions = [
             {
@@ -211,29 +587,23 @@ class Templates(Controller):
                 'message': 'Do you want to use publc address?',
                 'default': True,
             },
-            {
-                'type': 'list',
-                'name': 'security group',
-                'message': 'Select Security Group',
-                'choices': sg_names,
-            },
             {
                 'type': 'list',
                 'name': 'subnet id',
                 'message': 'Select subnet',
-                'choices': subnet_id,
+                'choices': lambda answers: subnet_choices(prefetch.get('topology')),
             },
             {
                 'type': 'list',
-                'name': 'availability zone',
-                'message': 'Select Availability Zone',
-                'choices': zone_names,
+                'name': 'security group',
+                'message': 'Select Security Group',
+                'choices': security_group_choices,
             },
             {
                 'type': 'list',
                 'name': 'key pair',
                 'message': 'Select Key Pair',
-                'choices': key_name,
+                'choices': prefetch.choices('key_pairs', 'name'),
             },
             {
                 'type': 'list',
@@ -261,10 +631,11 @@ class Templates(Controller):
             }
         ]
 
-        answers = prompt(questions, style=custom_style_3)
+        answers = ask(questions)
+        subnet = prefetch.get('topology').subnets[answers['subnet id']]
 
         template_data = {
-            'ImageId': amis_id[ami_names.index(answers['image name'])],
+            'ImageId': ami_ids[answers['image name']],
             'KeyName': answers['key pair'],
             'InstanceType': answers['instance type'],
             'NetworkInterfaces': [
@@ -273,12 +644,12 @@ class Templates(Controller):
                     'AssociatePublicIpAddress': answers['public address'],
                     'DeleteOnTermination': True,
                     'Groups': [
-                        sg_ids[sg_names.index(answers['security group'])]
+                        answers['security group']
                     ],
                 },
             ],
             'Placement': {
-                'AvailabilityZone': answers['availability zone'],
+                'AvailabilityZone': subnet.az,
                 'Tenancy': 'default',
             },
             'DisableApiTermination': False,
@@ -300,10 +671,13 @@ class Templates(Controller):
             pass
 
         tmp.create_launch_template(template_name=answers['template name'], template_data=template_data)
+        self.app.templates.invalidate()
 
-    @ex(help='delete template')
+    @ex(help='delete template', arguments=[REFRESH_ARG])
     def delete_template(self):
-        template_list = get_template_list()
+        from ..aws.ec2 import EC2Templates as tmp
+
+        template_list = get_template_list(self.app.templates, self.app.pargs.refresh)
 
         questions = {
             'type': 'list',
@@ -312,13 +686,111 @@ class Templates(Controller):
             'choices': template_list
         }
 
-        answers = prompt(questions, style=custom_style_3)
+        answers = ask(questions)
 
         tmp.delete_launch_template(template_name=answers['template name'])
+        self.app.templates.invalidate()
 
-    @ex(help='list template')
+    @ex(help='list template', arguments=[REFRESH_ARG])
     def list_template(self):
-        template_list = get_template_list()
+        template_list = get_template_list(self.app.templates, self.app.pargs.refresh)
 
         pprint(template_list)
 
+    @ex(help='apply a directory of YAML template specs, skipping unchanged ones',
+        arguments=[(['directory'], {'help': 'directory of *.yml template specs'})])
+    def sync_templates(self):
+        from ..aws.templates import load_specs, sync_specs
+
+        specs = load_specs(self.app.pargs.directory)
+        results = sync_specs(specs, self.app.templates,
+                             max_workers=self.app.config.get('aws', 'max_workers'))
+
+        failed = 0
+        for name, outcome in results:
+            if isinstance(outcome, Exception):
+                failed += 1
+                outcome = 'failed: %s' % outcome
+            print(name, " - ", outcome)
+
+        if failed:
+            self.app.exit_code = 1
+
+
+class Keys(Controller):
+
+    class Meta:
+        label = 'keys'
+        stacked_type = 'embedded'
+        stacked_on = 'ec2'
+        help = 'Managing EC2 key pairs'
+        title = 'Managing EC2 key pairs'
+        description = 'Managing EC2 key pairs'
+
+    @ex(help='create key pair',
+        arguments=[(['key_name'], {'help': 'key pair name'})])
+    def create_key(self):
+        from ..aws.ec2_key import KeyPairOperation
+
+        key_pair_operation = KeyPairOperation()
+        key_pair_operation.key_name = self.app.pargs.key_name
+        key_pair_operation.create_key()
+        self.app.resource_cache.invalidate('key_pairs')
+
+    @ex(help='delete key pair',
+        arguments=[(['key_name'], {'help': 'key pair name'})])
+    def delete_key(self):
+        from ..aws.ec2_key import KeyPairOperation
+
+        key_pair_operation = KeyPairOperation()
+        key_pair_operation.key_name = self.app.pargs.key_name
+        key_pair_operation.del_key()
+        self.app.resource_cache.invalidate('key_pairs')
+
+    @ex(help='import a public key into every region, or remove it, where it differs',
+        arguments=[(['key_name'], {'help': 'key pair name'}),
+                   (['--public-key'],
+                    {'help': 'OpenSSH public key file to import',
+                     'dest': 'public_key'}),
+                   (['--remove'],
+                    {'help': 'delete the key pair instead',
+                     'action': 'store_true',
+                     'dest': 'remove'}),
+                   (['--dry-run'],
+                    {'help': 'only show the regions that would change',
+                     'action': 'store_true',
+                     'dest': 'dry_run'}),
+                   REGIONS_ARG, REFRESH_ARG])
+    def sync_keys(self):
+        from ..aws.ec2_key import sync_key_pair
+        from ..aws.regions import parse_regions
+
+        pargs = self.app.pargs
+        if pargs.remove == bool(pargs.public_key):
+            raise ccliError('give either --public-key or --remove')
+
+        public_key = None
+        if pargs.public_key:
+            with open(fs.abspath(pargs.public_key)) as fp:
+                public_key = fp.read()
+
+        regions = [self.app.config.get('aws', 'region')]
+        if pargs.regions:
+            regions = parse_regions(pargs.regions)
+
+        results = sync_key_pair(pargs.key_name, public_key, regions,
+                                cache=self.app.resource_cache, refresh=pargs.refresh,
+                                dry_run=pargs.dry_run,
+                                max_workers=self.app.config.get('aws', 'max_workers'))
+        for result in sorted(results, key=lambda result: result.region):
+            if result.error is not None:
+                self.app.log.error('%s: %s' % (result.region, result.error))
+            elif result.value is None:
+                print('%s: up to date' % result.region)
+            else:
+                print('%s: %s%s' % (result.region, result.value, ' (dry run)' if pargs.dry_run else ''))
+
+    @ex(help='list key pairs', arguments=[REFRESH_ARG])
+    def list_keys(self):
+        pprint([key.name for key in get_key_pair_list(self.app.resource_cache, self.app.pargs.refresh)])
+
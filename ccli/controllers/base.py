@@ -25,9 +25,32 @@ class Base(Controller):
             (['-v', '--version'],
              {'action': 'version',
               'version': VERSION_BANNER}),
+            (['--profile-calls'],
+             {'help': 'time every AWS API call and CLI phase, print a summary',
+              'action': 'store_true',
+              'dest': 'profile_calls'}),
+            (['--profile-trace'],
+             {'help': 'also write the timings as Chrome trace JSON to this file',
+              'dest': 'profile_trace'}),
+            (['--recheck-permissions'],
+             {'help': 'call AWS even for actions a cached verdict denies',
+              'action': 'store_true',
+              'dest': 'recheck_permissions'}),
         ]
 
     def _default(self):
         """Default action if no sub-command is passed."""
 
         self.app.args.print_help()
+
+    @ex(help='keep clients, caches and storage warm and run forwarded commands',
+        arguments=[(['--socket'],
+                    {'help': 'Unix socket to listen on, default: ~/.ccli/daemon.sock',
+                     'dest': 'socket'})])
+    def daemon(self):
+        from ..core.daemon import serve, socket_path
+        from ..main import run_forwarded
+
+        path = self.app.pargs.socket or socket_path()
+        self.app.log.info('listening on %s' % path)
+        serve(run_forwarded, path)
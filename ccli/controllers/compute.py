@@ -1,9 +1,39 @@
 # -*- coding: utf-8 -*-
-from pprint import pprint
+import json
 
-from cement import Controller, ex, shell
-from PyInquirer import prompt, print_json, Separator
-from examples import custom_style_3
+from cement import Controller, ex
+
+from ..core.exc import ccliError
+
+# ccli.Libcloud.compute.KINDS, not imported until a command runs
+KINDS = ('nodes', 'sizes', 'images')
+
+
+def compute_providers(app):
+    """
+    Returns the configured compute providers, EC2 ones default to the
+    region and credentials of the AWS profile.
+    """
+    providers = [dict(entry) for entry in app.config.get('compute', 'providers') or []]
+
+    for entry in providers:
+        if entry.get('provider', '').lower() != 'ec2':
+            continue
+        if not (entry.get('region') or entry.get('regions')):
+            entry['region'] = app.config.get('aws', 'region')
+        if not entry.get('key'):
+            from ..aws.client import get_session
+
+            credentials = get_session().get_credentials()
+            if credentials is None:
+                raise ccliError('no AWS credentials found for compute provider %s'
+                                % (entry.get('name') or entry['provider']))
+            credentials = credentials.get_frozen_credentials()
+            entry.update(key=credentials.access_key, secret=credentials.secret_key)
+            if credentials.token:
+                entry['token'] = credentials.token
+
+    return providers
 
 
 class Compute(Controller):
@@ -16,12 +46,31 @@ class Compute(Controller):
         title = 'Multi Public Compute'
         description = 'Managing Multi Public Compute'
 
+    @ex(help='list nodes, sizes or images of every configured provider',
+        arguments=[(['--kind'],
+                    {'help': 'what to list, default: nodes',
+                     'choices': KINDS,
+                     'default': 'nodes',
+                     'dest': 'kind'}),
+                   (['--providers'],
+                    {'help': 'comma separated provider names, default: all configured',
+                     'dest': 'providers'})])
+    def list(self):
+        from ..Libcloud.compute import list_resources, targets
+
+        providers = compute_providers(self.app)
+        if self.app.pargs.providers:
+            names = {name.strip() for name in self.app.pargs.providers.split(',')}
+            providers = [entry for entry in providers
+                         if (entry.get('name') or entry.get('provider')) in names]
+
+        results = list_resources(self.app.pargs.kind,
+                                 targets(providers),
+                                 self.app.config.get('compute', 'max_workers'))
+        for result in results:
+            if result.error is not None:
+                target = result.target
+                self.app.log.error('%s %s: %s' % (target.name, target.region or '-', result.error))
+                continue
+            print(json.dumps(result.value._asdict()))
 
-class EC2(Controller):
-    class Meta:
-        label = 'ec2'
-        stacked_type = 'embedded'
-        stacked_on = 'compute'
-        help = 'manage EC2'
-        title = 'EC2 operations'
-        description = 'Operating EC2 instances'
@@ -0,0 +1,230 @@
+"""
+Resident ``ccli daemon`` and the client side forwarding commands to it.
+
+The daemon keeps one process with warm AWS clients, caches and open storage
+and runs the forwarded commands one at a time. Requests and replies are
+JSON lines over a Unix socket; the client half only needs the standard
+library, so forwarding skips importing cement and boto3 altogether.
+"""
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+SOCKET = os.path.join(os.path.expanduser('~'), '.ccli', 'daemon.sock')
+
+# CCLI_DAEMON=0 never forwards, CCLI_DAEMON=1 forwards from a terminal too
+ENV = 'CCLI_DAEMON'
+SOCKET_ENV = 'CCLI_DAEMON_SOCKET'
+
+# variables choosing the account, region and configuration of a command;
+# the daemon only runs commands whose values match its own
+ENV_PREFIXES = ('AWS_', 'BOTO_', 'CCLI_')
+
+# commands that prompt, unless given one of the options
+INTERACTIVE = (
+    (('aws', 'ec2', 'list'), ('--regions', '-w', '--where', '--export', '--local')),
+    (('aws', 'ec2', 'start'), ('-i', '--instance-ids', '-w', '--where')),
+    (('aws', 'ec2', 'stop'), ('-i', '--instance-ids', '-w', '--where')),
+    (('aws', 'ec2', 'reboot'), ('-i', '--instance-ids', '-w', '--where')),
+    (('aws', 'ec2', 'terminate'), ('-i', '--instance-ids', '-w', '--where')),
+    (('aws', 'ec2', 'create'), ('-t', '--template')),
+    (('aws', 'ec2', 'templates', 'create-templates'), ()),
+    (('aws', 'ec2', 'templates', 'delete-template'), ()),
+)
+
+
+def socket_path():
+    return os.environ.get(SOCKET_ENV) or SOCKET
+
+
+def command_env(environ=None):
+    """
+    Returns the variables of ``environ`` a command depends on.
+    """
+    environ = os.environ if environ is None else environ
+    return {name: value for name, value in environ.items()
+            if name.startswith(ENV_PREFIXES) and name not in (ENV, SOCKET_ENV)}
+
+
+def is_interactive(argv):
+    words = [arg for arg in argv if not arg.startswith('-')]
+    for command, options in INTERACTIVE:
+        for i in range(len(words) - len(command) + 1):
+            if tuple(words[i:i + len(command)]) == command:
+                return not any(arg.split('=', 1)[0] in options for arg in argv)
+
+    return False
+
+
+def should_forward(argv, stdin=None):
+    """
+    Tells whether a command line goes to the daemon.
+
+    Commands typed at a terminal run in-process, as they may prompt, and so
+    do the prompting commands anywhere: the daemon has no terminal.
+    """
+    setting = os.environ.get(ENV)
+    if setting == '0' or (argv and argv[0] == 'daemon') or is_interactive(argv):
+        return False
+    if setting == '1':
+        return True
+
+    stdin = sys.stdin if stdin is None else stdin
+    return not (stdin is not None and stdin.isatty())
+
+
+def forward(argv, path=None, out=None, err=None, env=None):
+    """
+    Runs ``argv`` in the daemon, copying its output to ``out`` and ``err``.
+
+    :param env: variables the command depends on, see ``command_env``
+    :return: the exit code, ``None`` when no daemon is listening or it runs
+             with a different environment
+    """
+    out = out or sys.stdout
+    err = err or sys.stderr
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path or socket_path())
+    except OSError:
+        conn.close()
+        return None
+
+    with conn, conn.makefile('rwb') as fp:
+        fp.write(json.dumps({'argv': list(argv), 'cwd': os.getcwd(),
+                             'env': command_env() if env is None else env}).encode() + b'\n')
+        fp.flush()
+
+        for line in fp:
+            message = json.loads(line)
+            if 'declined' in message:
+                return None
+            if 'exit' in message:
+                return message['exit']
+            (out if message['stream'] == 'out' else err).write(message['data'])
+
+    # the daemon went away in the middle of the command
+    return 1
+
+
+class StreamWriter(io.TextIOBase):
+    """
+    File object sending what is written to the client as JSON lines.
+    """
+
+    def __init__(self, fp, stream):
+        self.fp = fp
+        self.stream = stream
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    def write(self, data):
+        if data:
+            self.fp.write(json.dumps({'stream': self.stream, 'data': data}).encode() + b'\n')
+            self.fp.flush()
+        return len(data)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        request = json.loads(line)
+
+        # clients and sessions were set up from the daemon's environment and
+        # are reused, so a command expecting another account, region or
+        # configuration runs in the caller's process instead
+        if request.get('env') != command_env():
+            self.wfile.write(json.dumps({'declined': 'environment differs'}).encode() + b'\n')
+            return
+
+        # commands share the process state, so they run one at a time
+        with self.server.lock:
+            code = self.run(request)
+
+        self.wfile.write(json.dumps({'exit': code}).encode() + b'\n')
+
+    def run(self, request):
+        cwd = os.getcwd()
+        out = StreamWriter(self.wfile, 'out')
+        err = StreamWriter(self.wfile, 'err')
+        stdin = sys.stdin
+        try:
+            os.chdir(request.get('cwd') or cwd)
+            sys.stdin = io.StringIO('')
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+                try:
+                    return self.server.run_command(request['argv'])
+                except SystemExit as e:
+                    return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                except Exception as e:
+                    print('ccli daemon > %s: %s' % (type(e).__name__, e), file=sys.stderr)
+                    return 1
+        except (BrokenPipeError, ConnectionResetError):
+            return 1
+        finally:
+            sys.stdin = stdin
+            os.chdir(cwd)
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, run_command):
+        self.lock = threading.Lock()
+        self.run_command = run_command
+        super().__init__(path, Handler)
+
+
+def serve(run_command, path=None, ready=None):
+    """
+    Serves forwarded commands until interrupted.
+
+    :param run_command: callable running an argv list, returning its exit code
+    :param path: socket to listen on
+    :param ready: ``threading.Event`` set once the socket accepts commands
+    :return: the ``Server``, after it was shut down
+    """
+    from .exc import ccliError
+
+    path = path or socket_path()
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, mode=0o700)
+
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            # left over by a daemon that did not shut down cleanly
+            os.unlink(path)
+        else:
+            raise ccliError('a daemon is already listening on %s' % path)
+        finally:
+            probe.close()
+
+    server = Server(path, run_command)
+    os.chmod(path, 0o600)
+    if ready is not None:
+        ready.set()
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+    return server
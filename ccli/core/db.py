@@ -0,0 +1,25 @@
+"""
+One lock per TinyDB database.
+
+TinyDB reads and rewrites the whole file on every table update, so the
+stores sharing a database (resource cache, permission verdicts, template
+snapshots) serialize their table operations on the same lock rather than
+one each.
+"""
+import threading
+import weakref
+
+_locks = weakref.WeakKeyDictionary()
+_guard = threading.Lock()
+
+
+def db_lock(db):
+    """
+    Returns the reentrant lock every user of ``db`` holds while touching it.
+    """
+    with _guard:
+        lock = _locks.get(db)
+        if lock is None:
+            lock = _locks[db] = threading.RLock()
+
+        return lock
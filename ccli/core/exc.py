@@ -2,3 +2,8 @@
 class ccliError(Exception):
     """Generic errors."""
     pass
+
+
+class PermissionDenied(ccliError):
+    """The caller is not allowed to run an AWS action."""
+    pass
@@ -0,0 +1,76 @@
+"""
+Bounded fan-out of a callable over independent sources (regions, cloud
+targets, ...) whose results are merged as they arrive.
+"""
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# upper bound of sources worked on at the same time
+MAX_WORKERS = 16
+
+Result = namedtuple('Result', ['source', 'value', 'error'])
+
+
+def merge(func, sources, max_workers=MAX_WORKERS, buffer_size=1000, result=Result):
+    """
+    Runs ``func(source)`` for every source on a bounded worker pool and
+    merges the items of the returned iterables as they arrive.
+
+    A failing source does not stop the others, it yields a single result
+    carrying the exception instead.
+
+    :param func: callable returning an iterable for a source
+    :param sources: list of sources
+    :param max_workers: size of the worker pool
+    :param buffer_size: items buffered before workers wait for the consumer
+    :param result: type built from ``(source, value, error)``
+    :return: generator of ``result``
+    """
+    results = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(source):
+        try:
+            for value in func(source):
+                if not put(result(source, value, None)):
+                    return
+        except Exception as e:
+            put(result(source, None, e))
+        finally:
+            put(done)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(sources))))
+    try:
+        for source in sources:
+            pool.submit(produce, source)
+
+        pending = len(sources)
+        while pending:
+            item = results.get()
+            if item is done:
+                pending -= 1
+                continue
+            yield item
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def fan_out(func, sources, max_workers=MAX_WORKERS, result=Result):
+    """
+    Runs ``func(source)`` for every source on a bounded worker pool, yielding
+    one result per source as soon as it finishes.
+    """
+    return merge(lambda source: (func(source),), sources, max_workers, result=result)
@@ -0,0 +1,65 @@
+"""
+Loads the choices of interactive prompts in the background.
+
+All lookups start at once when a command begins, so the first question
+shows up immediately and each one only waits for its own choices.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from . import profiler
+
+
+class Prefetch:
+    def __init__(self, loaders):
+        """
+        Starts every loader on its own thread.
+
+        :param loaders: dict of name to a callable returning the value
+        """
+        pool = ThreadPoolExecutor(max_workers=max(1, len(loaders)),
+                                  thread_name_prefix='ccli-prefetch')
+        self._futures = {name: pool.submit(self._load, name, loader)
+                         for name, loader in loaders.items()}
+        # threads end with their loader, nothing else is submitted
+        pool.shutdown(wait=False)
+
+    @staticmethod
+    def _load(name, loader):
+        with profiler.phase('prefetch %s' % name):
+            return loader()
+
+    def get(self, name):
+        """
+        Returns the value of ``name``, waiting for its loader if needed.
+
+        A failed loader raises its exception here.
+        """
+        future = self._futures[name]
+        if future.done():
+            return future.result()
+
+        with profiler.phase('wait %s' % name):
+            return future.result()
+
+    def choices(self, name, field=None, when=None):
+        """
+        Returns a callable PyInquirer resolves when the question is shown.
+
+        :param field: key or attribute to pick from each item, the items as
+                      they are if unset
+        :param when: the ``when`` of the question; PyInquirer resolves the
+                     choices before checking it, so a skipped question gets
+                     no choices instead of waiting for, or failing with,
+                     the lookup
+        """
+        def resolve(answers):
+            if when is not None and not when(answers):
+                return []
+
+            items = self.get(name)
+            if field is None:
+                return list(items)
+            return [item[field] if isinstance(item, dict) else getattr(item, field)
+                    for item in items]
+
+        return resolve
@@ -0,0 +1,253 @@
+"""
+Timing of CLI phases and of every AWS API call, enabled by ``--profile-calls``.
+
+Phases are recorded through ``phase()``, which does nothing while profiling
+is off. API calls are recorded by ``attach``, which hooks the botocore
+events of a client once; the hooks write to whichever profiler is current,
+so a daemon profiles every command that asks for it.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# ccli.main imports this module first, so 'started' is the origin of every timing
+marks = {'started': time.perf_counter()}
+
+current = None
+
+
+def mark(name):
+    """
+    Remembers when ``name`` happened, profiling or not.
+    """
+    marks[name] = time.perf_counter()
+
+
+def end_phase(name, since):
+    """
+    Records phase ``name`` from mark ``since`` until now, when profiling.
+    """
+    if current is not None and since in marks:
+        current.add_phase(name, marks[since], time.perf_counter())
+
+
+@contextmanager
+def phase(name):
+    """
+    Times the enclosed block as phase ``name`` of the current profiler.
+    """
+    if current is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.add_phase(name, started, time.perf_counter())
+
+
+def _size(body):
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    return 0
+
+
+class Profiler:
+    def __init__(self, origin=None):
+        self.origin = marks['started'] if origin is None else origin
+        self.calls = []
+        self.phases = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_phase(self, name, started, ended):
+        with self._lock:
+            self.phases.append({'name': name,
+                                'start': started - self.origin,
+                                'duration': ended - started,
+                                'thread': threading.get_ident()})
+
+    def begin_call(self, service, action, region):
+        self._local.call = {'service': service,
+                            'action': action,
+                            'region': region,
+                            'start': time.perf_counter(),
+                            'attempts': 0,
+                            'throttles': 0,
+                            'sent': 0,
+                            'received': 0,
+                            'status': None,
+                            'error': None,
+                            'thread': threading.get_ident()}
+
+    def add_attempt(self, request):
+        call = getattr(self._local, 'call', None)
+        if call is not None:
+            call['attempts'] += 1
+            call['sent'] += _size(request.body)
+
+    def add_response(self, response, throttled):
+        call = getattr(self._local, 'call', None)
+        if call is not None:
+            call['received'] += _size(response[0].content)
+            call['throttles'] += throttled
+
+    def finish_call(self, status, error):
+        call = getattr(self._local, 'call', None)
+        if call is None:
+            return
+        self._local.call = None
+
+        ended = time.perf_counter()
+        call['duration'] = ended - call['start']
+        call['start'] -= self.origin
+        call['status'] = status
+        call['error'] = error
+        call['retries'] = max(0, call['attempts'] - 1)
+        with self._lock:
+            self.calls.append(call)
+
+    def summary(self):
+        """
+        Aggregates the calls per (service, action, region).
+
+        :return: list of dicts sorted by total time, slowest first
+        """
+        with self._lock:
+            calls = list(self.calls)
+
+        rows = {}
+        for call in calls:
+            key = (call['service'], call['action'], call['region'])
+            row = rows.setdefault(key, {'service': key[0], 'action': key[1], 'region': key[2],
+                                        'calls': 0, 'total': 0.0, 'max': 0.0, 'retries': 0,
+                                        'throttles': 0, 'errors': 0, 'sent': 0, 'received': 0})
+            row['calls'] += 1
+            row['total'] += call['duration']
+            row['max'] = max(row['max'], call['duration'])
+            row['retries'] += call['retries']
+            row['throttles'] += call['throttles']
+            row['errors'] += call['error'] is not None
+            row['sent'] += call['sent']
+            row['received'] += call['received']
+
+        return sorted(rows.values(), key=lambda row: row['total'], reverse=True)
+
+    def report(self, out=print):
+        """
+        Prints the phases and the per-action summary table.
+        """
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: p['start'])
+
+        out('%-28s %10s %10s' % ('phase', 'start ms', 'ms'))
+        for p in phases:
+            out('%-28s %10.1f %10.1f' % (p['name'], p['start'] * 1e3, p['duration'] * 1e3))
+
+        out('')
+        out('%-36s %-15s %6s %10s %9s %8s %7s %7s %10s %10s'
+            % ('action', 'region', 'calls', 'total ms', 'mean ms', 'max ms',
+               'retries', 'thrott', 'sent', 'received'))
+        for row in self.summary():
+            out('%-36s %-15s %6d %10.1f %9.1f %8.1f %7d %7d %10d %10d'
+                % ('%s.%s' % (row['service'], row['action']), row['region'], row['calls'],
+                   row['total'] * 1e3, row['total'] / row['calls'] * 1e3, row['max'] * 1e3,
+                   row['retries'], row['throttles'], row['sent'], row['received']))
+
+    def chrome_trace(self, path):
+        """
+        Writes the phases and calls as Chrome trace events, for
+        ``chrome://tracing`` or Perfetto.
+        """
+        with self._lock:
+            phases = list(self.phases)
+            calls = list(self.calls)
+
+        events = []
+        for p in phases:
+            events.append({'name': p['name'], 'cat': 'phase', 'ph': 'X', 'pid': 1,
+                           'tid': p['thread'], 'ts': p['start'] * 1e6,
+                           'dur': p['duration'] * 1e6})
+        for call in calls:
+            events.append({'name': '%s.%s' % (call['service'], call['action']), 'cat': 'api',
+                           'ph': 'X', 'pid': 1, 'tid': call['thread'],
+                           'ts': call['start'] * 1e6, 'dur': call['duration'] * 1e6,
+                           'args': {k: call[k] for k in ('region', 'status', 'error',
+                                                         'retries', 'throttles',
+                                                         'sent', 'received')}})
+
+        with open(path, 'w') as fp:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fp)
+
+
+def enable():
+    """
+    Starts profiling, the phases marked so far are recorded retroactively.
+
+    :return: the new current ``Profiler``
+    """
+    global current
+
+    current = Profiler()
+    for name, start, end in (('import', 'started', 'imported'),
+                             ('setup', 'imported', 'setup_done')):
+        if start in marks and end in marks:
+            current.add_phase(name, marks[start], marks[end])
+
+    return current
+
+
+def disable():
+    global current
+
+    current = None
+
+
+def attach(client):
+    """
+    Records every API call of ``client`` with its latency, attempts,
+    throttled responses and bytes sent and received, into the current
+    profiler.
+
+    The handlers are registered once per client and do nothing while
+    profiling is off.
+    """
+    from ..aws.ratelimit import THROTTLE_CODES
+
+    region = client.meta.region_name
+    service = client.meta.service_model.service_name
+
+    def before_call(event_name=None, **kwargs):
+        if current is not None:
+            current.begin_call(service, event_name.rsplit('.', 1)[-1], region)
+
+    def before_send(request=None, **kwargs):
+        if current is not None:
+            current.add_attempt(request)
+
+    def needs_retry(response=None, **kwargs):
+        if current is not None and response is not None:
+            current.add_response(response,
+                                 response[1].get('Error', {}).get('Code') in THROTTLE_CODES)
+
+    def after_call(http_response=None, parsed=None, **kwargs):
+        if current is not None:
+            current.finish_call(http_response.status_code,
+                            (parsed or {}).get('Error', {}).get('Code'))
+
+    def after_call_error(exception=None, **kwargs):
+        if current is not None:
+            current.finish_call(None, type(exception).__name__)
+
+    events = client.meta.events
+    events.register('before-call', before_call, unique_id='ccli-profile-call')
+    events.register('before-send', before_send, unique_id='ccli-profile-send')
+    events.register('needs-retry', needs_retry, unique_id='ccli-profile-retry')
+    events.register('after-call', after_call, unique_id='ccli-profile-after')
+    events.register('after-call-error', after_call_error, unique_id='ccli-profile-error')
+
+    return client
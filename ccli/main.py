@@ -1,3 +1,6 @@
+# imported first, import timing starts here
+from .core import profiler
+
 import os
 
 from tinydb import TinyDB
@@ -7,12 +10,39 @@ from cement import App, TestApp, init_defaults
 from cement.core.exc import CaughtSignal
 from .core.exc import ccliError
 from .controllers.base import Base
-from .controllers.aws import AWS, EC2, Templates
+from .controllers.aws import AWS, EC2, Templates, Keys
+from .controllers.compute import Compute
+from .aws import client, permissions, ratelimit, waiter
+from .aws.cache import ResourceCache
+from .aws.templates import TemplateSnapshot
 
 
 # configuration defaults
-CONFIG = init_defaults('ccli')
+CONFIG = init_defaults('ccli', 'aws', 'compute')
 CONFIG['ccli']['db_file'] = 'db.json'
+CONFIG['aws']['page_size'] = 1000
+CONFIG['aws']['max_workers'] = 16
+CONFIG['aws']['region'] = client.DEFAULT_REGION
+CONFIG['aws']['profile'] = None
+CONFIG['aws']['tcp_keepalive'] = True
+CONFIG['aws']['cache_ttl'] = {}
+CONFIG['aws']['waiter_min_delay'] = waiter.MIN_DELAY
+CONFIG['aws']['waiter_max_delay'] = waiter.MAX_DELAY
+CONFIG['aws']['waiter_timeout'] = waiter.TIMEOUT
+CONFIG['aws']['permission_ttl'] = permissions.TTL
+CONFIG['aws']['permission_denied_ttl'] = permissions.DENIED_TTL
+CONFIG['aws']['inventory_file'] = 'inventory.db'
+CONFIG['aws']['inventory_max_age'] = 300
+CONFIG['aws']['rate_limit'] = True
+CONFIG['aws']['rate'] = ratelimit.RATE
+CONFIG['aws']['burst'] = ratelimit.BURST
+CONFIG['compute']['providers'] = [{'provider': 'ec2'}]
+CONFIG['compute']['max_workers'] = 16
+
+
+# storage stays open for the life of the process, so the commands a daemon
+# runs one after the other share it
+_storage = {}
 
 
 def extend_tinydb(app):
@@ -28,7 +58,83 @@ def extend_tinydb(app):
     if not os.path.exists(db_dir):
         os.makedirs(db_dir)
 
-    app.extend('db', TinyDB(db_file))
+    db = _storage.get(db_file)
+    if db is None:
+        db = _storage[db_file] = TinyDB(db_file)
+    app.extend('db', db)
+
+
+def extend_cache(app):
+    ttls = app.config.get('aws', 'cache_ttl')
+    app.extend('resource_cache', ResourceCache(app.db, ttls=ttls))
+    key = ('templates', id(app.db))
+    if key not in _storage:
+        _storage[key] = TemplateSnapshot(app.db, ttl=ttls.get('launch_templates'))
+    app.extend('templates', _storage[key])
+    permissions.verdicts.bind(app.db, ttl=app.config.get('aws', 'permission_ttl'),
+                              denied_ttl=app.config.get('aws', 'permission_denied_ttl'))
+
+
+def configure_aws(app):
+    # only records the defaults, clients are created on first use
+    client.configure(region=app.config.get('aws', 'region'),
+                     profile=app.config.get('aws', 'profile'),
+                     max_pool_connections=app.config.get('aws', 'max_workers'),
+                     tcp_keepalive=app.config.get('aws', 'tcp_keepalive'))
+    waiter.configure(min_delay=app.config.get('aws', 'waiter_min_delay'),
+                     max_delay=app.config.get('aws', 'waiter_max_delay'),
+                     timeout=app.config.get('aws', 'waiter_timeout'))
+    if app.config.get('aws', 'rate_limit'):
+        ratelimit.configure(rate=app.config.get('aws', 'rate'),
+                            burst=app.config.get('aws', 'burst'))
+
+
+def start_profiling(app):
+    if not (app.pargs.profile_calls or app.pargs.profile_trace):
+        return
+
+    profiler.mark('parsed')
+    profiler.enable()
+    client.register_client_hook(profiler.attach, 'profiler')
+
+
+def recheck_permissions(app):
+    # set on every run, the daemon keeps the verdicts between commands
+    permissions.verdicts.recheck = app.pargs.recheck_permissions
+
+
+def start_render(app, data):
+    profiler.mark('render')
+    return data
+
+
+def end_render(app, text):
+    profiler.end_phase('render', 'render')
+    return text
+
+
+def report_profile(app):
+    if profiler.current is None:
+        return
+
+    profiler.end_phase('command', 'parsed')
+    profiler.current.report()
+    print('\n%(requests)d requests, %(reused)d on reused connections, '
+          '%(connections)d new connections, %(handshakes)d TLS handshakes'
+          % client.transport_stats())
+    buckets = ratelimit.limiter.stats()
+    if buckets:
+        print('\n%-36s %-15s %8s %6s %7s %9s' % ('rate limit', 'region', 'rate/s', 'calls',
+                                                  'thrott', 'waited s'))
+        for key, bucket in buckets.items():
+            region, action = key.split(':', 1)
+            print('%-36s %-15s %8.2f %6d %7d %9.3f' % (action, region, bucket['rate'],
+                                                       bucket['calls'], bucket['throttles'],
+                                                       bucket['waited']))
+    if app.pargs.profile_trace:
+        profiler.current.chrome_trace(app.pargs.profile_trace)
+        print('trace written to %s' % app.pargs.profile_trace)
+    profiler.disable()
 
 
 class Ccli(App):
@@ -69,10 +175,19 @@ class Ccli(App):
             AWS,
             EC2,
             Templates,
+            Keys,
+            Compute,
         ]
 
         hooks = [
             ('post_setup', extend_tinydb),
+            ('post_setup', extend_cache),
+            ('post_setup', configure_aws),
+            ('post_argument_parsing', start_profiling),
+            ('post_argument_parsing', recheck_permissions),
+            ('pre_render', start_render),
+            ('post_render', end_render),
+            ('pre_close', report_profile),
         ]
 
 
@@ -83,8 +198,16 @@ class CcliTest(TestApp, Ccli):
         label = 'ccli'
 
 
-def main():
-    with Ccli() as app:
+def run(argv=None, **kwargs):
+    """
+    Runs a command line in this process.
+
+    :param argv: arguments, defaults to ``sys.argv``
+    :param kwargs: ``Ccli`` meta options, e.g. ``close_on_exit=False``
+    :return: the exit code, unless the app exits on close
+    """
+    with Ccli(argv=argv, **kwargs) as app:
+        profiler.mark('setup_done')
         try:
             app.run()
 
@@ -109,6 +232,18 @@ def main():
             print('\n%s' % e)
             app.exit_code = 0
 
+    return app.exit_code
+
+
+def run_forwarded(argv):
+    # daemon worker threads can neither exit the process nor handle signals
+    return run(argv, close_on_exit=False, catch_signals=None)
+
+
+def main():
+    profiler.mark('imported')
+    run()
+
 
 if __name__ == '__main__':
     main()
@@ -17,11 +17,14 @@ setup(
     author='Nick Kim',
     url='https://github.com/ultrasound/ccli',
     license='MIT',
-    packages=find_packages(exclude=['ez_setup', 'tests*']),
+    packages=find_packages(exclude=['ez_setup', 'tests*', 'benchmarks*']),
     package_data={'ccli': ['templates/*']},
     include_package_data=True,
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     entry_points="""
         [console_scripts]
-        ccli = ccli.main:main
+        ccli = ccli.cli:main
     """,
 )
@@ -0,0 +1,66 @@
+import os
+import threading
+
+from tinydb import TinyDB
+from tinydb.storages import MemoryStorage
+
+from ccli.aws import cache as cache_module
+from ccli.aws.cache import ResourceCache
+from ccli.aws.permissions import PermissionCache
+
+
+class Loader:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return ['subnet-%d' % self.calls]
+
+
+def test_resource_cache_ttl_refresh_and_invalidate(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'time', lambda: now[0])
+
+    cache = ResourceCache(TinyDB(storage=MemoryStorage), ttls={'subnets': 60})
+    load = Loader()
+
+    assert cache.get('subnets', load) == ['subnet-1']
+    assert cache.get('subnets', load) == ['subnet-1']
+    assert load.calls == 1
+
+    # entries are per region
+    assert cache.get('subnets', load, region='us-east-1') == ['subnet-2']
+
+    now[0] += 61
+    assert cache.get('subnets', load) == ['subnet-3']
+
+    assert cache.get('subnets', load, refresh=True) == ['subnet-4']
+
+    cache.invalidate('subnets')
+    assert cache.get('subnets', load) == ['subnet-5']
+    assert load.calls == 5
+
+
+def test_stores_sharing_a_db_file_do_not_lose_updates(tmp):
+    path = os.path.join(tmp.dir, 'db.json')
+    db = TinyDB(path)
+    cache = ResourceCache(db)
+    verdicts = PermissionCache()
+    verdicts.bind(db)
+
+    def work(n):
+        for i in range(10):
+            cache.get('kind-%d-%d' % (n, i), lambda: [n, i], region='eu-west-1')
+            verdicts.set('action-%d-%d' % (n, i), True)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # the file still parses and holds every write
+    reopened = TinyDB(path)
+    assert len(reopened.table('resource_cache')) == 80
+    assert len(reopened.table('permissions')) == 80
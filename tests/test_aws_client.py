@@ -0,0 +1,80 @@
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ccli.aws import client
+
+
+def test_importing_aws_modules_creates_no_client():
+    code = ('import ccli.aws.ec2, ccli.aws.ec2_key, ccli.aws.vpc, sys; '
+            'from ccli.aws import client; '
+            'assert not client._clients and not client._sessions; '
+            'assert "boto3" not in sys.modules')
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def test_clients_are_pooled_per_service_region_and_profile(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    client.reset()
+
+    seoul = client.get_client('ec2', 'ap-northeast-2')
+    assert client.get_client('ec2', 'ap-northeast-2') is seoul
+    assert client.get_client('ec2', 'us-east-1') is not seoul
+    assert client.get_client('ec2', 'us-east-1').meta.region_name == 'us-east-1'
+    assert len(client._sessions) == 1
+
+    lazy = client.LazyClient('ec2', 'ap-northeast-2')
+    assert lazy.client is seoul
+    client.reset()
+
+
+ZONES = (b'<DescribeAvailabilityZonesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">'
+         b'<availabilityZoneInfo><item><zoneName>ap-northeast-2a</zoneName></item>'
+         b'</availabilityZoneInfo></DescribeAvailabilityZonesResponse>')
+
+
+class Endpoint(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(ZONES)))
+        self.end_headers()
+        self.wfile.write(ZONES)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_clients_reuse_keep_alive_connections_sized_to_workers(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Endpoint)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_ENDPOINT_URL_EC2', 'http://127.0.0.1:%d' % server.server_port)
+    client.reset()
+    client.configure(max_pool_connections=4)
+    try:
+        ec2 = client.get_client('ec2', 'ap-northeast-2')
+        assert ec2.meta.config.max_pool_connections == 4
+        assert ec2.meta.config.tcp_keepalive is True
+
+        for _ in range(5):
+            client.LazyClient('ec2', 'ap-northeast-2').describe_availability_zones()
+        assert client.transport_stats() == {'requests': 5, 'connections': 1,
+                                            'reused': 4, 'handshakes': 0}
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda _: ec2.describe_availability_zones(), range(40)))
+        stats = client.transport_stats()
+        assert stats['requests'] == 45
+        assert stats['connections'] <= 4
+    finally:
+        client.configure(max_pool_connections=client.MAX_POOL_CONNECTIONS)
+        client.reset()
+        server.shutdown()
+        server.server_close()
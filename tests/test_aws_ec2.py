@@ -0,0 +1,107 @@
+import boto3
+from botocore.stub import Stubber
+
+from ccli.aws.ec2 import iter_instances, get_all_instance
+
+
+def reservation(*instance_ids):
+    return {'Instances': [{'InstanceId': i} for i in instance_ids]}
+
+
+def stubbed_client():
+    client = boto3.client('ec2', region_name='ap-northeast-2',
+                          aws_access_key_id='testing',
+                          aws_secret_access_key='testing')
+    return client, Stubber(client)
+
+
+def test_iter_instances_follows_next_token():
+    client, stubber = stubbed_client()
+    stubber.add_response('describe_instances',
+                         {'Reservations': [reservation('i-1', 'i-2')],
+                          'NextToken': 'page-2'},
+                         {'MaxResults': 5})
+    stubber.add_response('describe_instances',
+                         {'Reservations': [reservation('i-3'),
+                                           reservation('i-4', 'i-5')]},
+                         {'MaxResults': 5, 'NextToken': 'page-2'})
+
+    with stubber:
+        instances = iter_instances(client, page_size=5)
+        assert next(instances)['InstanceId'] == 'i-1'
+        assert [i['InstanceId'] for i in instances] == ['i-2', 'i-3', 'i-4', 'i-5']
+        stubber.assert_no_pending_responses()
+
+
+def test_get_all_instance_keeps_every_instance():
+    client, stubber = stubbed_client()
+    stubber.add_response('describe_instances',
+                         {'Reservations': [reservation('i-1', 'i-2')]},
+                         {'MaxResults': 1000})
+
+    with stubber:
+        assert get_all_instance(client) == ['i-1', 'i-2']
+
+
+def status(instance_id, state):
+    return {'InstanceId': instance_id, 'InstanceState': {'Code': 0, 'Name': state}}
+
+
+def test_stop_instances_batches_calls_and_waits_once():
+    from ccli.aws import ec2
+    from ccli.aws.waiter import WaiterEngine
+
+    client, stubber = stubbed_client()
+    ids = ['i-%03d' % n for n in range(150)]
+
+    stubber.add_response('stop_instances', {}, {'InstanceIds': ids[:100]})
+    stubber.add_response('stop_instances', {}, {'InstanceIds': ids[100:]})
+
+    # first round: everything but the last instance has stopped
+    stubber.add_response('describe_instance_status',
+                         {'InstanceStatuses': [status(i, 'stopped') for i in ids[:100]]},
+                         {'InstanceIds': ids[:100], 'IncludeAllInstances': True})
+    stubber.add_response('describe_instance_status',
+                         {'InstanceStatuses': [status(i, 'stopped') for i in ids[100:149]]
+                          + [status(ids[149], 'stopping')]},
+                         {'InstanceIds': ids[100:], 'IncludeAllInstances': True})
+    stubber.add_response('describe_instance_status',
+                         {'InstanceStatuses': [status(ids[149], 'stopped')]},
+                         {'InstanceIds': ids[149:], 'IncludeAllInstances': True})
+
+    op = ec2.EC2Operation(engine=WaiterEngine(min_delay=0))
+    op.client = client
+    with stubber:
+        assert op.stop_instances(ids) == ids
+        stubber.assert_no_pending_responses()
+
+
+def test_listing_and_export_stream_instance_records(tmp):
+    import json
+
+    from ccli.aws.ec2 import EC2Operation
+    from ccli.aws.records import Instance
+
+    client, stubber = stubbed_client()
+    page = {'Reservations': [{'Instances': [
+        {'InstanceId': 'i-%d' % n, 'State': {'Code': 16, 'Name': 'running'},
+         'Tags': [{'Key': 'Name', 'Value': 'web-%d' % n}],
+         'BlockDeviceMappings': [{'DeviceName': '/dev/xvda'}]} for n in range(2)]}]}
+    stubber.add_response('describe_instances', page, {'MaxResults': 1000})
+    stubber.add_response('describe_instances', page, {'MaxResults': 1000})
+
+    op = EC2Operation(region='ap-northeast-2')
+    op.client = client
+    path = '%s/all.ndjson' % tmp.dir
+    with stubber:
+        instances = list(op.select_instances())
+        assert op.export_instances(path) == 2
+
+    assert all(type(i) is Instance for i in instances)
+    assert [(i.instance_id, i.state, i.region, i.name) for i in instances] == \
+        [('i-0', 'running', 'ap-northeast-2', 'web-0'), ('i-1', 'running', 'ap-northeast-2', 'web-1')]
+    with open(path) as f:
+        exported = [json.loads(line) for line in f]
+    assert exported[1]['instance_id'] == 'i-1'
+    assert exported[1]['tags'] == {'Name': 'web-1'}
+    assert 'BlockDeviceMappings' not in exported[1]
@@ -0,0 +1,118 @@
+import os
+import time
+from types import SimpleNamespace
+
+from tinydb import TinyDB
+from tinydb.storages import MemoryStorage
+
+from ccli.aws import ec2_key, permissions
+from ccli.aws.cache import ResourceCache
+from ccli.aws.ec2_key import HASH_TAG, public_key_hash, sync_key_pair
+
+OLD = 'ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIOld old@host'
+NEW = 'ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAINew new@host\n'
+
+
+class Region:
+    """
+    Key pairs of one region, with the calls made to them.
+    """
+
+    def __init__(self, region, keys):
+        self.meta = SimpleNamespace(region_name=region)
+        # key name -> (public key, HASH_TAG or None)
+        self.keys = dict(keys)
+        self.calls = []
+
+    def describe_key_pairs(self, IncludePublicKey=False):
+        self.calls.append('describe')
+        time.sleep(0.1)
+        key_pairs = []
+        for name, (public_key, digest) in self.keys.items():
+            key_pair = {'KeyPairId': 'key-' + name, 'KeyName': name,
+                        'Tags': [{'Key': HASH_TAG, 'Value': digest}] if digest else []}
+            if IncludePublicKey:
+                key_pair['PublicKey'] = public_key
+            key_pairs.append(key_pair)
+        return {'KeyPairs': key_pairs}
+
+    def delete_key_pair(self, KeyName):
+        self.calls.append('delete')
+        del self.keys[KeyName]
+
+    def import_key_pair(self, KeyName, PublicKeyMaterial, TagSpecifications):
+        self.calls.append('import')
+        self.keys[KeyName] = (PublicKeyMaterial.decode(), TagSpecifications[0]['Tags'][0]['Value'])
+
+    def create_tags(self, Resources, Tags):
+        self.calls.append('tag')
+        name = Resources[0][len('key-'):]
+        self.keys[name] = (self.keys[name][0], Tags[0]['Value'])
+
+
+def test_key_is_rotated_only_where_it_differs(monkeypatch):
+    regions = {
+        'us-east-1': Region('us-east-1', {'deploy': (OLD, public_key_hash(OLD))}),
+        'eu-west-1': Region('eu-west-1', {'deploy': (NEW, public_key_hash(NEW))}),
+        'ap-northeast-2': Region('ap-northeast-2', {'other': (OLD, None)}),
+        # the same key imported by hand, without the tag
+        'sa-east-1': Region('sa-east-1', {'deploy': (NEW, None)}),
+        # a tag claiming the new key on the old one
+        'ca-central-1': Region('ca-central-1', {'deploy': (OLD, public_key_hash(NEW))}),
+    }
+    monkeypatch.setattr(ec2_key, 'LazyClient', lambda service, region: regions[region])
+    cache = ResourceCache(TinyDB(storage=MemoryStorage))
+
+    started = time.perf_counter()
+    results = {r.region: r.value for r in sync_key_pair('deploy', NEW, list(regions), cache=cache)}
+    assert time.perf_counter() - started < 0.3
+
+    assert results == {'us-east-1': 'replace', 'eu-west-1': None, 'ap-northeast-2': 'import',
+                       'sa-east-1': 'tag', 'ca-central-1': 'replace'}
+    assert regions['eu-west-1'].calls == ['describe']
+    assert regions['ap-northeast-2'].calls == ['describe', 'import']
+    assert regions['us-east-1'].calls == ['describe', 'delete', 'import']
+    assert regions['sa-east-1'].calls == ['describe', 'tag']
+    assert {(public_key_hash(public_key), digest) for public_key, digest in
+            (r.keys['deploy'] for r in regions.values())} == \
+        {(public_key_hash(NEW), public_key_hash(NEW))}
+
+    # unchanged regions answer from the cache, changed ones describe again
+    results = {r.region: r.value for r in sync_key_pair('deploy', None, list(regions),
+                                                         cache=cache, dry_run=True)}
+    assert set(results.values()) == {'delete'}
+    assert regions['eu-west-1'].calls == ['describe']
+    assert regions['us-east-1'].calls[-1] == 'describe'
+    assert 'deploy' in regions['us-east-1'].keys
+
+
+def test_public_key_hash_ignores_the_comment():
+    assert public_key_hash(NEW) == public_key_hash('ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAINew')
+    assert public_key_hash(NEW) != public_key_hash(OLD)
+
+
+def test_concurrent_regions_share_one_db_file(tmp, monkeypatch):
+    names = ['region-%d' % n for n in range(32)]
+    # every other region already holds the key
+    regions = {name: Region(name, {'deploy': (NEW, public_key_hash(NEW)) if n % 2 else (OLD, None)})
+               for n, name in enumerate(names)}
+    monkeypatch.setattr(ec2_key, 'LazyClient', lambda service, region: regions[region])
+
+    path = os.path.join(tmp.dir, 'db.json')
+    db = TinyDB(path)
+    cache = ResourceCache(db)
+    verdicts = permissions.PermissionCache()
+    verdicts.bind(db)
+    monkeypatch.setattr(permissions, 'verdicts', verdicts)
+
+    results = {r.region: r.value for r in sync_key_pair('deploy', NEW, names, cache=cache)}
+    assert list(results.values()).count('replace') == 16
+
+    # the file loads and kept what every worker wrote
+    reopened = TinyDB(path)
+    assert {e['key'].split(':')[1] for e in reopened.table('resource_cache')} == \
+        {name for n, name in enumerate(names) if n % 2}
+    changed = [name for n, name in enumerate(names) if not n % 2]
+    assert sorted(tuple(e['key'].split(':')[:2]) for e in reopened.table('permissions')) == \
+        sorted((action, name) for action in ('delete_key_pair', 'import_key_pair')
+               for name in changed)
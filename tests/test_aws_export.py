@@ -0,0 +1,27 @@
+import datetime
+import gzip
+import json
+
+from ccli.aws.export import compression_for, export_ndjson
+
+
+def instances(count):
+    launched = datetime.datetime(2018, 11, 1, 12, 0)
+    for n in range(count):
+        yield {'InstanceId': 'i-%d' % n, 'LaunchTime': launched}
+
+
+def test_export_ndjson_plain_and_gzip(tmp):
+    assert compression_for('all.ndjson.gz') == 'gzip'
+    assert compression_for('all.ndjson') is None
+
+    plain = '%s/all.ndjson' % tmp.dir
+    assert export_ndjson(instances(3), plain) == 3
+    with open(plain) as f:
+        lines = f.read().splitlines()
+    assert json.loads(lines[2]) == {'InstanceId': 'i-2', 'LaunchTime': '2018-11-01 12:00:00'}
+
+    packed = '%s/all.ndjson.gz' % tmp.dir
+    assert export_ndjson(instances(1000), packed) == 1000
+    with gzip.open(packed, 'rt') as f:
+        assert sum(1 for line in f) == 1000
@@ -0,0 +1,53 @@
+import pytest
+
+from ccli.aws.ec2 import EC2Operation
+from ccli.aws.fields import compile_fields
+from ccli.aws.where import compile_where
+from ccli.core.exc import ccliError
+
+INSTANCE = {'InstanceId': 'i-1',
+            'State': {'Code': 16, 'Name': 'running'},
+            'PrivateIpAddress': '10.0.0.1',
+            'BlockDeviceMappings': [{'DeviceName': '/dev/xvda', 'Ebs': {'VolumeId': 'vol-1'}}],
+            'NetworkInterfaces': [{'PrivateIpAddress': '10.0.0.1', 'MacAddress': 'm1'},
+                                  {'PrivateIpAddress': '10.0.1.1', 'MacAddress': 'm2'}],
+            'Tags': [{'Key': 'Name', 'Value': 'web'}, {'Key': 'env', 'Value': 'prod'}]}
+
+
+def test_dotted_fields_keep_the_api_shape():
+    fields = compile_fields('InstanceId, State.Name, NetworkInterfaces.PrivateIpAddress, tag:env, '
+                            'Missing.Key')
+
+    assert fields.project(INSTANCE) == {
+        'InstanceId': 'i-1',
+        'State': {'Name': 'running'},
+        'NetworkInterfaces': [{'PrivateIpAddress': '10.0.0.1'}, {'PrivateIpAddress': '10.0.1.1'}],
+        'Tags': [{'Key': 'env', 'Value': 'prod'}],
+    }
+
+    # --where names are aliases, a whole value wins over its parts
+    assert compile_fields('id,private_ip,state,State').project(INSTANCE) == \
+        {'InstanceId': 'i-1', 'PrivateIpAddress': '10.0.0.1', 'State': INSTANCE['State']}
+
+
+def test_jmespath_fields():
+    fields = compile_fields('{id: InstanceId, ips: NetworkInterfaces[].PrivateIpAddress}')
+    assert fields.project(INSTANCE) == {'id': 'i-1', 'ips': ['10.0.0.1', '10.0.1.1']}
+
+    with pytest.raises(ccliError):
+        compile_fields('{id: ')
+    with pytest.raises(ccliError):
+        compile_fields(' , ')
+
+
+def test_fields_are_projected_after_the_selection():
+    class Paginator:
+        def paginate(self, **kwargs):
+            return [{'Reservations': [{'Instances': [INSTANCE, dict(INSTANCE, InstanceId='i-2',
+                                                                    Tags=[])]}]}]
+
+    op = EC2Operation()
+    op.client = type('Client', (), {'get_paginator': lambda self, name: Paginator()})()
+
+    instances = op.select_instances(compile_where("tag:env=prod or state=stopped"), fields=compile_fields('id'))
+    assert list(instances) == [{'InstanceId': 'i-1'}]
@@ -0,0 +1,38 @@
+from pytest import raises
+
+from ccli.core.exc import ccliError
+from ccli.aws.inventory import InventoryStore
+from ccli.aws.where import compile_where
+
+
+def instance(instance_id, state='running', env='prod'):
+    return {'InstanceId': instance_id,
+            'State': {'Name': state},
+            'InstanceType': 't2.micro',
+            'Placement': {'AvailabilityZone': 'ap-northeast-2a'},
+            'VpcId': 'vpc-1',
+            'Tags': [{'Key': 'env', 'Value': env}]}
+
+
+def test_incremental_sync_and_indexed_queries(tmp):
+    store = InventoryStore('%s/inventory.db' % tmp.dir)
+
+    stats = store.sync('ap-northeast-2', [instance('i-1'), instance('i-2'), instance('i-3', env='dev')])
+    assert stats == {'added': 3, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+
+    # i-1 unchanged, i-2 stopped, i-3 gone, i-4 new
+    stats = store.sync('ap-northeast-2', [instance('i-1'), instance('i-2', 'stopped'), instance('i-4')],
+                       batch_size=1)
+    assert stats == {'added': 1, 'updated': 1, 'unchanged': 1, 'deleted': 1}
+
+    running = store.query(state='running', tags={'env': 'prod'})
+    assert sorted(i['InstanceId'] for i in running) == ['i-1', 'i-4']
+    assert store.query(regions=['us-east-1']) == []
+
+    selection = compile_where('state in (running, stopped) and id != i-4')
+    assert sorted(i['InstanceId'] for i in store.select(selection, ['ap-northeast-2'], max_age=60)) \
+        == ['i-1', 'i-2']
+
+    with raises(ccliError):
+        store.select(selection, ['us-east-1'], max_age=60)
+    store.close()
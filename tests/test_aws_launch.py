@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+from ccli.aws.launch import STAGES, Subnet, launch, pipeline, plan
+from ccli.aws.waiter import WaiterEngine
+
+
+class FakeClient:
+    """Launches into any subnet, except the AZs that are out of capacity."""
+
+    meta = SimpleNamespace(region_name='ap-northeast-2')
+
+    def __init__(self, subnets, full_azs=()):
+        self.subnets = subnets
+        self.full_azs = full_azs
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_paginator(self, name):
+        return SimpleNamespace(paginate=lambda **kwargs: [{'Subnets': self.subnets}])
+
+    def describe_launch_template_versions(self, LaunchTemplateName, Versions):
+        data = {'Placement': {'AvailabilityZone': 'ap-northeast-2a'},
+                'NetworkInterfaces': [{'DeviceIndex': 0, 'Groups': ['sg-1'],
+                                       'SubnetId': 'subnet-a'}]}
+        return {'LaunchTemplateVersions': [{'LaunchTemplateData': data}]}
+
+    def run_instances(self, **kwargs):
+        with self.lock:
+            self.calls.append(kwargs)
+            n = len(self.calls)
+
+        az = kwargs['Placement']['AvailabilityZone']
+        if az in self.full_azs:
+            raise ClientError({'Error': {'Code': 'InsufficientInstanceCapacity'}}, 'RunInstances')
+
+        subnet_id = kwargs['NetworkInterfaces'][0]['SubnetId']
+        return {'Instances': [{'InstanceId': 'i-%d-%d' % (n, i), 'SubnetId': subnet_id,
+                               'Placement': {'AvailabilityZone': az}}
+                              for i in range(kwargs['MaxCount'])]}
+
+
+def subnet(subnet_id, az, free, vpc='vpc-1'):
+    return {'SubnetId': subnet_id, 'AvailabilityZone': az, 'VpcId': vpc,
+            'AvailableIpAddressCount': free}
+
+
+def test_plan_splits_by_free_addresses():
+    subnets = [Subnet('subnet-a', 'a', 'vpc-1', 300, False),
+               Subnet('subnet-b', 'b', 'vpc-1', 100, False),
+               Subnet('subnet-c', 'c', 'vpc-1', 0, False)]
+
+    shares = {s.subnet_id: n for s, n in plan(200, subnets)}
+    assert shares == {'subnet-a': 150, 'subnet-b': 50}
+    assert sum(n for _, n in plan(7, subnets)) == 7
+
+
+def test_launch_retries_capacity_errors_in_other_azs():
+    client = FakeClient([subnet('subnet-a', 'ap-northeast-2a', 200),
+                         subnet('subnet-c', 'ap-northeast-2c', 200),
+                         subnet('subnet-x', 'ap-northeast-2a', 200, vpc='vpc-2')],
+                        full_azs=('ap-northeast-2a',))
+
+    instances = list(launch(200, template='web', client=client))
+
+    assert len(instances) == 200
+    assert {i['SubnetId'] for i in instances} == {'subnet-c'}
+    # one call per placement, the other VPC is never used
+    assert {c['NetworkInterfaces'][0]['SubnetId'] for c in client.calls} == {'subnet-a', 'subnet-c'}
+    # the template's interface keeps its security groups
+    assert all(c['NetworkInterfaces'][0]['Groups'] == ['sg-1'] for c in client.calls)
+
+
+class BootingClient:
+    """Every instance passes its status checks after its own number of polls."""
+
+    def __init__(self, polls):
+        self.polls = polls
+        self.lock = threading.Lock()
+
+    def describe_instance_status(self, InstanceIds, IncludeAllInstances):
+        statuses = []
+        with self.lock:
+            for instance_id in InstanceIds:
+                self.polls[instance_id] -= 1
+                ok = 'ok' if self.polls[instance_id] <= 0 else 'initializing'
+                statuses.append({'InstanceId': instance_id,
+                                 'InstanceState': {'Name': 'running'},
+                                 'InstanceStatus': {'Status': ok},
+                                 'SystemStatus': {'Status': ok}})
+        return {'InstanceStatuses': statuses}
+
+    def describe_instances(self, InstanceIds):
+        return {'Reservations': [{'Instances': [
+            {'InstanceId': i, 'PublicIpAddress': '203.0.113.%d' % n}
+            for n, i in enumerate(InstanceIds)]}]}
+
+
+def test_pipeline_streams_instances_as_they_get_ready(tmp):
+    client = BootingClient({'i-slow': 30, 'i-fast': 1})
+    stages = []
+    engine = WaiterEngine(min_delay=0, max_delay=0.01)
+
+    launched = [{'InstanceId': 'i-slow'}, {'InstanceId': 'i-fast'}]
+    ready = pipeline(launched, client=client, engine=engine, directory=tmp.dir,
+                     on_stage=lambda instance_id, stage: stages.append((instance_id, stage)))
+
+    assert [i['InstanceId'] for i in ready] == ['i-fast', 'i-slow']
+    for instance_id in ('i-fast', 'i-slow'):
+        assert [s for i, s in stages if i == instance_id] == list(STAGES)
+        with open(os.path.join(tmp.dir, instance_id + '.json')) as fp:
+            assert json.load(fp)['PublicIpAddress']
+
+
+def test_launch_reads_subnets_from_the_topology():
+    from ccli.aws.vpc import Topology
+
+    topology = Topology(subnets=[Subnet('subnet-a', 'a', 'vpc-1', 10, False),
+                                 Subnet('subnet-b', 'b', 'vpc-1', 30, False)])
+    client = FakeClient([])
+
+    instances = list(launch(4, template='web', client=client, topology=topology))
+
+    assert len(instances) == 4
+    assert sorted(call['NetworkInterfaces'][0]['SubnetId'] for call in client.calls) == \
+        ['subnet-a', 'subnet-b']
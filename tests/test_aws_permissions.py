@@ -0,0 +1,67 @@
+import boto3
+from botocore.stub import Stubber
+from pytest import raises
+from tinydb import TinyDB
+from tinydb.storages import MemoryStorage
+
+from ccli.core.exc import PermissionDenied
+from ccli.aws import permissions
+from ccli.aws.permissions import checked_call
+
+
+def stubbed_client():
+    client = boto3.client('ec2', region_name='ap-northeast-2',
+                          aws_access_key_id='testing',
+                          aws_secret_access_key='testing')
+    return client, Stubber(client)
+
+
+def test_checked_call_skips_preflight_and_caches_verdicts(monkeypatch):
+    cache = permissions.PermissionCache()
+    cache.bind(TinyDB(storage=MemoryStorage))
+    monkeypatch.setattr(permissions, 'verdicts', cache)
+    client, stubber = stubbed_client()
+
+    # no DryRun call, the real call decides
+    stubber.add_response('reboot_instances', {}, {'InstanceIds': ['i-1']})
+    stubber.add_client_error('terminate_instances', 'UnauthorizedOperation',
+                             expected_params={'InstanceIds': ['i-1']})
+
+    with stubber:
+        checked_call(client, 'reboot_instances', InstanceIds=['i-1'])
+        with raises(PermissionDenied):
+            checked_call(client, 'terminate_instances', InstanceIds=['i-1'])
+
+        # the denied verdict is cached, the API is not called again
+        with raises(PermissionDenied):
+            checked_call(client, 'terminate_instances', InstanceIds=['i-2'])
+        stubber.assert_no_pending_responses()
+
+    key = 'terminate_instances:ap-northeast-2:%s' % permissions.caller_identity(client)
+    assert cache.get(key) is False
+
+    cache.ttl = 0
+    assert cache.get(key) is None
+
+
+def test_denials_expire_sooner_and_can_be_rechecked(monkeypatch):
+    cache = permissions.PermissionCache(ttl=3600, denied_ttl=300)
+    monkeypatch.setattr(permissions, 'verdicts', cache)
+    client, stubber = stubbed_client()
+    key = 'stop_instances:ap-northeast-2:%s' % permissions.caller_identity(client)
+
+    cache.set(key, False)
+    entry = cache._verdicts[key]
+    entry['checked_at'] -= 600
+    assert cache.get(key) is None
+
+    entry['checked_at'] += 600
+    cache.recheck = True
+    # the policy was fixed, the call goes through and the verdict flips
+    stubber.add_response('stop_instances', {}, {'InstanceIds': ['i-1']})
+    with stubber:
+        checked_call(client, 'stop_instances', InstanceIds=['i-1'])
+        stubber.assert_no_pending_responses()
+
+    cache.recheck = False
+    assert cache.get(key) is True
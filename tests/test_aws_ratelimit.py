@@ -0,0 +1,67 @@
+import threading
+import time
+
+import boto3
+
+from ccli.aws import ratelimit
+from ccli.aws.ratelimit import AdaptiveLimiter, TokenBucket, attach
+
+
+class HTTPResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def test_token_bucket_paces_threads():
+    bucket = TokenBucket(rate=200, burst=5)
+    started = time.monotonic()
+
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(25)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 5 from the burst, 20 more at 200/s
+    assert time.monotonic() - started >= 0.09
+    assert bucket.calls == 25
+
+
+def test_limiter_backs_off_on_throttling_and_recovers():
+    limiter = AdaptiveLimiter(rate=10, burst=10, min_rate=1, recovery=0.5)
+    client = boto3.client('ec2', region_name='us-east-1',
+                          aws_access_key_id='testing', aws_secret_access_key='testing')
+    attach(client, limiter)
+
+    throttled = (HTTPResponse(503), {'Error': {'Code': 'RequestLimitExceeded'}})
+    for _ in range(2):
+        client.meta.events.emit('needs-retry.ec2.DescribeInstances', response=throttled,
+                                attempts=1, caught_exception=None, request_dict={'context': {}})
+    assert limiter.stats()['us-east-1:DescribeInstances']['rate'] == 2.5
+    assert limiter.stats()['us-east-1:DescribeInstances']['throttles'] == 2
+
+    client.meta.events.emit('needs-retry.ec2.DescribeInstances', response=(HTTPResponse(200), {}),
+                            attempts=1, caught_exception=None, request_dict={'context': {}})
+    assert limiter.stats()['us-east-1:DescribeInstances']['rate'] == 3.0
+
+    # other actions keep their own bucket
+    client.meta.events.emit('before-send.ec2.StopInstances', request=None)
+    assert limiter.stats()['us-east-1:StopInstances'] == {'rate': 10, 'calls': 1, 'throttles': 0,
+                                                          'waited': 0.0}
+
+
+def test_configure_keeps_the_shared_limiter_and_its_rates():
+    shared = ratelimit.limiter
+    saved = {name: getattr(shared, name) for name in ('rate', 'burst')}
+    try:
+        ratelimit.configure(rate=10, burst=10)
+        shared.on_throttle('eu-west-1', 'DescribeInstances')
+        ratelimit.configure(rate=10, burst=4)
+
+        assert ratelimit.limiter is shared
+        bucket = shared.bucket('eu-west-1', 'DescribeInstances')
+        assert bucket.rate == 5
+        assert bucket.capacity == 4
+    finally:
+        ratelimit.configure(**saved)
+        shared._buckets.pop(('eu-west-1', 'DescribeInstances'), None)
@@ -0,0 +1,76 @@
+import datetime
+
+import pytest
+
+from ccli.aws import records
+from ccli.aws.records import Index, Instance, KeyPair, SecurityGroup, Subnet, Template
+
+
+def describe(n, state='running'):
+    return {'InstanceId': 'i-%d' % n,
+            'State': {'Code': 16, 'Name': ''.join(state)},
+            'InstanceType': ''.join(['t2.', 'micro']),
+            'Placement': {'AvailabilityZone': 'ap-northeast-2a', 'Tenancy': 'default'},
+            'SubnetId': 'subnet-1', 'VpcId': 'vpc-1', 'PrivateIpAddress': '10.0.0.%d' % n,
+            'PublicDnsName': '', 'KeyName': 'dev', 'ImageId': 'ami-1',
+            'LaunchTime': datetime.datetime(2020, 1, 1),
+            'Tags': [{'Key': 'Name', 'Value': 'web-%d' % n}],
+            'BlockDeviceMappings': [{'DeviceName': '/dev/xvda'}]}
+
+
+def test_instances_keep_used_fields_and_share_strings():
+    a, b = Instance.from_api(describe(1)), Instance.from_api(describe(2))
+
+    assert (a.instance_id, a.state, a.az, a.private_ip, a.public_dns, a.name) == \
+        ('i-1', 'running', 'ap-northeast-2a', '10.0.0.1', None, 'web-1')
+    assert a.state is b.state and a.instance_type is b.instance_type
+    assert not hasattr(a, '__dict__')
+    with pytest.raises(AttributeError):
+        a.extra = 1
+
+
+def test_raw_payload_is_kept_or_described_on_demand(monkeypatch):
+    data = describe(1)
+    assert Instance.from_api(data, keep_raw=True).raw is data
+
+    calls = []
+
+    class Client:
+        def __init__(self, service, region):
+            calls.append(region)
+
+        def describe_instances(self, InstanceIds):
+            return {'Reservations': [{'Instances': [describe(int(InstanceIds[0][2:]))]}]}
+    monkeypatch.setattr(records, 'LazyClient', Client)
+
+    instance = Instance.from_api(data, region='us-east-1')
+    assert instance.raw['BlockDeviceMappings'] == data['BlockDeviceMappings']
+    assert instance.raw is instance.raw
+    assert calls == ['us-east-1']
+
+
+def test_index_looks_records_up_by_id_and_name():
+    groups = Index(SecurityGroup.from_api({'GroupId': 'sg-%d' % n, 'GroupName': 'group-%d' % n})
+                   for n in range(1000))
+
+    assert groups.named('group-999').group_id == 'sg-999'
+    assert groups['sg-5'].name == 'group-5'
+    assert 'sg-1000' not in groups and groups.named('nope') is None
+    assert len(groups) == 1000 and groups.names()[:2] == ['group-0', 'group-1']
+
+    subnet = Subnet('subnet-a', 'a', 'vpc-1', 300, False)
+    assert subnet == Subnet.from_api({'SubnetId': 'subnet-a', 'AvailabilityZone': 'a',
+                                      'VpcId': 'vpc-1', 'AvailableIpAddressCount': 300})
+    assert Index([subnet])['subnet-a'] is subnet
+
+
+def test_templates_and_key_pairs_round_trip_through_dicts():
+    template = Template.from_api({'LaunchTemplateId': 'lt-1', 'LaunchTemplateName': 'web',
+                                  'DefaultVersionNumber': 1, 'LatestVersionNumber': 2},
+                                 [{'number': 1}, {'number': 2}])
+    key = KeyPair.from_api({'KeyPairId': 'key-1', 'KeyName': 'dev', 'KeyFingerprint': 'ab:cd'})
+
+    assert Template(**template.as_dict()) == template
+    assert Index([template]).named('web').latest_version == 2
+    assert KeyPair(**key.as_dict()) == key
+    assert Index([key])['dev'].fingerprint == 'ab:cd'
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+from pytest import raises
+
+from ccli.core.exc import ccliError
+from ccli.aws.ec2 import REGIONS
+from ccli.aws.regions import parse_regions, merge, fan_out
+
+
+def test_parse_regions():
+    assert parse_regions('all') == REGIONS
+    assert parse_regions('us-east-1, ap-northeast-2') == ['us-east-1', 'ap-northeast-2']
+
+    with raises(ccliError):
+        parse_regions('us-east-1,mars-1')
+
+
+def test_fan_out_runs_regions_concurrently():
+    regions = ['us-east-1', 'us-west-2', 'eu-west-1', 'ap-northeast-2']
+    barrier = threading.Barrier(len(regions), timeout=5)
+
+    def describe(region):
+        # every region has to be in flight at once to get past the barrier
+        barrier.wait()
+        return region.upper()
+
+    results = sorted(fan_out(describe, regions))
+    assert [r.value for r in results] == sorted(r.upper() for r in regions)
+
+
+def test_merge_reports_failures_per_region():
+    def describe(region):
+        if region == 'eu-west-1':
+            raise RuntimeError('boom')
+        for i in range(3):
+            yield '%s-%d' % (region, i)
+
+    results = list(merge(describe, ['us-east-1', 'eu-west-1']))
+    values = [r.value for r in results if r.error is None]
+    errors = [r for r in results if r.error is not None]
+
+    assert sorted(values) == ['us-east-1-0', 'us-east-1-1', 'us-east-1-2']
+    assert [e.region for e in errors] == ['eu-west-1']
+
+
+def test_merge_stops_workers_when_consumer_leaves():
+    def endless(region):
+        while True:
+            yield region
+            time.sleep(0.001)
+
+    results = merge(endless, ['us-east-1', 'us-west-2'], buffer_size=2)
+    assert next(results).value in ('us-east-1', 'us-west-2')
+    results.close()
+
+
+def test_empty_instance_ids_touch_no_instance(monkeypatch):
+    from ccli.aws import regions
+    from ccli.controllers.aws import parse_instance_ids
+
+    # what 'terminate -i , --regions all' passed on
+    for value in (',', ' ', ' , ,'):
+        with raises(ccliError):
+            parse_instance_ids(value)
+    assert parse_instance_ids('i-1, i-2,') == ['i-1', 'i-2']
+
+    monkeypatch.setattr(regions, 'operations', lambda *args: pytest.fail('regions were described'))
+    for instance_ids in ([], None):
+        with raises(ccliError):
+            regions.run_in_regions('terminate', instance_ids, ['us-east-1', 'eu-west-1'])
+
+
+def test_empty_instance_ids_select_nothing():
+    from ccli.aws.ec2 import EC2Operation
+
+    op = EC2Operation(region='us-east-1')
+    op.client = None
+    assert list(op.select_instances(None, [])) == []
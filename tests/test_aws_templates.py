@@ -0,0 +1,112 @@
+import os
+import threading
+from types import SimpleNamespace
+
+from tinydb import TinyDB
+from tinydb.storages import MemoryStorage
+
+from ccli.aws import permissions
+from ccli.aws.templates import TemplateSnapshot, load_specs, sync_specs
+
+
+class FakeClient:
+    """Keeps launch templates in memory and counts the calls made."""
+
+    meta = SimpleNamespace(region_name='ap-northeast-2')
+
+    def __init__(self):
+        self.templates = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _call(self, name, **kwargs):
+        with self.lock:
+            self.calls.append((name, kwargs))
+
+    def get_paginator(self, name):
+        return SimpleNamespace(paginate=lambda **kwargs: [getattr(self, name)(**kwargs)])
+
+    def describe_launch_templates(self):
+        self._call('describe_launch_templates')
+        return {'LaunchTemplates': [
+            {'LaunchTemplateId': t['id'], 'LaunchTemplateName': name,
+             'LatestVersionNumber': len(t['versions']), 'DefaultVersionNumber': t['default']}
+            for name, t in self.templates.items()]}
+
+    def describe_launch_template_versions(self, LaunchTemplateId, MinVersion='1'):
+        self._call('describe_launch_template_versions', LaunchTemplateId=LaunchTemplateId,
+                   MinVersion=MinVersion)
+        t = [t for t in self.templates.values() if t['id'] == LaunchTemplateId][0]
+        return {'LaunchTemplateVersions': [
+            dict(v, VersionNumber=n) for n, v in enumerate(t['versions'], 1)
+            if n >= int(MinVersion)]}
+
+    def create_launch_template(self, LaunchTemplateName, VersionDescription, LaunchTemplateData):
+        self._call('create_launch_template', LaunchTemplateName=LaunchTemplateName)
+        self.templates[LaunchTemplateName] = {
+            'id': 'lt-%d' % len(self.templates), 'default': 1,
+            'versions': [{'VersionDescription': VersionDescription,
+                          'LaunchTemplateData': LaunchTemplateData}]}
+
+    def create_launch_template_version(self, LaunchTemplateName, VersionDescription,
+                                       LaunchTemplateData):
+        self._call('create_launch_template_version', LaunchTemplateName=LaunchTemplateName)
+        versions = self.templates[LaunchTemplateName]['versions']
+        versions.append({'VersionDescription': VersionDescription,
+                         'LaunchTemplateData': LaunchTemplateData})
+        return {'LaunchTemplateVersion': {'VersionNumber': len(versions)}}
+
+    def modify_launch_template(self, LaunchTemplateName, DefaultVersion):
+        self._call('modify_launch_template', LaunchTemplateName=LaunchTemplateName)
+        self.templates[LaunchTemplateName]['default'] = int(DefaultVersion)
+
+
+def write_spec(directory, name, instance_type):
+    with open(os.path.join(directory, name + '.yml'), 'w') as fp:
+        fp.write('LaunchTemplateData:\n  InstanceType: %s\n  ImageId: ami-1\n' % instance_type)
+
+
+def test_sync_touches_only_changed_templates(tmp, monkeypatch):
+    monkeypatch.setattr(permissions, 'verdicts', permissions.PermissionCache())
+    client = FakeClient()
+    db = TinyDB(storage=MemoryStorage)
+    snapshot = TemplateSnapshot(db, client=client)
+    for name in ('web', 'db', 'cache'):
+        write_spec(tmp.dir, name, 't2.micro')
+
+    results = dict(sync_specs(load_specs(tmp.dir), snapshot))
+    assert results == {'web': 'created', 'db': 'created', 'cache': 'created'}
+
+    write_spec(tmp.dir, 'db', 't2.large')
+    results = dict(sync_specs(load_specs(tmp.dir), snapshot))
+    assert results == {'web': 'unchanged', 'db': 'updated', 'cache': 'unchanged'}
+    assert client.templates['db']['default'] == 2
+
+    # only the new version of the changed template is fetched
+    client.calls = []
+    snapshot.ensure(refresh=True)
+    fetched = [kwargs for name, kwargs in client.calls
+               if name == 'describe_launch_template_versions']
+    assert fetched == [{'LaunchTemplateId': client.templates['db']['id'], 'MinVersion': '2'}]
+
+    # the snapshot survives in the db, indexed by name and ID
+    reloaded = TemplateSnapshot(db, client=client)
+    reloaded.ensure(refresh=True)
+    assert reloaded.names() == ['cache', 'db', 'web']
+    db_id = client.templates['db']['id']
+    assert reloaded.get(db_id).name == 'db'
+    assert reloaded.version('db')['data']['InstanceType'] == 't2.large'
+
+
+def test_invalidate_reaches_other_processes():
+    client = FakeClient()
+    client.templates['web'] = {'id': 'lt-0', 'default': 1,
+                               'versions': [{'LaunchTemplateData': {'ImageId': 'ami-1'}}]}
+    db = TinyDB(storage=MemoryStorage)
+    TemplateSnapshot(db, client=client).names()
+    TemplateSnapshot(db, client=client).invalidate()
+
+    # a fresh snapshot stands for the next ccli run reading the same db
+    client.calls.clear()
+    TemplateSnapshot(db, client=client).names()
+    assert ('describe_launch_templates', {}) in client.calls
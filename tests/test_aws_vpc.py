@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+from tinydb import TinyDB
+from tinydb.storages import MemoryStorage
+
+from ccli.aws.cache import ResourceCache
+from ccli.aws.vpc import CidrIndex, Topology, load_topology
+
+PAGES = {
+    'describe_vpcs': {'Vpcs': [
+        {'VpcId': 'vpc-1', 'CidrBlock': '10.0.0.0/16', 'IsDefault': True,
+         'CidrBlockAssociationSet': [
+             {'CidrBlock': '10.0.0.0/16', 'CidrBlockState': {'State': 'associated'}},
+             {'CidrBlock': '10.1.0.0/16', 'CidrBlockState': {'State': 'associated'}}]},
+        {'VpcId': 'vpc-2', 'CidrBlock': '10.0.0.0/16'}]},
+    'describe_subnets': {'Subnets': [
+        {'SubnetId': 'subnet-a', 'VpcId': 'vpc-1', 'AvailabilityZone': 'a',
+         'CidrBlock': '10.0.0.0/24', 'AvailableIpAddressCount': 250},
+        {'SubnetId': 'subnet-b', 'VpcId': 'vpc-1', 'AvailabilityZone': 'a',
+         'CidrBlock': '10.0.1.0/24', 'AvailableIpAddressCount': 10},
+        {'SubnetId': 'subnet-c', 'VpcId': 'vpc-1', 'AvailabilityZone': 'b',
+         'CidrBlock': '10.1.0.0/20', 'AvailableIpAddressCount': 4000},
+        {'SubnetId': 'subnet-d', 'VpcId': 'vpc-2', 'AvailabilityZone': 'a',
+         'CidrBlock': '10.0.0.0/25', 'AvailableIpAddressCount': 100}]},
+    'describe_route_tables': {'RouteTables': [
+        {'RouteTableId': 'rtb-main', 'VpcId': 'vpc-1', 'Associations': [{'Main': True}]},
+        {'RouteTableId': 'rtb-b', 'VpcId': 'vpc-1', 'Associations': [{'SubnetId': 'subnet-b'}]}]},
+    'describe_security_groups': {'SecurityGroups': [
+        {'GroupId': 'sg-1', 'GroupName': 'default', 'VpcId': 'vpc-1'},
+        {'GroupId': 'sg-2', 'GroupName': 'default', 'VpcId': 'vpc-2'}]},
+}
+
+
+class Client:
+    def __init__(self):
+        self.calls = []
+
+    def get_paginator(self, operation):
+        def paginate(**kwargs):
+            self.calls.append(operation)
+            return [PAGES[operation]]
+        return SimpleNamespace(paginate=paginate)
+
+
+def test_cidr_index_handles_nested_and_shared_blocks():
+    index = CidrIndex([('10.0.0.0/8', 'outer'), ('10.1.0.0/16', 'inner'), ('10.1.2.0/24', 'leaf'),
+                       ('10.1.2.0/24', 'twin'), ('10.2.0.0/16', 'side'), ('192.168.0.0/16', 'home'),
+                       ('2001:db8::/32', 'v6')])
+
+    assert index.lookup('10.1.2.3') == ['leaf', 'twin', 'inner', 'outer']
+    assert index.lookup('10.1.3.1') == ['inner', 'outer']
+    assert index.lookup('10.3.0.1') == ['outer']
+    assert index.lookup('10.2.255.255') == ['side', 'outer']
+    assert index.lookup('172.16.0.1') == []
+    assert index.lookup('2001:db8::1') == ['v6']
+
+
+def test_topology_lookups():
+    topology = Topology.describe(Client())
+
+    assert [vpc.vpc_id for vpc in topology.vpc_of('10.1.5.5')] == ['vpc-1']
+    assert sorted(vpc.vpc_id for vpc in topology.vpc_of('10.0.0.5')) == ['vpc-1', 'vpc-2']
+    assert [s.subnet_id for s in topology.subnet_of('10.0.0.5', 'vpc-1')] == ['subnet-a']
+    assert [s.subnet_id for s in topology.subnet_of('10.0.1.9')] == ['subnet-b']
+
+    assert [s.subnet_id for s in topology.subnets_with_free('a', 50)] == ['subnet-a', 'subnet-d']
+    assert topology.subnets_with_free('a', 251) == []
+    assert topology.subnets_with_free('z') == []
+
+    assert topology.route_table_of('subnet-b').route_table_id == 'rtb-b'
+    assert topology.route_table_of('subnet-a').route_table_id == 'rtb-main'
+    assert [g.group_id for g in topology.security_groups_of('vpc-2')] == ['sg-2']
+    assert topology.azs() == ['a', 'b']
+
+
+def test_topology_is_cached():
+    cache = ResourceCache(TinyDB(storage=MemoryStorage))
+    client = Client()
+
+    first = load_topology(cache, client)
+    second = load_topology(cache, client)
+    assert len(client.calls) == 4
+    assert second.as_dict() == first.as_dict()
+    assert second.subnets['subnet-c'] == first.subnets['subnet-c']
+
+    load_topology(cache, client, refresh=True)
+    assert len(client.calls) == 8
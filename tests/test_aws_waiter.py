@@ -0,0 +1,106 @@
+import threading
+
+from ccli.aws.waiter import WaiterEngine
+
+
+class FakeClient:
+    """Moves every instance one state further on each describe call."""
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def describe_instance_status(self, InstanceIds, IncludeAllInstances):
+        with self.lock:
+            self.calls += 1
+            statuses = []
+            for instance_id in InstanceIds:
+                path = self.paths[instance_id]
+                state = path.pop(0) if len(path) > 1 else path[0]
+                statuses.append({'InstanceId': instance_id,
+                                 'InstanceState': {'Name': state},
+                                 'InstanceStatus': {'Status': 'ok'},
+                                 'SystemStatus': {'Status': 'ok'}})
+            return {'InstanceStatuses': statuses}
+
+
+def test_engine_tracks_mixed_transitions_and_streams_changes():
+    client = FakeClient({
+        'i-1': ['pending', 'running'],
+        'i-2': ['stopping', 'stopping', 'stopped'],
+        'i-3': ['shutting-down', 'terminated'],
+    })
+    changes = []
+    record = lambda instance_id, state: changes.append((instance_id, state))
+
+    engine = WaiterEngine(min_delay=0, max_delay=0.01)
+    first = engine.track(client, ['i-1'], 'status_ok', on_change=record)
+    # tracking returns at once, more work can be handed in meanwhile
+    rest = engine.track(client, ['i-2'], 'stopped', on_change=record)
+    rest += engine.track(client, ['i-3'], 'terminated', on_change=record)
+
+    assert engine.wait(first + rest) == []
+    assert ('i-1', 'status_ok') in changes
+    assert changes.index(('i-2', 'stopping')) < changes.index(('i-2', 'stopped'))
+    assert ('i-3', 'terminated') in changes
+    assert engine.pending() == []
+
+
+def test_engine_times_out():
+    client = FakeClient({'i-1': ['stopping']})
+    engine = WaiterEngine(min_delay=0, max_delay=0.01, timeout=0.05)
+
+    timed_out = engine.wait(engine.track(client, ['i-1'], 'stopped'))
+    assert [t.instance_id for t in timed_out] == ['i-1']
+
+
+class FlakyClient(FakeClient):
+    """Fails the first calls, then names ``missing`` as not found once."""
+
+    def __init__(self, paths, failures, missing):
+        super().__init__(paths)
+        self.failures = failures
+        self.missing = missing
+        self.requested = []
+
+    def describe_instance_status(self, InstanceIds, IncludeAllInstances):
+        from botocore.exceptions import ClientError, EndpointConnectionError
+
+        self.requested.append(list(InstanceIds))
+        if self.failures:
+            self.failures -= 1
+            raise EndpointConnectionError(endpoint_url='https://ec2.example.com')
+        if self.missing and self.missing[0] in InstanceIds:
+            missing, self.missing = self.missing, []
+            raise ClientError({'Error': {'Code': 'InvalidInstanceID.NotFound',
+                                         'Message': "The instance IDs '%s' do not exist"
+                                                    % ', '.join(missing)}},
+                              'DescribeInstanceStatus')
+
+        return super().describe_instance_status(InstanceIds, IncludeAllInstances)
+
+
+def test_engine_survives_errors_and_only_drops_the_missing_ids():
+    client = FlakyClient({'i-1': ['pending', 'running'], 'i-2': ['pending', 'running'],
+                          'i-3': ['running']},
+                         failures=2, missing=['i-3'])
+    changes = []
+    record = lambda instance_id, state: changes.append((instance_id, state))
+    engine = WaiterEngine(min_delay=0, max_delay=0.01, timeout=5)
+
+    transitions = engine.track(client, ['i-1', 'i-2', 'i-3'], 'running', on_change=record)
+    assert engine.wait(transitions) == []
+    assert [t.state for t in transitions] == ['running'] * 3
+    # only the ID the error named was seen as gone
+    assert [c for c in changes if c[1] == 'terminated'] == [('i-3', 'terminated')]
+    # the rest of the chunk was described again right away
+    assert ['i-1', 'i-2'] in client.requested
+
+
+def test_engine_times_out_when_every_call_fails():
+    client = FlakyClient({'i-1': ['pending']}, failures=10 ** 6, missing=[])
+    engine = WaiterEngine(min_delay=0, max_delay=0.01, timeout=0.05)
+
+    timed_out = engine.wait(engine.track(client, ['i-1'], 'running'))
+    assert [t.instance_id for t in timed_out] == ['i-1']
@@ -0,0 +1,54 @@
+from pytest import raises
+
+from ccli.core.exc import ccliError
+from ccli.aws.where import compile_where
+
+
+def instance(instance_id, state='running', type_='t2.micro', **tags):
+    return {'InstanceId': instance_id,
+            'State': {'Name': state},
+            'InstanceType': type_,
+            'Placement': {'AvailabilityZone': 'ap-northeast-2a'},
+            'Tags': [{'Key': k, 'Value': v} for k, v in tags.items()]}
+
+
+FLEET = [
+    instance('i-1', type_='t2.large', env='prod'),
+    instance('i-2', type_='t2.xlarge', env='prod'),
+    instance('i-3', state='stopped', type_='t2.large', env='prod'),
+    instance('i-4', type_='t2.large', env='dev'),
+]
+
+
+def ids(instances):
+    return [i['InstanceId'] for i in instances]
+
+
+def test_conjunctions_are_pushed_down():
+    selection = compile_where('tag:env=prod and state=running and type in (t2.large, t2.xlarge)')
+
+    assert selection.describe_kwargs() == {'Filters': [
+        {'Name': 'tag:env', 'Values': ['prod']},
+        {'Name': 'instance-state-name', 'Values': ['running']},
+        {'Name': 'instance-type', 'Values': ['t2.large', 't2.xlarge']},
+    ]}
+    # nothing is left to evaluate locally
+    assert ids(selection.select(FLEET)) == ids(FLEET)
+    assert ids(selection.select(FLEET, pushed=False)) == ['i-1', 'i-2']
+
+
+def test_residual_predicate_runs_locally():
+    selection = compile_where("type = 't2.*' and not (state = stopped or tag:env != prod)")
+
+    assert selection.describe_kwargs() == {'Filters': [{'Name': 'instance-type', 'Values': ['t2.*']}]}
+    assert ids(selection.select(FLEET)) == ['i-1', 'i-2']
+
+    selection = compile_where('state=running or id not in (i-1, i-2)')
+    assert selection.describe_kwargs() == {}
+    assert ids(selection.select(FLEET)) == ['i-1', 'i-2', 'i-3', 'i-4']
+
+
+def test_invalid_expressions():
+    for expression in ('', 'state', 'state = ', 'color = red', '(state = running', 'state in running'):
+        with raises(ccliError):
+            compile_where(expression)
@@ -0,0 +1,80 @@
+import io
+import os
+import threading
+
+from ccli.core import daemon
+from ccli.main import run_forwarded
+
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def start(run_command, path):
+    ready = threading.Event()
+    servers = []
+    thread = threading.Thread(target=lambda: servers.append(
+        daemon.serve(run_command, path, ready)), daemon=True)
+    thread.start()
+    ready.wait(5)
+    return thread
+
+
+def test_forward_falls_back_without_daemon(tmp, monkeypatch):
+    monkeypatch.delenv(daemon.ENV, raising=False)
+    assert daemon.forward(['--version'], os.path.join(tmp.dir, 'none.sock')) is None
+
+    assert daemon.should_forward(['aws', 'ec2', 'status'], stdin=io.StringIO())
+    assert not daemon.should_forward(['aws', 'ec2', 'create'], stdin=Terminal())
+    assert not daemon.should_forward(['daemon'], stdin=io.StringIO())
+
+
+def test_prompting_commands_run_in_process(monkeypatch):
+    monkeypatch.setenv(daemon.ENV, '1')
+
+    assert not daemon.should_forward(['aws', 'ec2', 'create'])
+    assert not daemon.should_forward(['--profile-calls', 'aws', 'ec2', 'templates',
+                                      'create-templates'])
+    assert daemon.should_forward(['aws', 'ec2', 'create', '--template', 'web', '-n', '3'])
+
+    # list and the lifecycle commands ask for an instance without a selection
+    assert not daemon.should_forward(['aws', 'ec2', 'list'])
+    assert not daemon.should_forward(['aws', 'ec2', 'stop'])
+    assert not daemon.should_forward(['--profile-calls', 'aws', 'ec2', 'terminate'])
+    assert daemon.should_forward(['aws', 'ec2', 'list', '--regions', 'all'])
+    assert daemon.should_forward(['aws', 'ec2', 'list', '--where=state=running'])
+    assert daemon.should_forward(['aws', 'ec2', 'stop', '-i', 'i-1'])
+    assert daemon.should_forward(['aws', 'ec2', 'reboot', '--where', 'tag:env=dev'])
+    assert daemon.should_forward(['aws', 'ec2', 'status'])
+
+
+def test_daemon_runs_forwarded_commands(tmp, monkeypatch):
+    monkeypatch.chdir(tmp.dir)
+    path = os.path.join(tmp.dir, 'ccli.sock')
+    start(run_forwarded, path)
+
+    out, err = io.StringIO(), io.StringIO()
+    assert daemon.forward(['--version'], path, out, err) == 0
+    assert 'Manage Public Cloud' in out.getvalue()
+
+    # the daemon survives failing commands and keeps serving
+    assert daemon.forward(['no-such-command'], path, out, err) == 2
+    assert 'invalid choice' in err.getvalue()
+    assert daemon.forward(['--version'], path, io.StringIO(), io.StringIO()) == 0
+
+
+def test_daemon_declines_another_environment(tmp, monkeypatch):
+    monkeypatch.chdir(tmp.dir)
+    monkeypatch.delenv('AWS_PROFILE', raising=False)
+    path = os.path.join(tmp.dir, 'ccli.sock')
+    calls = []
+    start(lambda argv: calls.append(argv) or 0, path)
+
+    env = dict(daemon.command_env(), AWS_PROFILE='other-account')
+    # the caller runs the command itself
+    assert daemon.forward(['aws', 'ec2', 'list'], path, io.StringIO(), io.StringIO(), env) is None
+    assert calls == []
+
+    assert daemon.forward(['aws', 'ec2', 'list'], path, io.StringIO(), io.StringIO()) == 0
+    assert calls == [['aws', 'ec2', 'list']]
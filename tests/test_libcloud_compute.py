@@ -0,0 +1,86 @@
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+from libcloud.compute.drivers.dummy import DummyNodeDriver
+from pytest import raises
+
+from ccli.core.exc import ccliError
+from ccli.Libcloud import compute
+
+PROVIDERS = [
+    {'name': 'east', 'provider': 'dummy', 'key': 2},
+    {'name': 'west', 'provider': 'dummy', 'key': 3},
+]
+
+
+def test_targets_expand_regions_and_driver_arguments():
+    targets = compute.targets([{'provider': 'EC2', 'key': 'id', 'secret': 's',
+                                'regions': ['us-east-1', 'eu-west-1'], 'token': 't'},
+                               {'provider': 'dummy', 'key': 1}])
+
+    assert [(t.name, t.region) for t in targets] == \
+        [('ec2', 'us-east-1'), ('ec2', 'eu-west-1'), ('dummy', None)]
+    assert targets[0].args == ('id', 's')
+    assert targets[0].kwargs == (('token', 't'),)
+
+
+def test_list_merges_normalized_records_of_all_providers():
+    compute.reset()
+    results = list(compute.list_resources('nodes', compute.targets(PROVIDERS)))
+
+    assert all(result.error is None for result in results)
+    nodes = sorted((result.value for result in results), key=lambda node: (node.provider, node.name))
+    assert [(node.provider, node.name, node.state) for node in nodes] == \
+        [('east', 'dummy-0', 'running'), ('east', 'dummy-1', 'running'),
+         ('west', 'dummy-0', 'running'), ('west', 'dummy-1', 'running'),
+         ('west', 'dummy-2', 'running')]
+    assert nodes[0].public_ips == ['127.0.0.1']
+
+    sizes = [result.value for result in compute.list_resources('sizes', compute.targets(PROVIDERS))]
+    assert {size.provider for size in sizes} == {'east', 'west'}
+    assert all(isinstance(size, compute.Size) for size in sizes)
+
+
+def test_providers_are_listed_concurrently_and_failures_isolated(monkeypatch):
+    compute.reset()
+    list_images = DummyNodeDriver.list_images
+
+    def slow(self, **kwargs):
+        time.sleep(0.3)
+        return list_images(self)
+    monkeypatch.setattr(DummyNodeDriver, 'list_images', slow)
+
+    providers = PROVIDERS + [{'name': 'south', 'provider': 'dummy', 'key': 1},
+                             {'name': 'broken', 'provider': 'no-such-cloud', 'key': 1}]
+    started = time.perf_counter()
+    results = list(compute.list_resources('images', compute.targets(providers)))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.6
+    [failed] = [result for result in results if result.error is not None]
+    assert failed.target.name == 'broken'
+    assert {result.value.provider for result in results if result.error is None} == \
+        {'east', 'west', 'south'}
+
+
+def test_ec2_provider_without_credentials_names_the_provider(monkeypatch):
+    from ccli.aws import client
+    from ccli.controllers.compute import compute_providers
+
+    config = {('compute', 'providers'): [{'provider': 'ec2', 'name': 'prod'}],
+              ('aws', 'region'): 'eu-west-1'}
+    app = SimpleNamespace(config=SimpleNamespace(get=lambda *key: config[key]))
+    monkeypatch.setattr(client, 'get_session',
+                        lambda: SimpleNamespace(get_credentials=lambda: None))
+
+    with raises(ccliError, match='prod'):
+        compute_providers(app)
+
+
+def test_compute_listing_does_not_load_the_aws_backend():
+    code = ('import sys, ccli.Libcloud.compute; '
+            'loaded = [m for m in sys.modules if m.startswith(("ccli.aws", "botocore"))]; '
+            'assert not loaded, loaded')
+    subprocess.run([sys.executable, '-c', code], check=True)
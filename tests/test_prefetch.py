@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+from ccli.aws.cache import ResourceCache
+from ccli.core.prefetch import Prefetch
+from tinydb import TinyDB
+
+
+def slow(value, delay=0.2):
+    def load():
+        time.sleep(delay)
+        return value
+    return load
+
+
+def test_lookups_run_at_once_and_resolve_per_question(tmp):
+    cache = ResourceCache(TinyDB('%s/db.json' % tmp.dir))
+    started = time.perf_counter()
+    prefetch = Prefetch({
+        'security_groups': lambda: cache.get('security_groups', slow(
+            [{'GroupName': 'web', 'GroupId': 'sg-1'}])),
+        'subnets': lambda: cache.get('subnets', slow([{'SubnetId': 'subnet-1'}])),
+        'availability_zones': lambda: cache.get('availability_zones', slow(['ap-northeast-2a'])),
+        'key_pairs': lambda: cache.get('key_pairs', slow(['dev'])),
+    })
+    # nothing blocks until a question needs its choices
+    assert time.perf_counter() - started < 0.1
+
+    assert prefetch.choices('security_groups', 'GroupName')({}) == ['web']
+    assert prefetch.choices('subnets', 'SubnetId')({}) == ['subnet-1']
+    assert prefetch.choices('availability_zones')({}) == ['ap-northeast-2a']
+    assert prefetch.get('key_pairs') == ['dev']
+    assert time.perf_counter() - started < 0.4
+
+    # every lookup was stored, none was lost to a concurrent write
+    assert len(cache.table) == 4
+
+
+def test_failed_lookup_raises_when_its_question_is_shown():
+    def broken():
+        raise RuntimeError('no permission')
+
+    prefetch = Prefetch({'key_pairs': broken, 'subnets': lambda: ['subnet-1']})
+    assert prefetch.get('subnets') == ['subnet-1']
+    with pytest.raises(RuntimeError):
+        prefetch.choices('key_pairs')({})
+
+
+def test_skipped_question_does_not_wait_for_its_lookup():
+    def broken():
+        raise RuntimeError('no permission')
+
+    prefetch = Prefetch({'templates': slow(['web'], delay=1), 'key_pairs': broken})
+    started = time.perf_counter()
+    assert prefetch.choices('templates', when=lambda answers: answers['use template'])(
+        {'use template': False}) == []
+    assert prefetch.choices('key_pairs', when=lambda answers: not answers['use template'])(
+        {'use template': True}) == []
+    assert time.perf_counter() - started < 0.1
@@ -0,0 +1,76 @@
+import json
+import os
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+
+from ccli.core import profiler
+
+THROTTLED = (b'<Response><Errors><Error><Code>RequestLimitExceeded</Code>'
+             b'<Message>slow down</Message></Error></Errors><RequestID>1</RequestID></Response>')
+ZONES = (b'<DescribeAvailabilityZonesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">'
+         b'<availabilityZoneInfo><item><zoneName>ap-northeast-2a</zoneName></item>'
+         b'</availabilityZoneInfo></DescribeAvailabilityZonesResponse>')
+
+
+class Raw:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+def test_profiler_records_calls_retries_and_phases(tmp):
+    client = boto3.client('ec2', region_name='ap-northeast-2',
+                          aws_access_key_id='testing', aws_secret_access_key='testing',
+                          config=Config(retries={'mode': 'standard', 'max_attempts': 3}))
+    canned = [(503, THROTTLED), (200, ZONES)]
+
+    def send(request, **kwargs):
+        status, body = canned.pop(0)
+        return AWSResponse(request.url, status, {}, Raw(body))
+    client.meta.events.register('before-send', send)
+
+    p = profiler.enable()
+    try:
+        profiler.attach(client)
+        with profiler.phase('prefetch'):
+            client.describe_availability_zones()
+    finally:
+        profiler.disable()
+
+    [row] = p.summary()
+    assert (row['action'], row['calls'], row['retries'], row['throttles']) == \
+        ('DescribeAvailabilityZones', 1, 1, 1)
+    assert row['received'] == len(THROTTLED) + len(ZONES)
+    assert row['sent'] > 0
+    assert [phase['name'] for phase in p.phases] == ['prefetch']
+
+    path = os.path.join(tmp.dir, 'trace.json')
+    p.chrome_trace(path)
+    with open(path) as fp:
+        events = json.load(fp)['traceEvents']
+    assert {event['cat'] for event in events} == {'api', 'phase'}
+
+
+def test_each_profiled_run_records_its_own_calls():
+    client = boto3.client('ec2', region_name='ap-northeast-2',
+                          aws_access_key_id='testing', aws_secret_access_key='testing')
+    client.meta.events.register(
+        'before-send', lambda request, **kwargs: AWSResponse(request.url, 200, {}, Raw(ZONES)))
+
+    # two --profile-calls commands run by one daemon
+    runs = []
+    for _ in range(2):
+        p = profiler.enable()
+        try:
+            profiler.attach(client)
+            client.describe_availability_zones()
+        finally:
+            profiler.disable()
+        runs.append(p)
+
+    client.describe_availability_zones()
+    assert [len(p.calls) for p in runs] == [1, 1]
@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# seconds importing ccli.main may take, several times what it takes today
+IMPORT_BUDGET = 0.5
+
+# modules only the commands that need them may import
+HEAVY = ('boto3', 'botocore', 'PyInquirer', 'prompt_toolkit', 'libcloud',
+         'ccli.aws.ec2', 'ccli.aws.regions', 'ccli.aws.launch', 'ccli.aws.inventory')
+
+HELP = """
+import json, sys, time
+started = time.perf_counter()
+from ccli.main import main
+imported = time.perf_counter() - started
+sys.argv[1:] = %r
+try:
+    main()
+except SystemExit:
+    pass
+sys.stdout = sys.__stdout__
+print(json.dumps({'import': imported, 'modules': sorted(sys.modules)}))
+"""
+
+
+def run_help(tmp, args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    done = subprocess.run([sys.executable, '-c', HELP % (args,)], cwd=tmp.dir, env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return json.loads(done.stdout.decode().strip().splitlines()[-1])
+
+
+def test_help_stays_within_import_budget(tmp):
+    runs = [run_help(tmp, ['--help']) for _ in range(3)]
+
+    assert min(run['import'] for run in runs) < IMPORT_BUDGET
+    for args in (['--help'], ['aws', 'ec2', '--help']):
+        modules = run_help(tmp, args)['modules']
+        loaded = [m for m in modules if m.split('.')[0] in HEAVY or m in HEAVY]
+        assert loaded == []